@@ -8,12 +8,9 @@ touch tests/vendor/__init__.py
 mkdir -p tests/vendor/geoip
 wget --quiet -O- http://geolite.maxmind.com/download/geoip/database/GeoLite2-Country.mmdb.gz | gunzip > tests/vendor/geoip/GeoLite2-Country.mmdb
 
-# privacyscanner
-git clone https://github.com/PrivacyScore/privacyscanner.git
-pushd privacyscanner
-pip install .
+# privacyscanner (pinned in requirements.txt)
+pip install privacyscanner==0.8.1
 privacyscanner update_dependencies
-popd
 
 # testssl.sh
 git clone https://github.com/drwetter/testssl.sh.git tests/vendor/testssl.sh
@@ -140,7 +140,7 @@ def scan_scan_list(request: Request, scan_list_id: int) -> Response:
         scan_list = ScanList.objects.get(pk=scan_list_id)
 
         # This always succeeds as rate limit check is done per-site
-        scan_list.scan()
+        scan_list.scan(Scan.LANE_LIST)
         return Response({
             'type': 'success',
             'message': 'ok',
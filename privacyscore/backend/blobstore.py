@@ -0,0 +1,184 @@
+"""
+Content-addressed storage for raw scan data.
+
+Blobs are addressed by the SHA-256 digest of their uncompressed content.
+Scan workers put large raw data objects into the blob store directly and
+only return a small reference (digest, size and mime type) as task result,
+which the master then records as RawScanResult. This keeps the size of
+messages passing through the result backend independent of the size of the
+collected artifacts.
+
+The backend is configured with the RAW_DATA_BLOB_STORE setting. If it is
+None, raw data is shipped through the result backend as before.
+"""
+import gzip
+import hashlib
+import os
+import tempfile
+from datetime import datetime
+from typing import Iterator, Union
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class BlobStore:
+    """The interface every blob store backend has to implement."""
+
+    def put(self, data: bytes, mime_type: str) -> str:
+        """Store data and return its digest."""
+        raise NotImplementedError
+
+    def get(self, digest: str) -> bytes:
+        """Retrieve the data of a blob. Raises KeyError if it is unknown."""
+        raise NotImplementedError
+
+    def exists(self, digest: str) -> bool:
+        """Check whether a blob exists."""
+        raise NotImplementedError
+
+    def delete(self, digest: str):
+        """Delete a blob if it exists."""
+        raise NotImplementedError
+
+    def digests(self, older_than: datetime = None) -> Iterator[str]:
+        """
+        Iterate over the digests of all stored blobs, optionally only those
+        last written before older_than.
+        """
+        raise NotImplementedError
+
+
+class FileSystemBlobStore(BlobStore):
+    """
+    Store blobs as files below base_dir, sharded by the first characters of
+    their digest.
+
+    When master and workers run on different hosts, base_dir has to be a
+    shared file system.
+    """
+
+    def __init__(self, base_dir: str, uncompressed_types: list = None):
+        self.base_dir = base_dir
+        if uncompressed_types is None:
+            uncompressed_types = settings.RAW_DATA_UNCOMPRESSED_TYPES
+        self.uncompressed_types = set(uncompressed_types)
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.base_dir, digest[:2], digest[2:4], digest)
+
+    def _existing_path(self, digest: str) -> Union[str, None]:
+        path = self._path(digest)
+        for candidate in (path, path + '.gz'):
+            if os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def put(self, data: bytes, mime_type: str) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        existing_path = self._existing_path(digest)
+        if existing_path:
+            # content-addressed -- identical data is already stored. The
+            # new reference is not recorded yet, so the grace period of the
+            # garbage collection (see rawdatagc) is restarted.
+            try:
+                os.utime(existing_path)
+                return digest
+            except FileNotFoundError:
+                # collected in the meantime
+                pass
+
+        path = self._path(digest)
+        compress = mime_type not in self.uncompressed_types
+        if compress:
+            path += '.gz'
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+
+        # write to a temporary file first so that readers never see partial
+        # blobs
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if compress:
+                    with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+                        gz.write(data)
+                else:
+                    f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        path = self._existing_path(digest)
+        if path is None:
+            raise KeyError(digest)
+        if path.endswith('.gz'):
+            with gzip.open(path, 'rb') as f:
+                return f.read()
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def exists(self, digest: str) -> bool:
+        return self._existing_path(digest) is not None
+
+    def delete(self, digest: str):
+        path = self._existing_path(digest)
+        if path is not None:
+            os.remove(path)
+
+    def digests(self, older_than: datetime = None) -> Iterator[str]:
+        threshold = older_than.timestamp() if older_than else None
+        for directory, _dirs, files in os.walk(self.base_dir):
+            for file in files:
+                if file.startswith('.tmp-'):
+                    continue
+                if (threshold is not None and
+                        os.path.getmtime(os.path.join(directory, file)) >= threshold):
+                    continue
+                if file.endswith('.gz'):
+                    file = file[:-3]
+                yield file
+
+
+_blob_store = None
+
+
+def get_blob_store() -> Union[BlobStore, None]:
+    """Get the configured blob store or None if it is disabled."""
+    global _blob_store
+    config = settings.RAW_DATA_BLOB_STORE
+    if config is None:
+        return None
+    if _blob_store is None:
+        backend = import_string(config['BACKEND'])
+        _blob_store = backend(**config.get('OPTIONS', {}))
+    return _blob_store
+
+
+def offload_raw_data(raw_data: dict) -> dict:
+    """
+    Replace the data of large raw data objects returned by a test suite
+    by a reference into the blob store.
+
+    Objects not larger than RAW_DATA_DB_MAX_SIZE are kept inline as they are
+    stored in the database anyway.
+    """
+    blob_store = get_blob_store()
+    if blob_store is None or not isinstance(raw_data, dict):
+        return raw_data
+    offloaded = {}
+    for identifier, raw_elem in raw_data.items():
+        data = raw_elem.get('data')
+        if data is None or len(data) <= settings.RAW_DATA_DB_MAX_SIZE:
+            offloaded[identifier] = raw_elem
+            continue
+        offloaded[identifier] = {
+            'mime_type': raw_elem['mime_type'],
+            'digest': blob_store.put(data, raw_elem['mime_type']),
+            'size': len(data),
+        }
+    return offloaded
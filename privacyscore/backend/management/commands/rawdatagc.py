@@ -14,14 +14,21 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os
 import sys
+from datetime import timedelta
 
 from django.conf import settings
 from django.core.management import BaseCommand
 from django.utils import timezone
 
+from privacyscore.backend.blobstore import get_blob_store
 from privacyscore.backend.models import RawScanResult
 
 
+# Blobs are written by the workers before the master records them.
+# Unreferenced blobs younger than this are kept.
+BLOB_GRACE_PERIOD = timedelta(hours=1)
+
+
 class Command(BaseCommand):
     help = 'Cleans up old raw data and removes raw data from filesystem not known to db.'
 
@@ -39,6 +46,9 @@ class Command(BaseCommand):
 
         deleted = 0
         for file in os.listdir(settings.RAW_DATA_DIR):
+            if os.path.isdir(os.path.join(settings.RAW_DATA_DIR, file)):
+                # i.e. the blob store
+                continue
             if file not in known_files:
                 os.remove(os.path.join(
                     settings.RAW_DATA_DIR, file))
@@ -54,3 +64,26 @@ class Command(BaseCommand):
                 to_delete.append(elem['id'])
         deleted = RawScanResult.objects.filter(id__in=to_delete).delete()[0]
         print('Deleted {} db entries unknown in filesystem.'.format(deleted))
+
+        blob_store = get_blob_store()
+        if blob_store is None:
+            return
+
+        # find blobs unknown to db
+        known_digests = set(RawScanResult.objects.filter(
+            digest__isnull=False).values_list('digest', flat=True))
+        deleted = 0
+        for digest in blob_store.digests(
+                older_than=timezone.now() - BLOB_GRACE_PERIOD):
+            if digest not in known_digests:
+                blob_store.delete(digest)
+                deleted += 1
+        print('Deleted {} blobs from blob store'.format(deleted))
+
+        # find blob references unknown to blob store
+        to_delete = [
+            elem['id'] for elem in RawScanResult.objects.filter(
+                digest__isnull=False).values('id', 'digest')
+            if not blob_store.exists(elem['digest'])]
+        deleted = RawScanResult.objects.filter(id__in=to_delete).delete()[0]
+        print('Deleted {} db entries unknown in blob store.'.format(deleted))
@@ -0,0 +1,42 @@
+# Copyright (C) 2018 PrivacyScore Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from django.core.management import BaseCommand
+from django.db.models import F, Q
+
+from privacyscore.backend.models import ScanResult
+from privacyscore.evaluation.evaluation import CHECKS_VERSION
+from privacyscore.evaluation.models import ScanEvaluation
+
+
+class Command(BaseCommand):
+    help = 'Store the evaluations of scan results which are missing or outdated after a change of the checks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-a', '--all', action='store_true',
+            help='Evaluate the results of all scans, not only the most recent scan of each site.')
+
+    def handle(self, *args, **options):
+        results = ScanResult.objects.filter(
+            Q(scan__evaluation__isnull=True) |
+            ~Q(scan__evaluation__checks_version=CHECKS_VERSION))
+        if not options['all']:
+            results = results.filter(scan__site__last_scan=F('scan'))
+
+        count = 0
+        for result in results.select_related('scan').iterator():
+            ScanEvaluation.store(result.scan, result.result)
+            count += 1
+        self.stdout.write('Evaluated {} scan results'.format(count))
@@ -13,12 +13,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os
-from time import sleep
 
 from django.core.management import BaseCommand
 from django.utils import timezone
 
-from privacyscore.backend.models import Site, ScanList
+from privacyscore.backend.models import Scan, Site, ScanList
 from privacyscore.utils import normalize_url
 
 
@@ -27,15 +26,16 @@ class Command(BaseCommand):
 
     def add_arguments(self, parser):
         parser.add_argument('scan_list_id')
-        parser.add_argument('-s', '--sleep-between-scans', type=float, default=0)
 
     def handle(self, *args, **options):
         scan_list = ScanList.objects.get(id=options['scan_list_id'])
-        sites = scan_list.sites.all()
+        sites = list(scan_list.sites.all())
+
+        status_codes = Site.bulk_scan(sites, Scan.LANE_BACKGROUND)
 
         scan_count = 0
         for site in sites:
-            status_code = site.scan()
+            status_code = status_codes[site.pk]
             if status_code == Site.SCAN_COOLDOWN:
                 self.stdout.write(
                     'Rate limiting -- Not scanning site {}'.format(site))
@@ -47,9 +47,6 @@ class Command(BaseCommand):
             scan_count += 1
             self.stdout.write('Scanning site {}'.format(
                 site))
-            if options['sleep_between_scans']:
-                self.stdout.write('Sleeping {}'.format(options['sleep_between_scans']))
-                sleep(options['sleep_between_scans'])
 
         self.stdout.write('read {} sites, scanned {}'.format(
             len(sites), scan_count))
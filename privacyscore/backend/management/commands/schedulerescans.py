@@ -14,24 +14,15 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from time import sleep
 
-import sys
-
 from django.conf import settings
 from django.core.management import BaseCommand
 
 from privacyscore.backend.models import Site
-
-
-# increased max_tries from in schedulerescans from 5 to 50 because
-# we had 5 blacklisted sites and the scheduler was not willing to
-# scan any more sites
-# TODO: find better solution that is independent of number of
-# blacklisted sites
-MAX_TRIES = 50
+from privacyscore.scanner.rescans import schedule_due_rescans
 
 
 class Command(BaseCommand):
-    help = 'Schedules a new scan every minute.'
+    help = 'Schedules rescans of due sites every minute.'
 
     def add_arguments(self, parser):
         parser.add_argument('--oneshot',
@@ -41,32 +32,20 @@ class Command(BaseCommand):
                             help='Do not run as daemon')
 
     def handle(self, *args, **options):
-        """Schedules a new scan regularly."""
+        """Schedules rescans of due sites regularly."""
         while True:
-            sites = Site.objects.annotate_most_recent_scan_start() \
-                .annotate_most_recent_scan_end_or_null().filter(
-                last_scan__end_or_null__isnull=False).order_by(
-                'last_scan__end')
-            sites = list(sites[:MAX_TRIES])
-            
-            # Try several times to find a scannable site
-            for i in range(min(MAX_TRIES, len(sites))):
-                site = sites.pop()
-                
-                status_code = site.scan()
+            sites = schedule_due_rescans()
+            for site in sites.get(Site.SCAN_OK, []):
+                self.stdout.write('Scheduled scan of {}'.format(str(site)))
+            for status_code, status_sites in sites.items():
                 if status_code == Site.SCAN_OK:
-                    self.stdout.write('Scheduled scan of {}'.format(str(site)))
-                    self.stdout.flush()
-                    break
-                else:
+                    continue
+                for site in status_sites:
                     self.stdout.write('Not scheduling scan of {} -- Reason: {}'.format(str(site), str(status_code)))
-                    self.stdout.flush()
-                    sleep(0.5)
-            
             self.stdout.flush()
-            
+
             if options['oneshot']:
                 print('Oneshot mode enabled.')
                 break
-            # Wait before queueing the next site
+            # Wait before queueing the next sites
             sleep(settings.SCAN_SCHEDULE_DAEMON_SLEEP)
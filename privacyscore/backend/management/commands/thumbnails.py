@@ -0,0 +1,48 @@
+# Copyright (C) 2018 PrivacyScore Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+from django.core.management import BaseCommand
+
+from privacyscore.backend import thumbnails
+from privacyscore.backend.models import RawScanResult
+from privacyscore.scanner.tasks import create_thumbnail
+
+
+class Command(BaseCommand):
+    help = 'Create the missing thumbnails of screenshots or regenerate all of them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '-a', '--all', action='store_true',
+            help='Regenerate existing thumbnails as well.')
+        parser.add_argument(
+            '-l', '--local', action='store_true',
+            help='Create the thumbnails in this process instead of the thumbnail queue.')
+
+    def handle(self, *args, **options):
+        screenshots = RawScanResult.objects.filter(
+            identifier=thumbnails.SCREENSHOT_IDENTIFIER)
+        if not options['all']:
+            screenshots = screenshots.exclude(
+                scan__raw_results__identifier=thumbnails.THUMBNAIL_IDENTIFIER)
+
+        count = 0
+        for pk in screenshots.values_list('pk', flat=True).iterator():
+            if options['local']:
+                create_thumbnail(pk)
+            else:
+                create_thumbnail.delay(pk)
+            count += 1
+        self.stdout.write('{} {} thumbnails'.format(
+            'Created' if options['local'] else 'Scheduled', count))
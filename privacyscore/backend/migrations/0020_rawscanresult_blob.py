@@ -0,0 +1,23 @@
+# Generated by Django 2.1.15 on 2026-10-18 03:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0019_blacklistentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='rawscanresult',
+            name='digest',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='rawscanresult',
+            name='size',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
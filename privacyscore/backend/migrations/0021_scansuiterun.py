@@ -0,0 +1,32 @@
+# Generated by Django 2.1.15 on 2026-10-18 03:08
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0020_rawscanresult_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanSuiteRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('test', models.CharField(max_length=80)),
+                ('scan_host', models.CharField(blank=True, max_length=80, null=True)),
+                ('start', models.DateTimeField(default=django.utils.timezone.now)),
+                ('end', models.DateTimeField(blank=True, null=True)),
+                ('result', django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True)),
+                ('scan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='suite_runs', to='backend.Scan')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='scansuiterun',
+            unique_together={('scan', 'test')},
+        ),
+    ]
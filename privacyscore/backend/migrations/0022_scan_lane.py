@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-18 03:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0021_scansuiterun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scan',
+            name='lane',
+            field=models.CharField(choices=[('interactive', 'Interactive scan'), ('list', 'List scan'), ('background', 'Background refresh')], default='interactive', max_length=20),
+        ),
+    ]
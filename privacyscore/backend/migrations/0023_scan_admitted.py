@@ -0,0 +1,18 @@
+# Generated by Django 2.1.15 on 2026-10-18 03:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0022_scan_lane'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scan',
+            name='admitted',
+            field=models.BooleanField(db_index=True, default=True),
+        ),
+    ]
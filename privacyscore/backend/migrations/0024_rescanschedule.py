@@ -0,0 +1,30 @@
+# Generated by Django 2.1.15 on 2026-10-18 03:38
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0023_scan_admitted'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RescanSchedule',
+            fields=[
+                ('site', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rescan_schedule', serialize=False, to='backend.Site')),
+                ('next_due', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        # the sites which have not been scanned for the longest time are due
+        # first
+        migrations.RunSQL('''
+        INSERT INTO backend_rescanschedule (site_id, next_due)
+        SELECT backend_site.id, COALESCE(backend_scan."end", backend_site.created)
+        FROM backend_site
+        LEFT JOIN backend_scan ON backend_scan.id = backend_site.last_scan_id;
+        ''', migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 2.1.15 on 2026-10-18 03:42
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+from privacyscore.publicsuffix import extract
+
+
+def get_registered_domain(url):
+    extract_url = extract(url)
+    return '.'.join(
+        part for part in (extract_url.domain, extract_url.suffix) if part)
+
+
+def populate_registered_domains(apps, schema_editor):
+    for model_name in ('BlacklistEntry', 'Site'):
+        model = apps.get_model('backend', model_name)
+        pks = defaultdict(list)
+        for pk, url in model.objects.values_list('pk', 'url').iterator():
+            pks[get_registered_domain(url)].append(pk)
+        for registered_domain, domain_pks in pks.items():
+            for i in range(0, len(domain_pks), 1000):
+                model.objects.filter(pk__in=domain_pks[i:i + 1000]).update(
+                    registered_domain=registered_domain)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0024_rescanschedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blacklistentry',
+            name='registered_domain',
+            field=models.CharField(blank=True, max_length=500),
+        ),
+        migrations.AddField(
+            model_name='site',
+            name='registered_domain',
+            field=models.CharField(blank=True, db_index=True, max_length=500),
+        ),
+        migrations.RunPython(
+            populate_registered_domains, migrations.RunPython.noop),
+    ]
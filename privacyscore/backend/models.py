@@ -4,19 +4,23 @@ import random
 import string
 from collections import OrderedDict
 from datetime import datetime
-from tldextract import extract
-from typing import Iterable, Tuple, Union
+from typing import Dict, Iterable, Tuple, Union
 from uuid import uuid4
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.contrib.postgres import fields as postgres_fields
+from django.core.cache import cache
 from django.db import models, transaction
-from django.db.models import Count, Prefetch, QuerySet
+from django.db.models import Count, Prefetch, Q, QuerySet
 from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.functional import cached_property
 
+from privacyscore.backend.blobstore import get_blob_store
+from privacyscore.publicsuffix import extract
 from privacyscore.evaluation.site_evaluation import SiteEvaluation
 
 
@@ -154,14 +158,12 @@ class ScanList(models.Model):
                 tag_object = ListTag.objects.get_or_create(name=tag)[0]
                 tag_object.scan_lists.add(self)
 
-    def scan(self):
+    def scan(self, lane: str = None):
         """Schedule a scan of the list if requirements are fulfilled."""
 
-        res = False
-        for site in self.sites.all():
-            if site.scan() == Site.SCAN_OK:
-                res = True
-        
+        status_codes = Site.bulk_scan(self.sites.all(), lane or Scan.LANE_LIST)
+        res = Site.SCAN_OK in status_codes.values()
+
         if self.editable:
             self.editable = False
             self.save(update_fields=('editable',))
@@ -251,10 +253,16 @@ class BlacklistEntry(models.Model):
                                   default=TYPE_DOMAIN)
     # Who is the responsible contact at the website?
     contact = models.CharField(max_length=500, blank=True, null=True)
+    # The registered domain of url, see get_registered_domain
+    registered_domain = models.CharField(max_length=500, blank=True)
 
     def __str__(self) -> str:
         return self.url
 
+    def save(self, *args, **kwargs):
+        self.registered_domain = get_registered_domain(self.url)
+        super().save(*args, **kwargs)
+
     def as_dict(self) -> dict:
         return {
             'id': self.pk,
@@ -279,10 +287,96 @@ class BlacklistEntry(models.Model):
         else:
             assert False, "Unknown BlacklistEntry match_type"
 
+    @staticmethod
+    def get_index() -> 'BlacklistIndex':
+        """
+        Get an index of all blacklist entries. The index is cached per process
+        until the entries change.
+        """
+        global _blacklist_index
+        version = cache.get(BLACKLIST_VERSION_KEY)
+        if version is None:
+            cache.add(BLACKLIST_VERSION_KEY, uuid4().hex, None)
+            version = cache.get(BLACKLIST_VERSION_KEY)
+        index_version, index = _blacklist_index
+        if index is None or version is None or version != index_version:
+            index = BlacklistIndex(BlacklistEntry.objects.values_list(
+                'url', 'match_type', 'registered_domain'))
+            _blacklist_index = (version, index)
+        return index
+
+
+# The cache key of the version of the blacklist entries
+BLACKLIST_VERSION_KEY = 'blacklist:version'
+
+# The blacklist index of this process and the version it has been built for
+_blacklist_index = (None, None)
+
+
+@receiver(post_save, sender=BlacklistEntry)
+@receiver(post_delete, sender=BlacklistEntry)
+def invalidate_blacklist_index(sender, **kwargs):
+    """Let all processes rebuild their blacklist index."""
+    global _blacklist_index
+    _blacklist_index = (None, None)
+    # other processes must not rebuild the index before the change is visible
+    transaction.on_commit(
+        lambda: cache.set(BLACKLIST_VERSION_KEY, uuid4().hex, None))
+
+
+def get_registered_domain(url: str) -> str:
+    """
+    Get the registered domain of a url, e.g. example.co.uk. Hosts without a
+    public suffix, e.g. ip addresses, are their own registered domain.
+    """
+    extract_url = extract(url)
+    return '.'.join(
+        part for part in (extract_url.domain, extract_url.suffix) if part)
+
+
+class BlacklistIndex:
+    """
+    The blacklist entries hashed by their registered domain and, for entries
+    of single subdomains, the subdomain, so matching a url does not depend on
+    the number of entries.
+    """
+
+    def __init__(self, entries: Iterable[Tuple[str, str, str]]):
+        self.domains = set()
+        self.subdomains = {}
+        for url, match_type, registered_domain in entries:
+            if match_type == BlacklistEntry.TYPE_DOMAIN:
+                self.domains.add(registered_domain)
+            elif match_type == BlacklistEntry.TYPE_SUBDOMAIN:
+                self.subdomains.setdefault(registered_domain, set()).add(
+                    extract(url).subdomain)
+            else:
+                assert False, "Unknown BlacklistEntry match_type"
+
+    def match(self, target_url: str,
+              registered_domain: str = None) -> bool:
+        """
+        Check whether any blacklist entry matches a url. The stored registered
+        domain of a site saves parsing urls which do not match.
+        """
+        if registered_domain is None:
+            registered_domain = get_registered_domain(target_url)
+        if registered_domain in self.domains:
+            return True
+        subdomains = self.subdomains.get(registered_domain)
+        return bool(subdomains) and extract(target_url).subdomain in subdomains
+
+    def match_site(self, site: 'Site') -> bool:
+        """Check whether any blacklist entry matches a site."""
+        return self.match(site.url, site.registered_domain)
+
 
 class Site(models.Model):
     """A site."""
     url = models.CharField(max_length=500, unique=True)
+    # The registered domain of url, see get_registered_domain
+    registered_domain = models.CharField(
+        max_length=500, blank=True, db_index=True)
     scan_lists = models.ManyToManyField(ScanList, related_name='sites', blank=True)
 
     views = models.IntegerField(default=0)
@@ -305,6 +399,10 @@ class Site(models.Model):
     def __str__(self) -> str:
         return self.url
 
+    def save(self, *args, **kwargs):
+        self.registered_domain = get_registered_domain(self.url)
+        super().save(*args, **kwargs)
+
     def as_dict(self) -> dict:
         """Return the current list as dict."""
         return {
@@ -314,23 +412,32 @@ class Site(models.Model):
                 v.value for v in self.column_values.order_by('column__sort_key')],
         }
 
-    def get_screenshot(self) -> Union[bytes, None]:
-        """Get the most recent screenshot of this site."""
+    def get_screenshot_result(self) -> Union['RawScanResult', None]:
+        """Get the raw scan result of the most recent screenshot."""
         screenshots = RawScanResult.objects.filter(
             scan__site=self, identifier='cropped_screenshot').order_by(
             'scan__end')
-        screenshot = screenshots.last()
+        return screenshots.last()
+
+    def get_screenshot(self) -> Union[bytes, None]:
+        """Get the most recent screenshot of this site."""
+        screenshot = self.get_screenshot_result()
         if screenshot:
             return screenshot.retrieve()
 
     def has_screenshot(self) -> bool:
         """Check whether a screenshot for this site exists."""
-        return self.get_screenshot() is not None
+        return self.get_screenshot_result() is not None
 
-    def scan(self) -> int:
+    def scan(self, lane: str = None, admit: bool = True) -> int:
         """
         Schedule a scan of this site if requirements are fulfilled.
 
+        The scan is scheduled in the given priority lane (see Scan.LANES),
+        interactive by default. Scans in other lanes wait for admission (see
+        privacyscore.scanner.admission). Pass admit=False when scheduling
+        many scans and call admit_scans afterwards.
+
         Returns a status code from the list SCAN_OK, SCAN_COOLDOWN,
         SCAN_BLACKLISTED.
         """
@@ -340,10 +447,17 @@ class Site(models.Model):
             return scan_status
 
         # create Scan
-        scan = Scan.objects.create(site=self)
-
-        from privacyscore.scanner.tasks import schedule_scan
-        schedule_scan.delay(scan.pk)
+        lane = lane or Scan.LANE_INTERACTIVE
+        scan = Scan.objects.create(
+            site=self, lane=lane, admitted=lane == Scan.LANE_INTERACTIVE)
+
+        from privacyscore.scanner.priorities import get_message_priority
+        from privacyscore.scanner.tasks import admit_scans, schedule_scan
+        if scan.admitted:
+            schedule_scan.apply_async(
+                (scan.pk,), priority=get_message_priority(scan))
+        elif admit:
+            admit_scans.delay()
 
         return Site.SCAN_OK
 
@@ -362,12 +476,62 @@ class Site(models.Model):
                 (not self.last_scan__end_or_null and self.last_scan__start)):
             return Site.SCAN_COOLDOWN
 
-        for entry in BlacklistEntry.objects.all():
-            if entry.match(self.url):
-                return Site.SCAN_BLACKLISTED
+        if BlacklistEntry.get_index().match_site(self):
+            return Site.SCAN_BLACKLISTED
 
         return Site.SCAN_OK
 
+    @staticmethod
+    def bulk_scannable(sites: Iterable['Site']) -> Dict[int, int]:
+        """
+        Check whether many sites are scannable in a constant number of
+        queries. Returns a status code (see scannable) by the pk of each site.
+        """
+        sites = list(sites)
+        cooldown_start = timezone.now() - settings.SCAN_REQUIRED_TIME_BEFORE_NEXT_SCAN
+        # sites with a running or recent scan
+        cooldown = set(Scan.objects.filter(
+            Q(end__isnull=True) | Q(end__gt=cooldown_start),
+            site_id__in=[site.pk for site in sites]).values_list(
+            'site_id', flat=True))
+        blacklist = BlacklistEntry.get_index()
+
+        status_codes = {}
+        for site in sites:
+            if site.pk in cooldown:
+                status_codes[site.pk] = Site.SCAN_COOLDOWN
+            elif blacklist.match_site(site):
+                status_codes[site.pk] = Site.SCAN_BLACKLISTED
+            else:
+                status_codes[site.pk] = Site.SCAN_OK
+        return status_codes
+
+    @staticmethod
+    def bulk_scan(sites: Iterable['Site'], lane: str,
+                  admit: bool = True) -> Dict[int, int]:
+        """
+        Schedule scans of many sites if requirements are fulfilled in a
+        constant number of queries.
+
+        The scans wait for admission (see Site.scan), so lane may not be the
+        interactive lane. Returns a status code (see scan) by the pk of each
+        site.
+        """
+        if lane == Scan.LANE_INTERACTIVE:
+            raise ValueError('Interactive scans are not admitted in bulk.')
+        sites = {site.pk: site for site in sites}
+        status_codes = Site.bulk_scannable(sites.values())
+
+        Scan.objects.bulk_create(
+            Scan(site=site, lane=lane, admitted=False)
+            for pk, site in sites.items()
+            if status_codes[pk] == Site.SCAN_OK)
+
+        if admit and Site.SCAN_OK in status_codes.values():
+            from privacyscore.scanner.tasks import admit_scans
+            admit_scans.delay()
+        return status_codes
+
     def evaluate(self, group_order: list) -> SiteEvaluation:
         """Evaluate the result of the last scan."""
         if not self.last_scan__result:
@@ -377,6 +541,22 @@ class Site(models.Model):
         return evaluate_result(self.last_scan__result, group_order)
 
 
+class RescanSchedule(models.Model):
+    """
+    The time a site is due for its next periodic rescan.
+
+    Sites are rescanned in the order of next_due, see
+    privacyscore.scanner.rescans.
+    """
+    site = models.OneToOneField(
+        Site, on_delete=models.CASCADE, primary_key=True,
+        related_name='rescan_schedule')
+    next_due = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self) -> str:
+        return '{}: {}'.format(str(self.site), self.next_due)
+
+
 class ListTagQuerySet(models.QuerySet):
     def annotate_scan_lists__count(self) -> 'ListTagQuerySet':
         return self.annotate(scan_lists__count=Count('scan_lists'))
@@ -427,8 +607,10 @@ class Scan(models.Model):
     """
     A scan of a site belonging.
 
-    The state is implicitly stored using start, end, ScanResult and ScanError:
-    * If start is set, end is null and no ScanResult exists, the scan is
+    The state is implicitly stored using admitted, start, end, ScanResult and
+    ScanError:
+    * If admitted is not set, the scan is **waiting** for admission
+    * If admitted is set, end is null and no ScanResult exists, the scan is
       **running**
     * If start is set, end is set, a ScanResult exists and no ScanError
       exists, the scan has been **successful**
@@ -436,12 +618,27 @@ class Scan(models.Model):
       ScanError exists, the scan has (partially) **failed**
     * If start is set, end is set and no ScanResult exists, the scan has
       been **aborted**
+
+    The lane determines the priority of the tasks of the scan (see
+    privacyscore.scanner.priorities).
     """
+    LANE_INTERACTIVE = 'interactive'
+    LANE_LIST = 'list'
+    LANE_BACKGROUND = 'background'
+    LANES = (
+        (LANE_INTERACTIVE, 'Interactive scan'),
+        (LANE_LIST, 'List scan'),
+        (LANE_BACKGROUND, 'Background refresh'),
+    )
+
     site = models.ForeignKey(
         Site, on_delete=models.CASCADE, related_name='scans')
 
     start = models.DateTimeField(default=timezone.now, db_index=True)
     end = models.DateTimeField(null=True, blank=True, db_index=True)
+    lane = models.CharField(
+        max_length=20, choices=LANES, default=LANE_INTERACTIVE)
+    admitted = models.BooleanField(default=True, db_index=True)
 
     def __str__(self) -> str:
         return '{}: {}'.format(str(self.site), self.start)
@@ -466,6 +663,10 @@ class RawScanResult(models.Model):
     mime_type = models.CharField(max_length=80)
     file_name = models.CharField(max_length=80, null=True, blank=True)
     data = models.BinaryField(null=True, blank=True)
+    # reference into the blob store
+    digest = models.CharField(
+        max_length=64, null=True, blank=True, db_index=True)
+    size = models.PositiveIntegerField(null=True, blank=True)
 
     def get_data_as_string(self):
         return bytes(self.retrieve()).decode()
@@ -475,13 +676,32 @@ class RawScanResult(models.Model):
 
     @property
     def in_db(self) -> bool:
-        return self.file_name is None
+        return self.file_name is None and self.digest is None
+
+    @property
+    def in_blob_store(self) -> bool:
+        return self.digest is not None
 
     @staticmethod
-    def store_raw_data(data: bytes, mime_type: str, scan_host: str, test: str,
-                       identifier: str, scan_pk: int):
-        """Store data in db or filesystem."""
-        if len(data) > settings.RAW_DATA_DB_MAX_SIZE:
+    def store_raw_data(mime_type: str, scan_host: str, test: str,
+                       identifier: str, scan_pk: int, data: bytes = None,
+                       digest: str = None, size: int = None) -> 'RawScanResult':
+        """
+        Store data in db or filesystem.
+
+        If the data has already been put into the blob store by the worker,
+        only the reference (digest and size) is recorded.
+        """
+        if digest is not None:
+            return RawScanResult.objects.create(
+                scan_id=scan_pk,
+                scan_host=scan_host,
+                test=test,
+                identifier=identifier,
+                mime_type=mime_type,
+                digest=digest,
+                size=size)
+        elif len(data) > settings.RAW_DATA_DB_MAX_SIZE:
             # store in filesystem
 
             # TODO: ensure uniqueness
@@ -498,7 +718,7 @@ class RawScanResult(models.Model):
                 with gzip.open(path, 'wb') as f:
                     f.write(data)
 
-            RawScanResult.objects.create(
+            return RawScanResult.objects.create(
                 scan_id=scan_pk,
                 scan_host=scan_host,
                 test=test,
@@ -506,7 +726,7 @@ class RawScanResult(models.Model):
                 mime_type=mime_type,
                 file_name=file_name)
         else:
-            RawScanResult.objects.create(
+            return RawScanResult.objects.create(
                 scan_id=scan_pk,
                 scan_host=scan_host,
                 test=test,
@@ -520,6 +740,8 @@ class RawScanResult(models.Model):
             if isinstance(self.data, memoryview):
                 return self.data.tobytes()
             return self.data
+        if self.in_blob_store:
+            return get_blob_store().get(self.digest)
         path = os.path.join(settings.RAW_DATA_DIR, self.file_name)
         if path.endswith('.gz'):
             with gzip.open(path, 'rb') as f:
@@ -555,3 +777,30 @@ class ScanError(models.Model):
 
     def __str__(self) -> str:
         return '{}, {}: {}'.format(str(self.scan), self.test, self.error)
+
+
+class ScanSuiteRun(models.Model):
+    """
+    The run of a single test suite within a scan.
+
+    A run is created when the test suite is dispatched. It is finished (end is
+    set) once the master has received its result. The processed result is
+    kept to supply it to the test suites depending on it.
+    """
+    class Meta:
+        unique_together = (
+            ('scan', 'test'),
+        )
+
+    scan = models.ForeignKey(
+        Scan, on_delete=models.CASCADE, related_name='suite_runs')
+    test = models.CharField(max_length=80)
+    scan_host = models.CharField(max_length=80, null=True, blank=True)
+
+    start = models.DateTimeField(default=timezone.now)
+    end = models.DateTimeField(null=True, blank=True)
+
+    result = postgres_fields.JSONField(null=True, blank=True)
+
+    def __str__(self) -> str:
+        return '{}: {}'.format(str(self.scan), self.test)
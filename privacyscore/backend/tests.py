@@ -1,3 +1,201 @@
-from django.test import TestCase
+import hashlib
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import BytesIO
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+
+from privacyscore import publicsuffix
+from privacyscore.backend import blobstore, thumbnails
+from privacyscore.backend.blobstore import FileSystemBlobStore, offload_raw_data
+from privacyscore.backend.models import BlacklistEntry, RawScanResult, Scan, Site
+
+
+class FileSystemBlobStoreTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.store = FileSystemBlobStore(
+            self.temp_dir.name, uncompressed_types=['image/png'])
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_roundtrip(self):
+        data = b'{"foo": 42}' * 1000
+        digest = self.store.put(data, 'application/json')
+        self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+        self.assertTrue(self.store.exists(digest))
+        self.assertEqual(self.store.get(digest), data)
+
+    def test_compression(self):
+        data = b'a' * 100000
+        compressed = self.store.put(data, 'text/plain')
+        uncompressed = self.store.put(data + b'b', 'image/png')
+        self.assertTrue(os.path.isfile(self.store._path(compressed) + '.gz'))
+        self.assertTrue(os.path.isfile(self.store._path(uncompressed)))
+        self.assertEqual(self.store.get(compressed), data)
+        self.assertEqual(self.store.get(uncompressed), data + b'b')
+
+    def test_deduplication(self):
+        first = self.store.put(b'foobar', 'text/plain')
+        second = self.store.put(b'foobar', 'text/plain')
+        self.assertEqual(first, second)
+        self.assertEqual(list(self.store.digests()), [first])
+
+    def test_deduplication_refreshes_mtime(self):
+        digest = self.store.put(b'foobar', 'text/plain')
+        old = time.time() - 7200
+        os.utime(self.store._existing_path(digest), (old, old))
+        self.store.put(b'foobar', 'text/plain')
+        # the blob is not collected right before it is referenced
+        self.assertEqual(
+            list(self.store.digests(timezone.now() - timedelta(hours=1))), [])
+
+    def test_delete(self):
+        digest = self.store.put(b'foobar', 'text/plain')
+        self.store.delete(digest)
+        self.assertFalse(self.store.exists(digest))
+        self.assertRaises(KeyError, self.store.get, digest)
+        # deleting an unknown blob is a no-op
+        self.store.delete(digest)
+
+    def test_digests_older_than(self):
+        digest = self.store.put(b'foobar', 'text/plain')
+        self.assertEqual(
+            list(self.store.digests(timezone.now() - timedelta(hours=1))), [])
+        self.assertEqual(
+            list(self.store.digests(timezone.now() + timedelta(hours=1))),
+            [digest])
+
+    def test_offload_raw_data(self):
+        with override_settings(RAW_DATA_DB_MAX_SIZE=10):
+            blobstore._blob_store = self.store
+            try:
+                offloaded = offload_raw_data({
+                    'small': {'mime_type': 'text/plain', 'data': b'foo'},
+                    'large': {'mime_type': 'text/plain', 'data': b'x' * 20},
+                })
+            finally:
+                blobstore._blob_store = None
+        self.assertEqual(offloaded['small'], {
+            'mime_type': 'text/plain', 'data': b'foo'})
+        self.assertEqual(offloaded['large'], {
+            'mime_type': 'text/plain',
+            'digest': hashlib.sha256(b'x' * 20).hexdigest(),
+            'size': 20,
+        })
+        self.assertEqual(
+            self.store.get(offloaded['large']['digest']), b'x' * 20)
+
+
+@override_settings(
+    RAW_DATA_BLOB_STORE=None, RAW_DATA_DB_MAX_SIZE=10 ** 6,
+    SCREENSHOT_THUMBNAIL={'format': 'png', 'target_width': 390, 'pixelsize': 3})
+class ThumbnailTestCase(TestCase):
+    def setUp(self):
+        image = Image.new('RGB', (1920, 4000), (200, 10, 10))
+        out = BytesIO()
+        image.save(out, format='png')
+        site = Site.objects.create(url='http://example.com/')
+        self.scan = Scan.objects.create(site=site)
+        self.screenshot = RawScanResult.store_raw_data(
+            mime_type='image/png', scan_host='host', test='openwpm',
+            identifier='screenshot', scan_pk=self.scan.pk, data=out.getvalue())
+
+    def test_pixelize_screenshot(self):
+        for format in ('png', 'webp'):
+            data = thumbnails.pixelize_screenshot(
+                BytesIO(self.screenshot.retrieve()), format=format)
+            image = Image.open(BytesIO(data))
+            self.assertEqual(image.format, format.upper())
+            # cropped to a square
+            self.assertEqual(image.size, (390, 390))
+
+    def test_create_thumbnail(self):
+        thumbnails.create_thumbnail(self.screenshot)
+        thumbnail = thumbnails.create_thumbnail(self.screenshot)
+        self.assertEqual(list(self.scan.raw_results.filter(
+            identifier='cropped_screenshot')), [thumbnail])
+        self.assertEqual(thumbnail.mime_type, 'image/png')
+        self.assertEqual(self.scan.site.get_screenshot(), thumbnail.retrieve())
+
+
+class PublicSuffixTestCase(TestCase):
+    def test_extract(self):
+        self.assertEqual(
+            publicsuffix.extract('https://user@www.Example.co.uk:8080/a?b'),
+            ('www', 'Example', 'co.uk'))
+        self.assertEqual(publicsuffix.extract('.example.com'), ('', 'example', 'com'))
+        self.assertEqual(publicsuffix.extract('localhost'), ('', 'localhost', ''))
+        self.assertEqual(publicsuffix.extract('http://192.0.2.1/'), ('', '192.0.2.1', ''))
+
+    def test_wildcard_rules(self):
+        # *.kawasaki.jp and !city.kawasaki.jp
+        self.assertEqual(
+            publicsuffix.registered_domain('a.b.kawasaki.jp'), 'a.b.kawasaki.jp')
+        self.assertEqual(
+            publicsuffix.registered_domain('www.city.kawasaki.jp'), 'city.kawasaki.jp')
+
+    def test_blacklist_match(self):
+        entry = BlacklistEntry(
+            url='http://example.co.uk/', match_type=BlacklistEntry.TYPE_DOMAIN)
+        self.assertTrue(entry.match('https://www.example.co.uk/foo'))
+        self.assertFalse(entry.match('https://example.uk/'))
+
+
+class BlacklistIndexTestCase(TestCase):
+    def test_match(self):
+        BlacklistEntry.objects.create(url='http://example.co.uk/')
+        BlacklistEntry.objects.create(
+            url='www.example.com', match_type=BlacklistEntry.TYPE_SUBDOMAIN)
+        BlacklistEntry.objects.create(url='192.0.2.1')
+        index = BlacklistEntry.get_index()
+        for url, expected in (('https://www.example.co.uk/foo', True),
+                              ('https://example.uk/', False),
+                              ('http://www.example.com/', True),
+                              ('http://example.com/', False),
+                              ('http://192.0.2.1:8080/', True),
+                              ('http://192.0.2.2/', False)):
+            self.assertEqual(index.match(url), expected, url)
+            self.assertEqual(
+                index.match_site(Site.objects.create(url=url)), expected, url)
+
+    def test_invalidation(self):
+        entry = BlacklistEntry.objects.create(url='example.com')
+        index = BlacklistEntry.get_index()
+        self.assertIs(BlacklistEntry.get_index(), index)
+        entry.delete()
+        self.assertIsNot(BlacklistEntry.get_index(), index)
+        self.assertFalse(BlacklistEntry.get_index().match('example.com'))
+
+
+class BulkScannableTestCase(TestCase):
+    def test_bulk_scannable(self):
+        now = timezone.now()
+        sites = [Site.objects.create(url=url) for url in (
+            'http://ok.com/', 'http://running.com/', 'http://recent.com/',
+            'http://old.com/', 'http://www.blacklisted.com/',
+            'http://www.sub.com/', 'http://other.sub.com/')]
+        Scan.objects.create(site=sites[1])
+        # last_scan is set by a trigger in postgres
+        Site.objects.filter(pk=sites[2].pk).update(last_scan=Scan.objects.create(
+            site=sites[2], start=now - timedelta(minutes=5), end=now))
+        Site.objects.filter(pk=sites[3].pk).update(last_scan=Scan.objects.create(
+            site=sites[3], start=now - timedelta(days=1),
+            end=now - timedelta(days=1)))
+        BlacklistEntry.objects.create(url='blacklisted.com')
+        BlacklistEntry.objects.create(
+            url='www.sub.com', match_type=BlacklistEntry.TYPE_SUBDOMAIN)
+
+        with self.assertNumQueries(2):
+            status_codes = Site.bulk_scannable(sites)
+        self.assertEqual([status_codes[site.pk] for site in sites], [
+            Site.SCAN_OK, Site.SCAN_COOLDOWN, Site.SCAN_COOLDOWN, Site.SCAN_OK,
+            Site.SCAN_BLACKLISTED, Site.SCAN_BLACKLISTED, Site.SCAN_OK])
+        for site in sites:
+            self.assertEqual(
+                Site.objects.get(pk=site.pk).scannable(), status_codes[site.pk])
@@ -0,0 +1,96 @@
+"""
+Thumbnails of the screenshots taken by the scans.
+
+The openwpm test suite only returns the original screenshot. The cropped
+and pixelized thumbnail shown on the site page is created afterwards from
+the stored original by the create_thumbnail task, which runs on its own
+queue outside of the critical path of the scan.
+
+Creating a thumbnail replaces any existing thumbnail of the scan, so the
+thumbnails can be regenerated at any time (see the thumbnails management
+command), e.g. after changing SCREENSHOT_THUMBNAIL.
+"""
+from io import BytesIO
+from typing import BinaryIO
+
+from django.conf import settings
+from django.db import transaction
+from PIL import Image
+
+from privacyscore.backend.models import RawScanResult
+
+
+SCREENSHOT_IDENTIFIER = 'screenshot'
+THUMBNAIL_IDENTIFIER = 'cropped_screenshot'
+
+MIME_TYPES = {
+    'png': 'image/png',
+    'webp': 'image/webp',
+}
+
+
+def pixelize_screenshot(screenshot: BinaryIO, target_width: int = 390,
+                        pixelsize: int = 3, format: str = 'png',
+                        colors: int = 64) -> bytes:
+    """
+    Thumbnail a screenshot to `target_width` and pixelize it.
+
+    Only JPEG screenshots are decoded at a reduced scale (draft mode). The
+    PNG screenshots taken by openwpm are always decoded in full, as PNG has
+    no reduced-size decoding; only the resampling is reduced for them
+    (reducing_gap).
+
+    :param screenshot: Screenshot to be thumbnailed in pixelized
+    :param target_width: Width of the final thumbnail
+    :param pixelsize: Size of the final pixels
+    :param format: png for a palettized png or webp
+    :param colors: Number of colors of a palettized png
+    :return: The encoded thumbnail
+    """
+    if target_width % pixelsize != 0:
+        raise ValueError("pixelsize must divide target_width")
+    if format not in MIME_TYPES:
+        raise ValueError("unsupported format {}".format(format))
+
+    img = Image.open(screenshot)
+    undersampling_width = target_width // pixelsize
+    # decode only at the required scale if the format supports it, i.e. for
+    # JPEG only. This is a no-op for PNG.
+    width, height = img.size
+    img.draft('RGB', (undersampling_width,
+                      undersampling_width * height // width))
+    width, height = img.size
+    if height > width:
+        img = img.crop((0, 0, width, width))
+        height = width
+    ratio = width / height
+    new_height = int(undersampling_width / ratio)
+    img = img.convert('RGB').resize(
+        (undersampling_width, new_height), Image.BICUBIC, reducing_gap=3)
+    if format == 'png':
+        img = img.quantize(colors)
+    img = img.resize((target_width, new_height * pixelsize), Image.NEAREST)
+
+    out = BytesIO()
+    if format == 'png':
+        img.save(out, format='png', optimize=True)
+    else:
+        img.save(out, format='webp', lossless=True)
+    return out.getvalue()
+
+
+def create_thumbnail(screenshot: RawScanResult) -> RawScanResult:
+    """Create the thumbnail of a stored screenshot, replacing existing ones."""
+    options = settings.SCREENSHOT_THUMBNAIL
+    data = pixelize_screenshot(BytesIO(screenshot.retrieve()), **options)
+    with transaction.atomic():
+        RawScanResult.objects.filter(
+            scan_id=screenshot.scan_id,
+            identifier=THUMBNAIL_IDENTIFIER).delete()
+        return RawScanResult.store_raw_data(
+            mime_type=MIME_TYPES[options.get('format', 'png')],
+            scan_host=screenshot.scan_host,
+            test=screenshot.test,
+            identifier=THUMBNAIL_IDENTIFIER,
+            scan_pk=screenshot.scan_id,
+            data=data)
@@ -7,15 +7,27 @@ bad if all keys are rated bad.
 
 This is only a draft and will most likely be changed essentially later.
 """
+import hashlib
+import inspect
 from collections import OrderedDict
 from typing import Tuple, Union
 
+from privacyscore.evaluation import default_checks
 from privacyscore.evaluation.default_checks import CHECKS
 from privacyscore.evaluation.group_evaluation import GroupEvaluation
 from privacyscore.evaluation.rating import Rating
 from privacyscore.evaluation.site_evaluation import SiteEvaluation, UnrateableSiteEvaluation
 
 
+# The format of stored classifications, see classify_result
+CLASSIFICATIONS_FORMAT = 3
+
+# A hash of the checks and the format. Stored evaluations of other versions
+# are outdated.
+CHECKS_VERSION = hashlib.sha256('{}\n{}'.format(
+    CLASSIFICATIONS_FORMAT, inspect.getsource(default_checks)).encode()).hexdigest()
+
+
 def evaluate_result(result: dict, group_order: list) -> Tuple[dict, OrderedDict]:
     """
     Evaluate and describe a complete result dictionary.
@@ -45,19 +57,128 @@ def evaluate_group(group: str, result: dict) -> GroupEvaluation:
     classifications = []
     descriptions = []
     for check, data in CHECKS[group].items():
-        keys = {}
-        for key in data['keys']:
-            if key not in result:
-                keys = None
-                break
-            keys[key] = result[key]
-        if keys:
-            res = data['rating'](**keys)
-        else:
-            res = data['missing']
+        res = _rate(data, _get_inputs(data, result))
         if not res:
             continue
         
         classifications.append(res['classification'])
-        descriptions.append((res['description'], data.get('title'), data.get('longdesc'), data.get('labels'), res['details_list'], res['classification']))
+        descriptions.append(_describe(data, res))
     return GroupEvaluation(classifications), descriptions # sorted(descriptions, key=lambda k: k[1])
+
+
+def _get_inputs(data: dict, result: dict) -> Union[dict, None]:
+    """Get the keys of the result a check reads, or None if one is missing."""
+    keys = {}
+    for key in data['keys']:
+        if key not in result:
+            return None
+        keys[key] = result[key]
+    return keys
+
+
+def _rate(data: dict, inputs: Union[dict, None]) -> Union[dict, None]:
+    """Rate a single check."""
+    if inputs:
+        return data['rating'](**inputs)
+    return data['missing']
+
+
+def _describe(data: dict, res: dict) -> tuple:
+    return (res['description'], data.get('title'), data.get('longdesc'),
+            data.get('labels'), res['details_list'], res['classification'])
+
+
+def classify_result(result: dict) -> Union[dict, None]:
+    """
+    Get the classifications of the checks of all groups in a compact form
+    which can be stored, or None if the result is not rateable.
+
+    The classifications of each group ('groups') are lists of the check, the
+    rating, influences_ranking and devaluates_group. The keys of the result
+    read by the classified checks are stored once ('inputs'), so that the
+    checks can be described in the language of a request later.
+    """
+    if 'reachable' in result and not result['reachable']:
+        return None
+    groups = {}
+    inputs = {}
+    for group, checks in CHECKS.items():
+        groups[group] = []
+        for check, data in checks.items():
+            check_inputs = _get_inputs(data, result)
+            res = _rate(data, check_inputs)
+            if not res:
+                continue
+            rating = res['classification']
+            groups[group].append([
+                check, rating.rating, rating.influences_ranking,
+                rating.devaluates_group])
+            if check_inputs:
+                inputs.update(check_inputs)
+    return {'inputs': inputs, 'groups': groups}
+
+
+def evaluate_classifications(classifications: Union[dict, None],
+                             group_order: list) -> SiteEvaluation:
+    """Evaluate stored classifications (see classify_result)."""
+    if classifications is None:
+        return UnrateableSiteEvaluation()
+    groups = classifications['groups']
+    evaluated_groups = {}
+    for group in group_order:
+        if group not in groups:
+            continue
+        evaluated_groups[group] = GroupEvaluation([
+            Rating(rating, influences_ranking, devaluates_group)
+            for _check, rating, influences_ranking, devaluates_group
+            in groups[group]])
+    return SiteEvaluation(evaluated_groups, group_order)
+
+
+def describe_classifications(classifications: Union[dict, None],
+                             group_order: list) -> OrderedDict:
+    """
+    Describe stored classifications (see classify_result) in the active
+    language like evaluate_result does.
+    """
+    described_groups = OrderedDict()
+    if classifications is None:
+        return described_groups
+    groups = classifications['groups']
+    for group in group_order:
+        if group not in groups or group not in CHECKS:
+            continue
+        descriptions = []
+        for check, _rating, _influences, _devaluates in groups[group]:
+            data = CHECKS[group].get(check)
+            if data is None:
+                continue
+            res = _rate(data, _get_inputs(data, classifications['inputs']))
+            if res:
+                descriptions.append(_describe(data, res))
+        described_groups[group] = descriptions
+    return described_groups
+
+
+def get_scan_classifications(scan, result: dict = None) -> Union[dict, None]:
+    """
+    Get the stored classifications of a scan. Missing and outdated
+    classifications are made from the result of the scan (or result if
+    given) without storing them; the reevaluate management command stores
+    them. Returns None if the result is not rateable or the scan has no
+    result.
+    """
+    from privacyscore.evaluation.models import ScanEvaluation
+
+    try:
+        evaluation = scan.evaluation
+    except ScanEvaluation.DoesNotExist:
+        evaluation = None
+    if evaluation is not None and evaluation.checks_version == CHECKS_VERSION:
+        return evaluation.classifications
+
+    if result is None:
+        if scan.result_or_none is None:
+            return None
+        result = scan.result_or_none.result
+    return classify_result(result)
@@ -0,0 +1,25 @@
+# Generated by Django 2.1.15 on 2026-10-18 03:43
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('backend', '0025_registered_domain'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanEvaluation',
+            fields=[
+                ('scan', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='evaluation', serialize=False, to='backend.Scan')),
+                ('classifications', django.contrib.postgres.fields.jsonb.JSONField(blank=True, null=True)),
+                ('checks_version', models.CharField(db_index=True, max_length=64)),
+            ],
+        ),
+    ]
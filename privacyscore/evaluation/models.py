@@ -1,3 +1,38 @@
+from django.contrib.postgres import fields as postgres_fields
 from django.db import models
 
-# Create your models here.
+from privacyscore.evaluation.evaluation import CHECKS_VERSION, \
+    classify_result, evaluate_classifications
+from privacyscore.evaluation.site_evaluation import SiteEvaluation
+
+
+class ScanEvaluation(models.Model):
+    """
+    The classifications of the checks for the result of a scan.
+
+    They are stored when the scan finishes, so pages do not have to run the
+    checks on the complete result again. checks_version is the version of
+    the checks (CHECKS_VERSION) the classifications have been made with.
+    The reevaluate management command refreshes outdated classifications.
+    """
+    scan = models.OneToOneField(
+        'backend.Scan', on_delete=models.CASCADE, primary_key=True,
+        related_name='evaluation')
+    # None if the result is not rateable, see classify_result
+    classifications = postgres_fields.JSONField(null=True, blank=True)
+    checks_version = models.CharField(max_length=64, db_index=True)
+
+    def __str__(self) -> str:
+        return '{}'.format(str(self.scan))
+
+    def evaluate(self, group_order: list) -> SiteEvaluation:
+        """Evaluate the stored classifications."""
+        return evaluate_classifications(self.classifications, group_order)
+
+    @staticmethod
+    def store(scan, result: dict) -> 'ScanEvaluation':
+        """Classify the result of a scan and store the classifications."""
+        return ScanEvaluation.objects.update_or_create(scan=scan, defaults={
+            'classifications': classify_result(result),
+            'checks_version': CHECKS_VERSION,
+        })[0]
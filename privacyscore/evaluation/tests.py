@@ -1,7 +1,9 @@
 from django.test import TestCase
 
+from privacyscore.evaluation import evaluation
 from privacyscore.evaluation.group_evaluation import GroupEvaluation
 from privacyscore.evaluation.rating import Rating
+from privacyscore.evaluation.result_groups import DEFAULT_GROUP_ORDER
 from privacyscore.evaluation.site_evaluation import SiteEvaluation
 
 
@@ -230,3 +232,47 @@ class RatingTestCase(TestCase):
         self.assertTrue(f_dev > f_nondev)
         self.assertFalse(f_dev < f_nondev)
         self.assertFalse(f_dev <= f_nondev)
+
+
+class ScanEvaluationTestCase(TestCase):
+    result = {
+        'reachable': True,
+        'success': True,
+        'third_parties_count': 2,
+        'third_parties': ['a.example', 'b.example'],
+        'tracker_requests': [],
+    }
+
+    def test_same_evaluation(self):
+        stored = evaluation.evaluate_classifications(
+            evaluation.classify_result(self.result), DEFAULT_GROUP_ORDER)
+        evaluated = evaluation.evaluate_result(self.result, DEFAULT_GROUP_ORDER)[0]
+        self.assertEqual(str(stored), str(evaluated))
+        self.assertEqual(stored.rating, evaluated.rating)
+
+    def test_same_descriptions(self):
+        described = evaluation.describe_classifications(
+            evaluation.classify_result(self.result), DEFAULT_GROUP_ORDER)
+        expected = evaluation.evaluate_result(self.result, DEFAULT_GROUP_ORDER)[1]
+        self.assertEqual(list(described), list(expected))
+        for group, descriptions in expected.items():
+            self.assertEqual(
+                [[str(value) for value in description]
+                 for description in described[group]],
+                [[str(value) for value in description]
+                 for description in descriptions])
+
+    def test_compact(self):
+        classifications = evaluation.classify_result(self.result)
+        # the keys read by the checks are stored once
+        self.assertEqual(classifications['inputs'], {
+            key: value for key, value in self.result.items()
+            if key not in ('reachable', 'success')})
+        for group in classifications['groups'].values():
+            for classification in group:
+                self.assertEqual(len(classification), 4)
+
+    def test_not_rateable(self):
+        self.assertFalse(evaluation.evaluate_classifications(
+            evaluation.classify_result({'reachable': False}),
+            DEFAULT_GROUP_ORDER).rateable)
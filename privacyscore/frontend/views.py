@@ -1,5 +1,6 @@
 import csv
 import json
+import math
 import re
 from collections import Counter, defaultdict
 from typing import Iterable, Union
@@ -12,24 +13,28 @@ from django.core.cache import cache
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db import connection
 from django.db import transaction
-from django.db.models import Count, F, Prefetch, Q
+from django.db.models import Count, F, Q
 from django.http import HttpRequest, HttpResponse, HttpResponseNotFound, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render, reverse
 from django.template.response import TemplateResponse
 from django.utils.safestring import mark_safe
-from django.utils.translation import ugettext_lazy as _
+from django.utils.translation import ugettext_lazy as _, ungettext
 from django.views.decorators.http import require_POST
 from django import forms
 from pygments import highlight
 from pygments.lexers import JsonLexer
 from pygments.formatters import HtmlFormatter
 
-from privacyscore.backend.models import ListColumn, ListColumnValue, ListTag,  Scan, ScanList, Site, ScanResult
+from privacyscore.backend.models import BlacklistEntry, ListColumn, ListColumnValue, ListTag,  Scan, ScanList, Site, ScanResult
+from privacyscore.evaluation.evaluation import describe_classifications, \
+    evaluate_classifications, get_scan_classifications
 from privacyscore.evaluation.result_groups import DEFAULT_GROUP_ORDER, RESULT_GROUPS
 from privacyscore.evaluation.site_evaluation import UnrateableSiteEvaluation
 from privacyscore.flexcache import flexcache_view
 from privacyscore.frontend.forms import SingleSiteForm, CreateListForm
 from privacyscore.frontend.models import Spotlight
+from privacyscore.scanner.priorities import get_expected_wait, \
+    get_expected_waits
 from privacyscore.utils import normalize_url
 
 
@@ -143,7 +148,7 @@ def scan_list(request: HttpRequest) -> HttpResponse:
                         tag = ListTag.objects.get_or_create(name=tag)[0]
                         tags_to_add.add(tag)
                     scan_list.tags.add(*tags_to_add)
-                scan_list.scan()
+                scan_list.scan(Scan.LANE_LIST)
                 return redirect(reverse('frontend:scan_list_created', args=(scan_list.token,)))
 
     else:
@@ -161,37 +166,27 @@ def scan_list(request: HttpRequest) -> HttpResponse:
 
 def scan_list_created(request: HttpRequest, token: str) -> HttpResponse:
     scan_list = get_object_or_404(ScanList, token=token)
-    num_scanning_sites = Scan.objects.filter(end__isnull=True).count()
     return render(request, 'frontend/scan_list_created.html', {
         'scan_list': scan_list,
-        'num_scanning_sites': num_scanning_sites
+        'expected_wait': _in_minutes(get_expected_wait(Scan.LANE_LIST)),
     })
 
 def scan_site_created(request: HttpRequest, site_id: int) -> HttpResponse:
     site = get_object_or_404(Site, pk=site_id)
-    num_scanning_sites = Scan.objects.filter(end__isnull=True).count()
     return render(request, 'frontend/scan_site_created.html', {
         'site': site,
-        'num_scanning_sites': num_scanning_sites
+        'expected_wait': _in_minutes(
+            get_expected_wait(Scan.LANE_INTERACTIVE)),
     })
 
 
 def scan_scan_list(request: HttpRequest, scan_list_id: int) -> HttpResponse:
     """Schedule the scan of a scan list."""
-    scan_list = get_object_or_404(
-        ScanList.objects.prefetch_related(Prefetch(
-            'sites',
-            queryset=Site.objects.select_related('last_scan') \
-                .annotate_most_recent_scan_start() \
-                .annotate_most_recent_scan_end_or_null())
-        ), pk=scan_list_id)
-    was_any_site_scannable = scan_list.scan()
+    scan_list = get_object_or_404(ScanList, pk=scan_list_id)
+    was_any_site_scannable = scan_list.scan(Scan.LANE_LIST)
     if was_any_site_scannable:
-        num_scanning_sites = Scan.objects.filter(end__isnull=True).count()
-        messages.success(request,
-            _("Scans for this list have been scheduled. "+ \
-              "The total number of sites in the scanning queue "+ \
-              "is %i (including yours)." % num_scanning_sites))
+        messages.success(request, _scheduled_message(
+            _('Scans for this list have been scheduled.'), Scan.LANE_LIST))
     else:
         messages.warning(request,
             _('All sites have been scanned recently. Please wait 30 minutes and try again.'))
@@ -199,6 +194,24 @@ def scan_scan_list(request: HttpRequest, scan_list_id: int) -> HttpResponse:
     return redirect(reverse('frontend:view_scan_list', args=(scan_list_id,)))
 
 
+def _in_minutes(expected_wait) -> Union[int, None]:
+    """Round an expected wait up to full minutes."""
+    if expected_wait is None:
+        return None
+    return math.ceil(expected_wait.total_seconds() / 60)
+
+
+def _scheduled_message(message: str, lane: str) -> str:
+    """Append the expected wait of a lane to a message."""
+    expected_wait = _in_minutes(get_expected_wait(lane))
+    if expected_wait is None:
+        return message
+    return '{} {}'.format(message, ungettext(
+        'The expected waiting time is about %(minutes)i minute.',
+        'The expected waiting time is about %(minutes)i minutes.',
+        expected_wait) % {'minutes': expected_wait})
+
+
 def login(request: HttpRequest) -> HttpResponse:
     return render(request, 'frontend/login.html')
 
@@ -270,19 +283,16 @@ def render_scan_list_cachable(request: HttpRequest, scan_list, format: str = 'ht
 
     sites = scan_list.sites.annotate_most_recent_scan_error_count() \
         .annotate_most_recent_scan_start().annotate_most_recent_scan_end_or_null() \
-        .annotate_most_recent_scan_result().prefetch_column_values(scan_list) \
-        .select_related('last_scan')
+        .prefetch_column_values(scan_list) \
+        .select_related('last_scan', 'last_scan__evaluation')
 
-    # add evaluations to sites
+    # add stored evaluations to sites
     for site in sites:
         site.evaluated = UnrateableSiteEvaluation()
         if not site.last_scan:
             continue
-        site.evaluated = site.evaluate(category_order)
-        if site.evaluated:
-            site.evaluated = site.evaluated[0]
-        else:
-            site.evaluated = UnrateableSiteEvaluation()
+        site.evaluated = evaluate_classifications(
+            get_scan_classifications(site.last_scan), category_order)
 
     sites = sorted(sites, key=lambda v: v.evaluated, reverse=True)
 
@@ -299,8 +309,15 @@ def render_scan_list_cachable(request: HttpRequest, scan_list, format: str = 'ht
         sites = list(sites)
         sites.sort(key=_get_sorting_fn(sites, sort_by), reverse=sort_dir == 'desc')
 
-    blacklisted_sites = [site for site in sites if site.scannable() == Site.SCAN_BLACKLISTED]
-    sites = [site for site in sites if site.scannable() != Site.SCAN_BLACKLISTED]
+    blacklist = BlacklistEntry.get_index()
+    blacklisted_sites = []
+    allowed_sites = []
+    for site in sites:
+        if blacklist.match_site(site):
+            blacklisted_sites.append(site)
+        else:
+            allowed_sites.append(site)
+    sites = allowed_sites
 
     groups = None
     group_attr = None
@@ -475,10 +492,11 @@ def site_screenshot(request: HttpRequest, site_id: int) -> HttpResponse:
     """View a site and its most recent scan result (if any)."""
     site = get_object_or_404(Site, pk=site_id)
 
-    screenshot = site.get_screenshot()
+    screenshot = site.get_screenshot_result()
     if not screenshot:
         return HttpResponseNotFound(_('screenshot does not exist'))
-    return HttpResponse(screenshot, content_type='image/png')
+    return HttpResponse(
+        screenshot.retrieve(), content_type=screenshot.mime_type)
 
 
 def view_site(request: HttpRequest, site_id: int) -> HttpResponse:
@@ -486,7 +504,8 @@ def view_site(request: HttpRequest, site_id: int) -> HttpResponse:
     site = get_object_or_404(
         Site.objects.annotate_most_recent_scan_start() \
             .annotate_most_recent_scan_end_or_null() \
-            .annotate_most_recent_scan_result(), pk=site_id)
+            .annotate_most_recent_scan_result() \
+            .select_related('last_scan', 'last_scan__evaluation'), pk=site_id)
     site.views = F('views') + 1
     site.save(update_fields=('views',))
     num_scans = Scan.objects.filter(site_id=site.pk).count()
@@ -494,11 +513,18 @@ def view_site(request: HttpRequest, site_id: int) -> HttpResponse:
 
     # evaluate site
     site.evaluated = UnrateableSiteEvaluation()
+    groups_descriptions = None
     results = {}
     if site.last_scan__result:
         results = site.last_scan__result
-        category_order = DEFAULT_GROUP_ORDER
-        site.evaluated = site.evaluate(category_order)[0]
+        classifications = get_scan_classifications(site.last_scan, results)
+        site.evaluated = evaluate_classifications(
+            classifications, DEFAULT_GROUP_ORDER)
+        # TODO: groups not statically
+        groups_descriptions = (
+            (RESULT_GROUPS[group]['name'], val) for group, val in
+            describe_classifications(
+                classifications, DEFAULT_GROUP_ORDER).items())
     
     # store other attributes needed to show
     res = {}
@@ -524,11 +550,7 @@ def view_site(request: HttpRequest, site_id: int) -> HttpResponse:
         'scan_lists': scan_lists,
         'scan_running': Scan.objects.filter(site=site, end__isnull=True).exists(),
         'num_scans': num_scans,
-        # TODO: groups not statically
-        'groups_descriptions': (
-            (RESULT_GROUPS[group]['name'], val) for group, val in
-            site.evaluate(DEFAULT_GROUP_ORDER)[1].items()
-        ) if site.last_scan__result else None,
+        'groups_descriptions': groups_descriptions,
     })
 
 
@@ -554,16 +576,14 @@ def scan_site(request: HttpRequest, site_id: Union[int, None] = None) -> HttpRes
             return render(request, 'frontend/create_site.html', {
                 'form': form,
             })
-    status_code = site.scan()
+    status_code = site.scan(Scan.LANE_INTERACTIVE)
     if status_code == Site.SCAN_OK:
         if not site_id: # if the site is new we want to show the dog
             return redirect(reverse('frontend:scan_site_created', args=(site.pk,)))
         else:
-            num_scanning_sites = Scan.objects.filter(end__isnull=True).count()
-            messages.success(request,
-                _("A scan of the site has been scheduled. "+ \
-                  "The total number of sites in the scanning queue "+ \
-                  "is %i (including yours)." % num_scanning_sites))
+            messages.success(request, _scheduled_message(
+                _('A scan of the site has been scheduled.'),
+                Scan.LANE_INTERACTIVE))
             return redirect(reverse('frontend:view_site', args=(site.pk,)))
     elif status_code == Site.SCAN_COOLDOWN:
         messages.warning(request,
@@ -643,7 +663,7 @@ def privacypolicy(request: HttpRequest):
 
 def faq(request: HttpRequest):
     num_scans  = Site.objects.filter(scans__isnull=False).count()
-    num_scanning_sites = Scan.objects.filter(end__isnull=True).count()
+    expected_waits = get_expected_waits()
 
     # query = '''SELECT
     #     COUNT(jsonb_array_length("result"->'leaks'))
@@ -659,7 +679,11 @@ def faq(request: HttpRequest):
     #     num_sites_failing_serverleak = cursor.fetchone()[0]
         
     return render(request, 'frontend/faq.html', {
-        'num_scanning_sites': num_scanning_sites,
+        'expected_waits': [
+            (label, _in_minutes(expected_waits[lane])) for lane, label in (
+                (Scan.LANE_INTERACTIVE, _('Scans of single sites')),
+                (Scan.LANE_LIST, _('Scans of lists')),
+                (Scan.LANE_BACKGROUND, _('Periodic rescans')))],
         'num_scans':  num_scans,
         'num_sites': Site.objects.count(),
         # 'num_sites_failing_serverleak': num_sites_failing_serverleak
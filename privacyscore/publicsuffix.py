@@ -0,0 +1,156 @@
+"""
+Resolution of registered domains using the public suffix list.
+
+This is a drop-in replacement for tldextract.extract with the same results
+(ICANN section of the public suffix list only) for the hot paths of the
+test suites and the blacklist. The offline snapshot of the public suffix
+list shipped with tldextract is compiled into a trie once per process, so
+no network access or cache file is required, and the results of the most
+recent CACHE_SIZE lookups are memoized.
+"""
+import ipaddress
+import pkgutil
+from functools import lru_cache
+from typing import Iterable, NamedTuple
+
+
+# The number of memoized lookups
+CACHE_SIZE = 65536
+
+SCHEME_CHARS = set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789+-.')
+
+# label separators besides the ascii dot (see RFC 3490)
+DOTS = ('。', '．', '｡')
+
+
+class ExtractResult(NamedTuple):
+    subdomain: str
+    domain: str
+    suffix: str
+
+    @property
+    def registered_domain(self) -> str:
+        if self.domain and self.suffix:
+            return self.domain + '.' + self.suffix
+        return ''
+
+
+class _Node:
+    __slots__ = ('children', 'end')
+
+    def __init__(self):
+        self.children = {}
+        self.end = False
+
+
+class PublicSuffixList:
+    """A trie of the rules of the public suffix list."""
+
+    def __init__(self, rules: Iterable[str]):
+        self._root = _Node()
+        for rule in rules:
+            node = self._root
+            for label in reversed(rule.split('.')):
+                node = node.children.setdefault(label, _Node())
+            node.end = True
+
+    @classmethod
+    def load(cls, path: str = None) -> 'PublicSuffixList':
+        """
+        Load the ICANN section of a public suffix list file. Without a path,
+        the snapshot of tldextract is used.
+        """
+        if path is None:
+            text = pkgutil.get_data('tldextract', '.tld_set_snapshot').decode()
+        else:
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+        text = text.split('===BEGIN PRIVATE DOMAINS===')[0]
+        return cls(
+            line.split()[0] for line in text.splitlines()
+            if line.strip() and not line.startswith('//'))
+
+    def suffix_index(self, labels: list) -> int:
+        """Get the index of the first label of the public suffix."""
+        node = self._root
+        index = suffix_index = len(labels)
+        for label in reversed(labels):
+            label = _decode_label(label)
+            if label in node.children:
+                index -= 1
+                node = node.children[label]
+                if node.end:
+                    suffix_index = index
+                continue
+            if '*' in node.children:
+                if '!' + label in node.children:
+                    return index
+                return index - 1
+            break
+        return suffix_index
+
+    def extract(self, url: str) -> ExtractResult:
+        """Split the hostname of a url into subdomain, domain and suffix."""
+        hostname = _get_hostname(url)
+        for dot in DOTS:
+            hostname = hostname.replace(dot, '.')
+        labels = hostname.split('.')
+        index = self.suffix_index(labels)
+        if index == len(labels) == 4 and _is_ipv4(hostname):
+            return ExtractResult('', hostname, '')
+        return ExtractResult(
+            '.'.join(labels[:max(index - 1, 0)]),
+            labels[index - 1] if index else '',
+            '.'.join(labels[index:]))
+
+
+def _decode_label(label: str) -> str:
+    label = label.lower()
+    if label.startswith('xn--'):
+        try:
+            return label.encode('ascii').decode('idna')
+        except UnicodeError:
+            pass
+    return label
+
+
+def _get_hostname(url: str) -> str:
+    url = url.strip()
+    # remove the scheme
+    position = url.find('//')
+    if position == 0:
+        url = url[2:]
+    elif (position >= 2 and url[position - 1] == ':' and
+            not set(url[:position - 1]) - SCHEME_CHARS):
+        url = url[position + 2:]
+    netloc = url.partition('/')[0].partition('?')[0].partition('#')[0]
+    netloc = netloc.rpartition('@')[2]
+    if netloc.startswith('['):
+        # ipv6 address
+        return netloc.partition(']')[0] + ']'
+    return netloc.partition(':')[0].strip().rstrip('.' + ''.join(DOTS))
+
+
+def _is_ipv4(hostname: str) -> bool:
+    try:
+        ipaddress.IPv4Address(hostname)
+        return True
+    except ValueError:
+        return False
+
+
+@lru_cache(maxsize=None)
+def get_public_suffix_list() -> PublicSuffixList:
+    """Get the public suffix list of the snapshot."""
+    return PublicSuffixList.load()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def extract(url: str) -> ExtractResult:
+    """Split the hostname of a url into subdomain, domain and suffix."""
+    return get_public_suffix_list().extract(url)
+
+
+def registered_domain(url: str) -> str:
+    """Get the registered domain of a url, i.e. example.co.uk."""
+    return extract(url).registered_domain
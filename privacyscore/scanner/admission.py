@@ -0,0 +1,157 @@
+"""
+Admission control of list and background scans.
+
+Scans of scan lists and background refreshes are created waiting for
+admission instead of being scheduled right away. They are admitted in the
+order of their lane (see privacyscore.scanner.priorities) and creation as
+long as the number of scans in flight stays below the capacity of the
+workers, i.e. the number of worker processes consuming the queues of the
+test suites times SCAN_ADMISSION['scans_per_slot'], capped at
+SCAN_ADMISSION['max_scans']. No scans are admitted while the queues of the
+test suites hold more than SCAN_ADMISSION['max_queued_per_slot'] messages
+per worker process.
+
+Waiting scans are admitted whenever a scan finishes and by the scanner_cron
+management command. Interactive scans bypass the admission control.
+"""
+import uuid
+from typing import Union
+
+from celery import current_app
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from privacyscore.backend.models import Scan
+from privacyscore.scanner.priorities import get_lane_priority, \
+    get_message_priority
+
+
+LOCK_KEY = 'scan_admission:lock'
+SLOTS_KEY = 'scan_admission:slots'
+
+# Seconds to wait for the replies of the workers
+INSPECT_TIMEOUT = 2
+
+
+def get_scan_queues() -> set:
+    """Get the queues the test suites are run on."""
+    from privacyscore.scanner.test_suites import get_test_queues
+    return get_test_queues()
+
+
+def get_worker_slots() -> Union[int, None]:
+    """
+    Get the number of worker processes consuming the queues of the test
+    suites or None if the workers can not be inspected.
+
+    Workers which do not reply in time make inspect() return None. This is
+    not taken as a capacity of zero and not cached, so that the next
+    admission inspects the workers again.
+    """
+    slots = cache.get(SLOTS_KEY)
+    if slots is not None:
+        return slots
+
+    inspect = current_app.control.inspect(timeout=INSPECT_TIMEOUT)
+    try:
+        active_queues = inspect.active_queues()
+        stats = inspect.stats()
+    except Exception:
+        return None
+    if active_queues is None or stats is None:
+        return None
+
+    scan_queues = get_scan_queues()
+    slots = 0
+    for worker, queues in active_queues.items():
+        if worker not in stats:
+            continue
+        if not scan_queues.intersection(queue['name'] for queue in queues):
+            continue
+        slots += stats[worker].get('pool', {}).get('max-concurrency', 1)
+    cache.set(SLOTS_KEY, slots, settings.SCAN_ADMISSION['capacity_ttl'])
+    return slots
+
+
+def get_queue_depth() -> Union[int, None]:
+    """
+    Get the number of messages waiting in the queues of the test suites or
+    None if the broker does not tell.
+    """
+    depth = 0
+    try:
+        with current_app.connection_for_read() as connection:
+            channel = connection.default_channel
+            for queue in get_scan_queues():
+                depth += channel.queue_declare(
+                    queue=queue, passive=True).message_count
+    except Exception:
+        return None
+    return depth
+
+
+def get_capacity() -> int:
+    """Get the number of scans which may be admitted now."""
+    options = settings.SCAN_ADMISSION
+    ceiling = options['max_scans']
+
+    slots = get_worker_slots()
+    if slots is not None:
+        ceiling = min(ceiling, slots * options['scans_per_slot'])
+        depth = get_queue_depth()
+        if depth is not None and depth > slots * options['max_queued_per_slot']:
+            # the workers do not keep up
+            return 0
+
+    in_flight = Scan.objects.filter(admitted=True, end__isnull=True).count()
+    return max(ceiling - in_flight, 0)
+
+
+def admit_scans() -> int:
+    """Admit waiting scans up to the capacity. Returns the number admitted."""
+    token = uuid.uuid4().hex
+    if not cache.add(LOCK_KEY, token, 60):
+        # another admission is running
+        return 0
+    try:
+        return _admit_scans()
+    finally:
+        if cache.get(LOCK_KEY) == token:
+            cache.delete(LOCK_KEY)
+
+
+def _admit_scans() -> int:
+    capacity = get_capacity()
+    if not capacity:
+        return 0
+
+    from privacyscore.scanner.tasks import schedule_scan
+
+    with transaction.atomic():
+        scans = []
+        lanes = sorted(
+            (lane for lane, _name in Scan.LANES),
+            key=get_lane_priority, reverse=True)
+        for lane in lanes:
+            if len(scans) >= capacity:
+                break
+            scans.extend(Scan.objects.filter(
+                admitted=False, lane=lane).order_by('start', 'pk')[
+                :capacity - len(scans)])
+        # the scans are started now, so that handle_aborted_scans does not
+        # take the time they have been waiting for running time and their
+        # messages do not age from the time they have been created
+        now = timezone.now()
+        Scan.objects.filter(pk__in=[scan.pk for scan in scans]).update(
+            admitted=True, start=now)
+        for scan in scans:
+            scan.admitted = True
+            scan.start = now
+
+        transaction.on_commit(lambda: [
+            schedule_scan.apply_async(
+                (scan.pk,), priority=get_message_priority(scan))
+            for scan in scans])
+    return len(scans)
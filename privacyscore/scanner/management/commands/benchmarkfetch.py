@@ -0,0 +1,109 @@
+# Copyright (C) 2018 PrivacyScore Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import os
+import re
+import subprocess
+from statistics import mean, median
+from time import monotonic
+
+from django.core.management import BaseCommand
+
+from privacyscore.scanner import supervisor
+from privacyscore.test_suites.httpfetch import retrieve_url
+
+
+# TODO put the path somewhere else, maybe in settings
+HSTS_FILE = "/opt/privacyscore/.wget-hsts"
+
+
+def retrieve_url_with_wget(url):
+    """calls wget and extracts the final url and the http body from the response
+       IndexError or subprocess.CalledProcessError will be thrown if site is unreachable
+    """
+
+    # TODO this is hacky, but necessary, because (only) on some of our scan hosts
+    # we have a wget version that implements hsts. Once all VMs are upgraded, we can
+    # use the --no-hsts parameter of wget
+    if os.path.isfile(HSTS_FILE):
+        os.remove(HSTS_FILE)
+
+    # this needs python 3.5, but some of our VMs still have Python 3.4
+    #proc = subprocess.run(['wget', '--no-verbose', url, '-O-', '--no-check-certificate',
+    #                      '--user-agent="Mozilla/5.0 (X11; Linux x86_64; rv:53.0) Gecko/20100101 Firefox/53.0"'],
+    #                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    cmd = ['env', 'LC_ALL=C', 'wget', '--no-verbose', url, '-O-', \
+           '--no-check-certificate',
+           '--user-agent="Mozilla/5.0 (X11; Linux x86_64; rv:53.0) Gecko/20100101 Firefox/53.0"']
+    proc = supervisor.popen(cmd,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        (stdout, stderr) = proc.communicate(timeout=15)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        raise
+
+    # if wget returns 8, this indicates HTTP status != 200
+    http_error = None
+    final_url = None
+    content = None
+
+    if proc.returncode == 8:
+        if re.search('(ERROR .*)', stderr.decode(errors='replace')):
+            http_error = re.search('(ERROR .*)', stderr.decode(errors='replace')).group(1)
+        else:
+            http_error = "Unspecified error."
+
+    # we do error handling this way so that error handling in the caller is already compatible with subprocess.run
+    elif not proc.returncode == 0:
+        raise subprocess.CalledProcessError(proc.returncode, " ".join(cmd))
+
+    else:
+        # wget output looks like this:
+        # '2017-12-21 10:34:51 URL:https://www.example.com/foo/bar [64407] -> "-" [1]\n'
+        if re.search('URL:([^ ]+)', stderr.decode(errors='replace')):
+            final_url = re.search('URL:([^ ]+)', stderr.decode(errors='replace')).group(1)
+        content = stdout
+
+    return final_url, content, http_error
+
+
+class Command(BaseCommand):
+    help = 'Compare the in-process url retrieval of the network test with wget.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('urls', nargs='+')
+        parser.add_argument('-r', '--repetitions', type=int, default=3)
+
+    def handle(self, *args, **options):
+        durations = {'httpfetch': [], 'wget': []}
+        for url in options['urls']:
+            results = {}
+            for _ in range(options['repetitions']):
+                for name, retrieve in (('httpfetch', retrieve_url),
+                                       ('wget', retrieve_url_with_wget)):
+                    start = monotonic()
+                    try:
+                        final_url, content, http_error = retrieve(url)
+                        results[name] = (final_url, http_error)
+                    except Exception as e:
+                        results[name] = ('unreachable', type(e).__name__)
+                    durations[name].append(monotonic() - start)
+            if results['httpfetch'] != results['wget']:
+                self.stdout.write('{}: httpfetch {} != wget {}'.format(
+                    url, results['httpfetch'], results['wget']))
+
+        for name, values in durations.items():
+            self.stdout.write('{}: mean {:.3f}s, median {:.3f}s, total {:.3f}s'.format(
+                name, mean(values), median(values), sum(values)))
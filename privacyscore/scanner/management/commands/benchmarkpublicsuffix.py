@@ -0,0 +1,91 @@
+# Copyright (C) 2018 PrivacyScore Contributors
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+import random
+from time import monotonic
+
+import tldextract
+from django.core.management import BaseCommand
+
+from privacyscore import publicsuffix
+from privacyscore.test_suites.openwpm import detect_cookies
+
+
+SUFFIXES = ['com', 'de', 'co.uk', 'com.au', 'org', 'kawasaki.jp', 'net']
+
+
+def detect_trackers(domain, cookies, trackers, extract):
+    """
+    The tracker classification of detect_cookies with a replaceable extract
+    function, so that both resolvers are timed with the same loop.
+    """
+    dom_ext = extract(domain)
+    seen_trackers = []
+    tds = {extract(t).registered_domain for t in trackers}
+    for cookie in cookies:
+        cd_ext = extract(cookie['baseDomain'])
+        if cd_ext.registered_domain != dom_ext.registered_domain:
+            if cd_ext.registered_domain in tds:
+                if cd_ext.registered_domain not in seen_trackers:
+                    seen_trackers.append(cd_ext.registered_domain)
+    return seen_trackers
+
+
+class Command(BaseCommand):
+    help = 'Compare the registered domain resolution of the cookie statistics with tldextract.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('-c', '--cookies', type=int, default=1000)
+        parser.add_argument('-t', '--trackers', type=int, default=500)
+
+    def handle(self, *args, **options):
+        rng = random.Random(0)
+
+        def hostname():
+            return 'www{}.site{}.{}'.format(
+                rng.randrange(5), rng.randrange(2000), rng.choice(SUFFIXES))
+
+        trackers = [hostname() for _ in range(options['trackers'])]
+        cookies = [
+            {'baseDomain': hostname(), 'lifetime': rng.randrange(10 ** 6)}
+            for _ in range(options['cookies'] - options['cookies'] // 4)]
+        # some cookies are set by trackers
+        cookies += [
+            {'baseDomain': rng.choice(trackers), 'lifetime': 0}
+            for _ in range(options['cookies'] // 4)]
+        # warm up, i.e. load the suffix lists
+        tldextract.extract('example.com')
+        suffix_list = publicsuffix.get_public_suffix_list()
+
+        durations = []
+        results = []
+        for extract in (tldextract.extract, suffix_list.extract):
+            start = monotonic()
+            results.append(
+                detect_trackers('example.com', cookies, trackers, extract))
+            durations.append(monotonic() - start)
+        # detect_cookies additionally caches the resolved hostnames
+        publicsuffix.extract.cache_clear()
+        start = monotonic()
+        result = detect_cookies('example.com', cookies, [], trackers)
+        duration_cached = monotonic() - start
+
+        if (results[0] != results[1] or
+                result['third_party_track_domains'] != results[0]):
+            self.stdout.write('Results differ!')
+        self.stdout.write(
+            '{} cookies, {} trackers: tldextract {:.3f}s, publicsuffix {:.3f}s '
+            '(speedup {:.0f}x), detect_cookies {:.3f}s'.format(
+                len(cookies), len(trackers), durations[0], durations[1],
+                durations[0] / durations[1], duration_cached))
@@ -0,0 +1,70 @@
+"""
+Priorities of the tasks of scans.
+
+Every scan belongs to a lane (see Scan.LANES): interactive scans requested
+by visitors, scans of scan lists and background refreshes scheduled by the
+management commands. The tasks of a scan are sent with the message priority
+of its lane, so workers pick up tasks of interactive scans first even if a
+large list is being rescanned. To protect the lower lanes from starvation,
+the priority of the tasks of a scan is raised by one level for every
+SCAN_PRIORITY_AGING the scan has been running, up to the priority of the
+interactive lane.
+"""
+from datetime import timedelta
+from typing import Dict, Union
+
+from django.conf import settings
+from django.db.models import Count
+from django.utils import timezone
+
+from privacyscore.backend.models import Scan
+
+
+def get_lane_priority(lane: str) -> int:
+    """Get the base message priority of a lane."""
+    return settings.SCAN_LANE_PRIORITIES[lane]
+
+
+def get_message_priority(scan: Scan) -> int:
+    """Get the message priority for the next tasks of a scan."""
+    priority = get_lane_priority(scan.lane)
+    ceiling = get_lane_priority(Scan.LANE_INTERACTIVE)
+    if priority >= ceiling:
+        return priority
+    waited = timezone.now() - scan.start
+    if waited > timedelta(0):
+        priority += waited // settings.SCAN_PRIORITY_AGING
+    return min(priority, ceiling)
+
+
+def get_expected_waits() -> Dict[str, Union[timedelta, None]]:
+    """
+    Estimate the time until a scan scheduled now in each lane is finished.
+
+    The estimate is the number of unfinished scans in the same or a higher
+    lane divided by the number of scans finished per time recently. It is
+    None if no scan has been finished recently.
+    """
+    now = timezone.now()
+    period = settings.SCAN_THROUGHPUT_PERIOD
+    num_finished = Scan.objects.filter(end__gte=now - period).count()
+
+    pending = dict(Scan.objects.filter(end__isnull=True).values_list(
+        'lane').annotate(Count('pk')).order_by())
+
+    waits = {}
+    for lane, _name in Scan.LANES:
+        if not num_finished:
+            waits[lane] = None
+            continue
+        priority = get_lane_priority(lane)
+        num_ahead = sum(
+            count for other, count in pending.items()
+            if get_lane_priority(other) >= priority)
+        waits[lane] = period * max(num_ahead, 1) / num_finished
+    return waits
+
+
+def get_expected_wait(lane: str) -> Union[timedelta, None]:
+    """Estimate the time until a scan scheduled now in a lane is finished."""
+    return get_expected_waits()[lane]
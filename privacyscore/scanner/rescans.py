@@ -0,0 +1,86 @@
+"""
+Periodic rescans of all sites.
+
+Each site has a RescanSchedule with the time its next rescan is due. When a
+scan finishes, the next rescan is due after the rescan interval of the site,
+which is SCAN_RESCAN['interval'] shortened for sites in scan lists and for
+popular sites:
+
+    interval / (1 + scan_list_weight * scan lists + views_weight * log2(1 + views))
+
+but not shorter than SCAN_RESCAN['min_interval']. Overdue sites are
+rescanned in the order of next_due, i.e. the most stale site first. The
+scheduler takes only as many sites as the admission control (see
+privacyscore.scanner.admission) is able to admit, so the cost of scheduling
+depends on the capacity of the workers, not on the number of sites.
+"""
+import math
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from privacyscore.backend.models import RescanSchedule, Scan, Site
+from privacyscore.scanner import admission
+
+
+def get_rescan_interval(num_scan_lists: int, views: int) -> timedelta:
+    """Get the time between periodic rescans of a site."""
+    options = settings.SCAN_RESCAN
+    weight = (1 + options['scan_list_weight'] * num_scan_lists +
+              options['views_weight'] * math.log2(1 + max(views, 0)))
+    return max(options['interval'] / weight, options['min_interval'])
+
+
+def reschedule(site: Site, last_scan_end: datetime):
+    """Set the next rescan of a site after a scan finished."""
+    interval = get_rescan_interval(site.scan_lists.count(), site.views)
+    RescanSchedule.objects.update_or_create(
+        site=site, defaults={'next_due': last_scan_end + interval})
+
+
+def schedule_due_rescans(now: datetime = None) -> dict:
+    """
+    Schedule scans of overdue sites up to the capacity of the workers.
+
+    Returns the sites taken by their status code (see Site.scan).
+    """
+    now = now or timezone.now()
+    waiting = Scan.objects.filter(admitted=False).count()
+    batch_size = min(
+        admission.get_capacity() - waiting,
+        settings.SCAN_RESCAN['max_batch_size'])
+    if batch_size <= 0:
+        return {}
+
+    with transaction.atomic():
+        # Lock only the schedules: the last scan of a site is nullable and
+        # can not be locked on the outer side of a join.
+        schedules = list(RescanSchedule.objects.select_for_update(
+            skip_locked=True, of=('self',)).filter(
+            next_due__lte=now).select_related('site').order_by(
+            'next_due')[:batch_size])
+
+        status_codes = Site.bulk_scan(
+            (schedule.site for schedule in schedules), Scan.LANE_BACKGROUND,
+            admit=False)
+        sites = {}
+        for schedule in schedules:
+            sites.setdefault(
+                status_codes[schedule.site.pk], []).append(schedule.site)
+
+        # Retry if the scan does not finish. Finished scans set the next due
+        # time themselves.
+        postpone = {
+            Site.SCAN_OK: settings.SCAN_TOTAL_TIMEOUT,
+            Site.SCAN_COOLDOWN: settings.SCAN_REQUIRED_TIME_BEFORE_NEXT_SCAN,
+            Site.SCAN_BLACKLISTED: settings.SCAN_RESCAN['interval'],
+        }
+        for status_code, status_sites in sites.items():
+            RescanSchedule.objects.filter(site__in=status_sites).update(
+                next_due=now + postpone[status_code])
+
+    if Site.SCAN_OK in sites:
+        admission.admit_scans()
+    return sites
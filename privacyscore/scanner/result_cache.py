@@ -0,0 +1,110 @@
+"""
+Cache for the results of test suites.
+
+Many scans repeat identical work, e.g. thousands of sites share the same mail
+server which is tested by testssl_mx. A test suite can opt in to caching by
+defining an input_fingerprint function with the same signature as its
+test_site function. It returns a string which identifies everything the
+results of the test suite depend on (for instance the hostname and ip address
+of the tested server), or None if the results must not be cached.
+
+Results are only cached for test suites having a TTL configured in
+SCAN_RESULT_CACHE_TTL. The results are stored in the Django cache configured
+by SCAN_RESULT_CACHE, which evicts entries according to its own policy in
+addition to the TTL. The cache has to be shared by all workers of all hosts
+(i.e. redis), otherwise neither results nor leases (see below) are shared
+between hosts.
+
+Cached raw data contains references into the blob store (see
+privacyscore.backend.blobstore) for large objects. An entry referencing
+a blob which has been garbage collected in the meantime is treated as a miss.
+
+Identical runs in flight at the same time are coalesced: the first worker
+takes a lease for the fingerprint and runs the test suite. The tasks of the
+other runs do not block their workers while waiting, they are retried every
+WAIT_INTERVAL seconds until the result appears in the cache. If the lease
+holder fails or the result does not appear within the budget of the test
+suite, the waiting tasks fall back to running the test suite themselves.
+The lease relies on the atomic add operation of the cache backend.
+"""
+import hashlib
+import uuid
+from typing import Union
+
+from django.conf import settings
+from django.core.cache import caches
+
+from privacyscore.backend.blobstore import get_blob_store
+
+
+# Seconds between the checks for the result of an identical run in flight
+WAIT_INTERVAL = 5
+
+
+def get_fingerprint(test_suite, url: str, previous_results: dict,
+                    test_parameters: dict) -> Union[str, None]:
+    """
+    Get the cache key for a run of a test suite or None if its results can
+    not be cached.
+    """
+    if test_suite.test_name not in settings.SCAN_RESULT_CACHE_TTL:
+        return None
+    input_fingerprint = getattr(test_suite, 'input_fingerprint', None)
+    if input_fingerprint is None:
+        return None
+    fingerprint = input_fingerprint(url, previous_results, **test_parameters)
+    if fingerprint is None:
+        return None
+    # the results depend on the test parameters as well
+    fingerprint = '{}|{}'.format(fingerprint, sorted(test_parameters.items()))
+    return 'scan_result:{}:{}'.format(
+        test_suite.test_name,
+        hashlib.sha256(fingerprint.encode()).hexdigest())
+
+
+def get_cached_result(fingerprint: str) -> Union[tuple, None]:
+    """Get the cached raw data and processed result of a test suite run."""
+    cached = caches[settings.SCAN_RESULT_CACHE].get(fingerprint)
+    if cached is None:
+        return None
+    raw_data, processed = cached
+    blob_store = get_blob_store()
+    for raw_elem in raw_data.values():
+        if 'digest' in raw_elem and (
+                blob_store is None or not blob_store.exists(raw_elem['digest'])):
+            return None
+    return raw_data, processed
+
+
+def cache_result(test_name: str, fingerprint: str, raw_data: dict,
+                 processed: dict):
+    """Cache the (offloaded) raw data and processed result of a test suite."""
+    caches[settings.SCAN_RESULT_CACHE].set(
+        fingerprint, (raw_data, processed),
+        settings.SCAN_RESULT_CACHE_TTL[test_name])
+
+
+def acquire_lease(fingerprint: str, timeout: float) -> Union[str, None]:
+    """
+    Try to become the worker running the test suite for a fingerprint.
+    Returns a token to release the lease with or None if another worker holds
+    the lease. The lease expires after timeout seconds.
+    """
+    token = uuid.uuid4().hex
+    if caches[settings.SCAN_RESULT_CACHE].add(
+            fingerprint + ':lease', token, timeout):
+        return token
+    return None
+
+
+def release_lease(fingerprint: str, token: str):
+    """Release a lease unless it has expired and been taken over."""
+    cache = caches[settings.SCAN_RESULT_CACHE]
+    if cache.get(fingerprint + ':lease') == token:
+        cache.delete(fingerprint + ':lease')
+
+
+def is_leased(fingerprint: str) -> bool:
+    """Check whether a worker is running the test suite for a fingerprint."""
+    return caches[settings.SCAN_RESULT_CACHE].get(
+        fingerprint + ':lease') is not None
@@ -0,0 +1,170 @@
+"""
+Supervision of test suites and the external tools they run.
+
+Every external tool a test suite starts through this module runs in its own
+process group, optionally with a CPU time limit which is inherited by all of
+its descendants. When the wall-clock budget of the test suite is exceeded or
+the test suite finishes, only the process groups started for this test suite
+are killed. In contrast to killing all processes of the user, this makes it
+safe to run multiple test suites concurrently on a host.
+
+Code running within the worker process itself is interrupted with
+a TimeoutError if the test suite runs in the main thread. Otherwise, it has
+to rely on its own timeouts.
+
+A test suite which should be run again later (e.g. after a transient
+failure) raises RetryTest instead of sleeping, so the worker is free for
+other test suites in the meantime. get_num_tries tells it which try it is.
+"""
+import os
+import resource
+import signal
+import subprocess
+import threading
+from typing import List, Union
+
+
+_current = threading.local()
+
+
+class RetryTest(Exception):
+    """Run the test suite again after countdown seconds."""
+
+    def __init__(self, message: str = '', countdown: float = 10):
+        super().__init__(message)
+        self.countdown = countdown
+
+
+class SuiteSupervisor:
+    """Enforce the budgets of a single test suite run."""
+
+    def __init__(self, name: str, timeout: float, cpu_seconds: int = None,
+                 num_tries: int = 1):
+        self.name = name
+        self.timeout = timeout
+        self.cpu_seconds = cpu_seconds
+        self.num_tries = num_tries
+        self.timed_out = False
+        self._processes = []  # type: List[subprocess.Popen]
+        # reentrant, as the alarm handler may interrupt its own thread
+        self._lock = threading.RLock()
+        self._timer = None
+        self._previous_handler = None
+
+    def __enter__(self) -> 'SuiteSupervisor':
+        self._previous = get_supervisor()
+        _current.supervisor = self
+        if threading.current_thread() is threading.main_thread():
+            self._previous_handler = signal.signal(
+                signal.SIGALRM, self._handle_alarm)
+            signal.setitimer(signal.ITIMER_REAL, self.timeout)
+        else:
+            self._timer = threading.Timer(self.timeout, self._handle_timeout)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self._timer is not None:
+            self._timer.cancel()
+        else:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self._previous_handler)
+        _current.supervisor = self._previous
+
+        # kill leftovers, i.e. daemonized descendants of the tools
+        self.kill()
+
+        if self.timed_out and not isinstance(exc_value, TimeoutError):
+            raise self._timeout_error()
+
+    def _timeout_error(self) -> TimeoutError:
+        return TimeoutError(
+            'Test suite {} exceeded its time budget of {} seconds.'.format(
+                self.name, self.timeout))
+
+    def _handle_timeout(self):
+        self.timed_out = True
+        self.kill()
+
+    def _handle_alarm(self, signum, frame):
+        self._handle_timeout()
+        raise self._timeout_error()
+
+    def _set_limits(self):
+        """Executed in the child before the tool is started."""
+        resource.setrlimit(
+            resource.RLIMIT_CPU, (self.cpu_seconds, self.cpu_seconds + 5))
+
+    def popen(self, args, **kwargs) -> subprocess.Popen:
+        """Start a tool in a new process group belonging to this test suite."""
+        if self.cpu_seconds is not None:
+            kwargs['preexec_fn'] = self._set_limits
+        # The alarm is held back until the process is registered, so that
+        # the alarm handler does not leave behind a process it can not kill.
+        block_alarm = threading.current_thread() is threading.main_thread()
+        if block_alarm:
+            signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+        try:
+            with self._lock:
+                if self.timed_out:
+                    raise self._timeout_error()
+                process = subprocess.Popen(
+                    args, start_new_session=True, **kwargs)
+                self._processes.append(process)
+        finally:
+            if block_alarm:
+                signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGALRM})
+        return process
+
+    def kill(self):
+        """Kill the process groups of all tools of this test suite."""
+        with self._lock:
+            processes, self._processes = self._processes, []
+        for process in processes:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                # the whole process group is already gone
+                pass
+            process.poll()
+
+
+def get_supervisor() -> Union[SuiteSupervisor, None]:
+    """Get the supervisor of the test suite running in this thread."""
+    return getattr(_current, 'supervisor', None)
+
+
+def get_num_tries() -> int:
+    """Get the number of the current try of the test suite, starting at 1."""
+    supervisor = get_supervisor()
+    if supervisor is None:
+        return 1
+    return supervisor.num_tries
+
+
+def popen(args, **kwargs) -> subprocess.Popen:
+    """
+    Start an external tool. It is supervised if a test suite is running in the
+    current thread.
+    """
+    supervisor = get_supervisor()
+    if supervisor is None:
+        return subprocess.Popen(args, start_new_session=True, **kwargs)
+    return supervisor.popen(args, **kwargs)
+
+
+def call(args, **kwargs) -> int:
+    """Supervised equivalent of subprocess.call."""
+    with popen(args, **kwargs) as process:
+        return process.wait()
+
+
+def check_output(args, **kwargs) -> bytes:
+    """Supervised equivalent of subprocess.check_output."""
+    with popen(args, stdout=subprocess.PIPE, **kwargs) as process:
+        output, _ = process.communicate()
+    if process.returncode:
+        raise subprocess.CalledProcessError(
+            process.returncode, args, output=output)
+    return output
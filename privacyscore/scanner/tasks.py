@@ -1,43 +1,28 @@
-import os
-from getpass import getuser
-import signal
+import time
 import traceback
-from typing import List, Tuple
+from typing import Dict, List, Tuple, Union
 from socket import getfqdn
 
-from celery import chord, shared_task
+from celery import shared_task
+from celery.exceptions import Retry
 from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
 
+from privacyscore.backend import thumbnails
+from privacyscore.scanner import admission, rescans
+from privacyscore.backend.blobstore import offload_raw_data
 from privacyscore.backend.models import RawScanResult, Scan, ScanResult, \
-    ScanError
+    ScanError, ScanSuiteRun
+from privacyscore.evaluation.models import ScanEvaluation
+from privacyscore.scanner.priorities import get_message_priority
+from privacyscore.scanner.result_cache import WAIT_INTERVAL, acquire_lease, \
+    cache_result, get_cached_result, get_fingerprint, is_leased, release_lease
+from privacyscore.scanner.supervisor import RetryTest, SuiteSupervisor
 from privacyscore.scanner.test_suites import AVAILABLE_TEST_SUITES, \
-    TEST_PARAMETERS, SCAN_TEST_SUITE_STAGES
-from privacyscore.utils import get_processes_of_user
-
-
-class Timeout:
-    def __init__(self, seconds=1):
-        self.seconds = seconds
-
-    def __enter__(self):
-        def handle_timeout(signum, frame):
-            # kill all possible processes
-            # TODO: this is a really bad idea
-            # TODO: Especially with multiple worker threads, bad things are inevitable
-            own_procs = get_processes_of_user(getuser())
-            for pid, cmdline in own_procs:
-                # TODO: Argh
-                if '/tests/' not in cmdline:
-                    continue
-                os.kill(pid, 9)
-            raise TimeoutError
-
-        signal.signal(signal.SIGALRM, handle_timeout)
-        signal.alarm(self.seconds)
-
-    def __exit__(self, type, value, traceback):
-        signal.alarm(0)
+    TEST_PARAMETERS, SCAN_TEST_SUITE_ORDER, get_ready_test_suites, \
+    get_test_queue, project_previous_results
+from privacyscore.test_suites.testssl.common import get_batcher
 
 
 @shared_task(queue='master')
@@ -47,77 +32,201 @@ def schedule_scan(scan_pk: int):
     scan.start = timezone.now()
     scan.save()
 
-    # Schedule next stage
-    schedule_scan_stage(
-        (getfqdn(), 'privacyscore.scanner.tasks.schedule_scan', [], {}),
-        {},
-        scan_pk)
+    # Schedule test suites without dependencies
+    schedule_ready_test_suites(scan_pk)
 
 
 @shared_task(queue='master')
-def schedule_scan_stage(new_results: Tuple[list, dict, dict],
-                        previous_results: Tuple[list, dict, dict],
-                        scan_pk: int,
-                        stage: int = 0,
-                        previous_task_count: int = 0):
-    """Schedule the next stage for a scan."""
-    scan = Scan.objects.get(pk=scan_pk)
+def handle_test_result(new_result: Union[tuple, str], scan_pk: int):
+    """
+    Store the result of a single test suite and schedule the test suites
+    which have been waiting for it.
+    """
+    if not Scan.objects.filter(pk=scan_pk).exists():
+        # scan has been aborted in the meantime.
+        return
 
-    if previous_task_count <= 1:
-        new_results = [new_results]
-    raw_data, new_results, errors = _parse_new_results(new_results)
-    previous_results.update(new_results)
+    if isinstance(new_result, (list, tuple)):
+        scan_host, test = new_result[0], new_result[1]
+    else:
+        scan_host, test, _error = new_result.split(':', maxsplit=2)
+    raw_data, result, errors = _parse_new_results([new_result])
 
     # store raw data in database
     for params in raw_data:
-        RawScanResult.store_raw_data(scan_pk=scan_pk, **params)
+        raw_result = RawScanResult.store_raw_data(scan_pk=scan_pk, **params)
+        if raw_result.identifier == thumbnails.SCREENSHOT_IDENTIFIER:
+            create_thumbnail.delay(raw_result.pk)
 
     # store errors in database
     for error in errors:
-        test = None
-        if ':' in error:
-            scan_host, test, error = error.split(':', maxsplit=2)
+        error_host, error_test, error = error.split(':', maxsplit=2)
         ScanError.objects.create(
-            scan_host=scan_host, scan=scan, test=test, error=error)
+            scan_host=error_host, scan_id=scan_pk, test=error_test,
+            error=error)
 
-    if stage >= len(SCAN_TEST_SUITE_STAGES):
-        # all stages finished.
-        handle_finished_scan(scan)
+    ScanSuiteRun.objects.filter(scan_id=scan_pk, test=test).update(
+        scan_host=scan_host, end=timezone.now(), result=result)
 
-        # store final results
-        ScanResult.objects.create(
-            scan=scan, result=previous_results)
+    schedule_ready_test_suites(scan_pk)
 
-        return True
 
-    tasks = []
-    for test_suite in SCAN_TEST_SUITE_STAGES[stage]:
-        tasks.append(run_test.s(test_suite, scan.site.url, previous_results))
-    chord(tasks, schedule_scan_stage.s(previous_results, scan_pk, stage + 1, len(tasks))).apply_async()
+def schedule_ready_test_suites(scan_pk: int):
+    """
+    Schedule all test suites of a scan whose dependencies have finished.
+
+    Each test suite is dispatched as soon as its own dependencies are done,
+    so the duration of a scan is determined by its critical path. Once all
+    test suites have finished, the final result is stored.
+    """
+    with transaction.atomic():
+        # The lock serializes concurrent result callbacks of the same scan.
+        scan = Scan.objects.select_for_update().select_related('site').filter(
+            pk=scan_pk).first()
+        if scan is None or scan.end is not None:
+            # scan has been aborted or finished in the meantime.
+            return
+
+        runs = list(scan.suite_runs.all())
+        finished = {run.test: run for run in runs if run.end is not None}
+        previous_results = _merge_results(finished)
+
+        if len(finished) >= len(SCAN_TEST_SUITE_ORDER):
+            # all test suites finished.
+            handle_finished_scan(scan)
+
+            # store final results
+            ScanResult.objects.create(
+                scan=scan, result=previous_results)
+            # the pages read the stored classifications
+            ScanEvaluation.store(scan, previous_results)
+            return
+
+        tasks = []
+        # the priority of a scan ages while it is running
+        priority = get_message_priority(scan)
+        for test_suite in get_ready_test_suites(
+                finished.keys(), (run.test for run in runs)):
+            ScanSuiteRun.objects.create(scan=scan, test=test_suite)
+            # send only the results the test suite reads; its own results are
+            # sent back as a delta and merged on the master.
+            task = run_test.s(
+                test_suite, scan.site.url,
+                project_previous_results(test_suite, previous_results)).set(
+                queue=get_test_queue(test_suite), priority=priority)
+            task.link(handle_test_result.s(scan_pk).set(priority=priority))
+            tasks.append(task)
+
+        # dispatch only once the runs are visible to the result callbacks
+        transaction.on_commit(lambda: [task.apply_async() for task in tasks])
 
 
 def handle_finished_scan(scan: Scan):
     """
-    Callback when all stages of tasks for a scan are completed.
+    Callback when all test suites of a scan are completed.
     """
     scan.end = timezone.now()
     scan.save()
+    rescans.reschedule(scan.site, scan.end)
 
+    # a slot for a waiting scan is free
+    transaction.on_commit(admit_scans.delay)
 
-@shared_task(queue='slave')
-def run_test(test_suite: str, url: str, previous_results: dict) -> bool:
-    """Run a single test against a single url."""
+
+# The number of tries of a test suite raising RetryTest
+MAX_TRIES = 3
+
+
+# Retries are limited by run_test itself, as waiting for the result of an
+# identical run does not count as a try.
+@shared_task(bind=True, queue='slave', max_retries=None)
+def run_test(self, test_suite: str, url: str, previous_results: dict,
+             num_tries: int = 1, wait_until: float = None) -> bool:
+    """
+    Run a single test against a single url.
+
+    num_tries is the current try of the test suite (see RetryTest).
+    wait_until is the time until which the task waits for the result of an
+    identical run in flight (see privacyscore.scanner.result_cache).
+    """
     test_parameters = TEST_PARAMETERS[test_suite]
+    budget = settings.SCAN_SUITE_BUDGETS.get(test_suite, {})
+    timeout = budget.get('timeout', settings.SCAN_SUITE_TIMEOUT_SECONDS)
     test_suite = AVAILABLE_TEST_SUITES[test_suite]
+    lease = None
     try:
-        with Timeout(settings.SCAN_SUITE_TIMEOUT_SECONDS):
+        fingerprint = get_fingerprint(
+            test_suite, url, previous_results, test_parameters)
+        if fingerprint:
+            cached = get_cached_result(fingerprint)
+            if cached is None:
+                lease = acquire_lease(fingerprint, timeout)
+                if lease is None:
+                    # an identical run is in flight on another worker. Its
+                    # budget bounds the time to wait for its result.
+                    now = time.time()
+                    if wait_until is None:
+                        wait_until = now + timeout
+                    if now < wait_until and is_leased(fingerprint):
+                        raise self.retry(countdown=WAIT_INTERVAL, kwargs={
+                            'num_tries': num_tries, 'wait_until': wait_until})
+                    # the lease has been released in the meantime
+                    cached = get_cached_result(fingerprint)
+            if cached is not None:
+                return (getfqdn(), test_suite.test_name) + cached
+
+        with SuiteSupervisor(
+                test_suite.test_name, timeout, budget.get('cpu_seconds'),
+                num_tries):
             raw_data = test_suite.test_site(
                 url, previous_results, **test_parameters)
             processed = test_suite.process_test_data(
                 raw_data, previous_results, **test_parameters)
-            return getfqdn(), test_suite.test_name, raw_data, processed
+            # only references to large raw data objects are sent back
+            raw_data = offload_raw_data(raw_data)
+            if fingerprint:
+                cache_result(
+                    test_suite.test_name, fingerprint, raw_data, processed)
+            return (getfqdn(), test_suite.test_name, raw_data, processed)
+    except RetryTest as e:
+        if num_tries < MAX_TRIES:
+            # the retry keeps the result callback of this task
+            raise self.retry(countdown=e.countdown, kwargs={
+                'num_tries': num_tries + 1})
+        return ':'.join([getfqdn(), test_suite.test_name, traceback.format_exc()])
+    except Retry:
+        raise
     except Exception as e:
         return ':'.join([getfqdn(), test_suite.test_name, traceback.format_exc()])
+    finally:
+        if lease is not None:
+            release_lease(fingerprint, lease)
+
+
+@shared_task(queue='slave')
+def run_testssl_batch(batch_id: str):
+    """
+    Test the targets of a testssl batch within the budget of the batch (see
+    privacyscore.test_suites.testssl.common.TestsslBatcher).
+    """
+    with SuiteSupervisor('testssl_batch', settings.TESTSSL_BATCH['timeout']):
+        get_batcher().run_batch(batch_id)
+
+
+@shared_task(queue='thumbnail')
+def create_thumbnail(raw_result_pk: int):
+    """Create the thumbnail of a stored screenshot."""
+    screenshot = RawScanResult.objects.filter(pk=raw_result_pk).first()
+    if screenshot is None:
+        # scan has been deleted in the meantime.
+        return
+    thumbnails.create_thumbnail(screenshot)
+
+
+@shared_task(queue='master')
+def admit_scans():
+    """Schedule scans waiting for admission as far as capacity permits."""
+    admission.admit_scans()
 
 
 @shared_task(queue='master')
@@ -127,9 +236,19 @@ def handle_aborted_scans():
     timeout.
     """
     now = timezone.now()
+    # scans waiting for admission have not been started yet
     Scan.objects.filter(
         start__lt=now - settings.SCAN_TOTAL_TIMEOUT,
-        end__isnull=True).delete()
+        end__isnull=True, admitted=True).delete()
+
+
+def _merge_results(finished: Dict[str, ScanSuiteRun]) -> dict:
+    """Merge the results of finished test suites in their topological order."""
+    result = {}
+    for test in SCAN_TEST_SUITE_ORDER:
+        if test in finished and finished[test].result:
+            result.update(finished[test].result)
+    return result
 
 
 def _parse_new_results(previous_results: List[Tuple[list, dict]]) -> tuple:
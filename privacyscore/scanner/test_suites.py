@@ -2,14 +2,19 @@
 This module loads all test suites from the test_suites directory
 and makes them accessible by their name.
 
-In addition, it generates the stages in which to run tests.
+In addition, it generates the dependency graph used to schedule tests.
 """
 import os
 from importlib import import_module
 from sys import stderr
+from typing import Iterable, List
 
 from django.conf import settings
-from toposort import toposort
+from toposort import toposort_flatten
+
+
+# The queue of tests without a queue for their resource class
+DEFAULT_TEST_QUEUE = 'slave'
 
 
 # Collect parameters for tests
@@ -43,12 +48,70 @@ for base_module in settings.TEST_SUITES_BASEMODULES:
         AVAILABLE_TEST_SUITES[test_module.test_name] = test_module
 
 
-# Generate stages based on dependencies.
+# Generate dependency graph. Dependencies on tests which are not configured
+# are ignored as they will never finish.
 TEST_DEPENDENCIES = {}
 for test in (t[0] for t in settings.SCAN_TEST_SUITES):
     if test not in AVAILABLE_TEST_SUITES:
         continue
     TEST_DEPENDENCIES[test] = set(AVAILABLE_TEST_SUITES[test].test_dependencies)
+for test, dependencies in TEST_DEPENDENCIES.items():
+    dependencies.intersection_update(TEST_DEPENDENCIES.keys())
+
+
+# The keys of the previous results each test reads. None means all keys.
+TEST_INPUT_KEYS = {}
+for test in TEST_DEPENDENCIES:
+    input_keys = getattr(AVAILABLE_TEST_SUITES[test], 'test_input_keys', None)
+    TEST_INPUT_KEYS[test] = set(input_keys) if input_keys is not None else None
+
+
+# The resource class of each test. It determines the queue the test is run on.
+TEST_RESOURCE_CLASSES = {}
+for test in TEST_DEPENDENCIES:
+    TEST_RESOURCE_CLASSES[test] = getattr(
+        AVAILABLE_TEST_SUITES[test], 'test_resource_class', None)
+
+
+# A topological order of the tests. Results of tests are merged in this order.
+# This raises a CircularDependencyError for cyclic dependencies.
+SCAN_TEST_SUITE_ORDER = toposort_flatten(TEST_DEPENDENCIES)
+
+
+def get_ready_test_suites(finished: Iterable[str],
+                          dispatched: Iterable[str]) -> List[str]:
+    """
+    Get the tests which have not been dispatched yet and whose dependencies
+    have all finished.
+    """
+    finished = set(finished)
+    dispatched = set(dispatched)
+    return [
+        test for test in SCAN_TEST_SUITE_ORDER
+        if test not in dispatched and TEST_DEPENDENCIES[test] <= finished]
+
+
+def project_previous_results(test: str, previous_results: dict) -> dict:
+    """Restrict the previous results to the keys a test reads."""
+    input_keys = TEST_INPUT_KEYS.get(test)
+    if input_keys is None:
+        return previous_results
+    return {
+        key: value for key, value in previous_results.items()
+        if key in input_keys}
+
+
+def get_test_queue(test: str) -> str:
+    """
+    Get the queue a test is run on. The queue configured for the test itself
+    takes precedence over the queue of its resource class.
+    """
+    if test in settings.SCAN_SUITE_QUEUES:
+        return settings.SCAN_SUITE_QUEUES[test]
+    return settings.SCAN_RESOURCE_CLASS_QUEUES.get(
+        TEST_RESOURCE_CLASSES.get(test), DEFAULT_TEST_QUEUE)
 
 
-SCAN_TEST_SUITE_STAGES = list(toposort(TEST_DEPENDENCIES))
+def get_test_queues() -> set:
+    """Get the queues all tests are run on."""
+    return {get_test_queue(test) for test in TEST_DEPENDENCIES}
@@ -1,3 +1,605 @@
-from django.test import TestCase
+import gc
+import os
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from celery.exceptions import Retry
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from privacyscore.backend.models import BlacklistEntry, RescanSchedule, \
+    Scan, ScanList, ScanSuiteRun, Site
+from privacyscore.scanner import admission, priorities, rescans, \
+    result_cache, supervisor, tasks, test_suites
+from privacyscore.scanner.supervisor import SuiteSupervisor
+from privacyscore.test_suites import network
+
+
+DEPENDENCIES = {
+    'network': set(),
+    'openwpm': {'network'},
+    'testssl_https': {'network'},
+    'testssl_mx': {'network'},
+    'serverleak': {'network', 'openwpm', 'testssl_https', 'testssl_mx'},
+}
+ORDER = ['network', 'openwpm', 'testssl_https', 'testssl_mx', 'serverleak']
+
+
+@mock.patch.object(test_suites, 'TEST_DEPENDENCIES', DEPENDENCIES)
+@mock.patch.object(test_suites, 'SCAN_TEST_SUITE_ORDER', ORDER)
+class ReadyTestSuitesTestCase(TestCase):
+    def test_initial(self):
+        self.assertEqual(test_suites.get_ready_test_suites([], []), ['network'])
+
+    def test_dispatched_not_repeated(self):
+        self.assertEqual(
+            test_suites.get_ready_test_suites([], ['network']), [])
+
+    def test_eager_dispatch(self):
+        self.assertEqual(
+            test_suites.get_ready_test_suites(['network'], ['network']),
+            ['openwpm', 'testssl_https', 'testssl_mx'])
+
+    def test_waits_for_all_dependencies(self):
+        dispatched = ['network', 'openwpm', 'testssl_https', 'testssl_mx']
+        self.assertEqual(test_suites.get_ready_test_suites(
+            ['network', 'openwpm', 'testssl_https'], dispatched), [])
+        self.assertEqual(test_suites.get_ready_test_suites(
+            dispatched, dispatched), ['serverleak'])
+
+
+@mock.patch.object(test_suites, 'TEST_INPUT_KEYS', {
+    'openwpm': {'reachable', 'final_url'},
+    'serverleak': set(),
+    'testssl_mx': None,
+})
+class ProjectPreviousResultsTestCase(TestCase):
+    previous_results = {
+        'reachable': True,
+        'final_url': 'https://example.com/',
+        'requests': [{'url': 'https://example.com/'}] * 100,
+    }
+
+    def test_projection(self):
+        self.assertEqual(
+            test_suites.project_previous_results(
+                'openwpm', self.previous_results),
+            {'reachable': True, 'final_url': 'https://example.com/'})
+
+    def test_no_input_keys(self):
+        self.assertEqual(
+            test_suites.project_previous_results(
+                'serverleak', self.previous_results), {})
+
+    def test_undeclared_input_keys(self):
+        self.assertEqual(
+            test_suites.project_previous_results(
+                'testssl_mx', self.previous_results), self.previous_results)
+
+
+@mock.patch.object(test_suites, 'TEST_RESOURCE_CLASSES', {
+    'network': 'network',
+    'openwpm': 'browser',
+    'testssl_mx': 'cpu',
+    'serverleak': None,
+})
+@override_settings(
+    SCAN_RESOURCE_CLASS_QUEUES={'browser': 'scan_browser', 'cpu': 'scan_cpu'},
+    SCAN_SUITE_QUEUES={'testssl_mx': 'scan_smtp'})
+class GetTestQueueTestCase(TestCase):
+    def test_resource_class(self):
+        self.assertEqual(test_suites.get_test_queue('openwpm'), 'scan_browser')
+
+    def test_suite_override(self):
+        self.assertEqual(test_suites.get_test_queue('testssl_mx'), 'scan_smtp')
+
+    def test_default(self):
+        self.assertEqual(test_suites.get_test_queue('network'), 'slave')
+        self.assertEqual(test_suites.get_test_queue('serverleak'), 'slave')
+
+
+@override_settings(
+    SCAN_LANE_PRIORITIES={'interactive': 9, 'list': 5, 'background': 1},
+    SCAN_PRIORITY_AGING=timedelta(minutes=10),
+    SCAN_THROUGHPUT_PERIOD=timedelta(hours=1))
+class PrioritiesTestCase(TestCase):
+    def _scan(self, lane, age=timedelta(0), end=None):
+        site = Site.objects.create(url='http://{}.example/'.format(
+            Site.objects.count()))
+        return Scan.objects.create(
+            site=site, lane=lane, start=timezone.now() - age, end=end)
+
+    def test_lanes(self):
+        self.assertEqual(priorities.get_message_priority(
+            self._scan(Scan.LANE_INTERACTIVE)), 9)
+        self.assertEqual(priorities.get_message_priority(
+            self._scan(Scan.LANE_BACKGROUND)), 1)
+
+    def test_aging(self):
+        self.assertEqual(priorities.get_message_priority(self._scan(
+            Scan.LANE_BACKGROUND, timedelta(minutes=25))), 3)
+        self.assertEqual(priorities.get_message_priority(self._scan(
+            Scan.LANE_LIST, timedelta(days=1))), 9)
+
+    def test_expected_waits(self):
+        self.assertEqual(priorities.get_expected_waits(), {
+            'interactive': None, 'list': None, 'background': None})
+        for i in range(6):
+            self._scan(Scan.LANE_LIST, end=timezone.now())
+        self._scan(Scan.LANE_INTERACTIVE)
+        self._scan(Scan.LANE_LIST)
+        for i in range(4):
+            self._scan(Scan.LANE_BACKGROUND)
+        self.assertEqual(priorities.get_expected_waits(), {
+            'interactive': timedelta(minutes=10),
+            'list': timedelta(minutes=20),
+            'background': timedelta(minutes=60),
+        })
+
+
+@override_settings(
+    SCAN_LANE_PRIORITIES={'interactive': 9, 'list': 5, 'background': 1},
+    SCAN_ADMISSION={
+        'max_scans': 5, 'scans_per_slot': 2, 'max_queued_per_slot': 4,
+        'capacity_ttl': 60})
+@mock.patch.object(tasks.schedule_scan, 'apply_async')
+class AdmissionTestCase(TestCase):
+    def _scan(self, lane, admitted=False):
+        site = Site.objects.create(url='http://{}.example/'.format(
+            Site.objects.count()))
+        return Scan.objects.create(site=site, lane=lane, admitted=admitted)
+
+    def _admit(self, slots, depth=0):
+        with mock.patch.object(admission, 'get_worker_slots',
+                               return_value=slots), \
+                mock.patch.object(admission, 'get_queue_depth',
+                                  return_value=depth):
+            return admission.admit_scans()
+
+    def test_capacity(self, apply_async):
+        self._scan(Scan.LANE_INTERACTIVE, admitted=True)
+        background = [self._scan(Scan.LANE_BACKGROUND) for i in range(3)]
+        scan_list = [self._scan(Scan.LANE_LIST) for i in range(2)]
+        # 2 slots allow 4 scans in flight
+        self.assertEqual(self._admit(2), 3)
+        admitted = set(Scan.objects.filter(
+            admitted=True, lane=Scan.LANE_BACKGROUND).values_list(
+            'pk', flat=True))
+        # higher lanes first, then in order of creation
+        self.assertEqual(admitted, {background[0].pk})
+        self.assertEqual(Scan.objects.filter(
+            pk__in=[scan.pk for scan in scan_list], admitted=False).count(), 0)
+        self.assertEqual(self._admit(2), 0)
+
+    def test_ceiling(self, apply_async):
+        for i in range(8):
+            self._scan(Scan.LANE_LIST)
+        self.assertEqual(self._admit(None), 5)
+        self.assertEqual(self._admit(100), 0)
+
+    def test_back_pressure(self, apply_async):
+        self._scan(Scan.LANE_LIST)
+        self.assertEqual(self._admit(2, depth=9), 0)
+        self.assertEqual(self._admit(2, depth=8), 1)
+
+    def test_released_on_finish(self, apply_async):
+        running = self._scan(Scan.LANE_LIST, admitted=True)
+        self._scan(Scan.LANE_LIST)
+        with override_settings(SCAN_ADMISSION={
+                'max_scans': 1, 'scans_per_slot': 2, 'max_queued_per_slot': 4,
+                'capacity_ttl': 60}):
+            self.assertEqual(self._admit(None), 0)
+            running.end = timezone.now()
+            running.save()
+            self.assertEqual(self._admit(None), 1)
+
+    def test_start_on_admission(self, apply_async):
+        scan = self._scan(Scan.LANE_LIST)
+        Scan.objects.filter(pk=scan.pk).update(
+            start=timezone.now() - timedelta(days=1))
+        before = timezone.now()
+        with mock.patch.object(admission.transaction, 'on_commit',
+                               lambda callback: callback()):
+            self.assertEqual(self._admit(None), 1)
+        self.assertGreaterEqual(Scan.objects.get(pk=scan.pk).start, before)
+        # the message priority does not age from the creation
+        self.assertEqual(apply_async.call_args[1]['priority'], 5)
+
+    def test_worker_slots_timeout(self, apply_async):
+        cache.delete(admission.SLOTS_KEY)
+        inspect = mock.Mock()
+        inspect.active_queues.return_value = None
+        inspect.stats.return_value = None
+        with mock.patch.object(admission.current_app.control, 'inspect',
+                               return_value=inspect):
+            self.assertIsNone(admission.get_worker_slots())
+        self.assertIsNone(cache.get(admission.SLOTS_KEY))
+
+    def test_worker_slots(self, apply_async):
+        cache.delete(admission.SLOTS_KEY)
+        inspect = mock.Mock()
+        inspect.active_queues.return_value = {
+            'a@host': [{'name': 'slave'}], 'b@host': [{'name': 'master'}]}
+        inspect.stats.return_value = {
+            'a@host': {'pool': {'max-concurrency': 4}},
+            'b@host': {'pool': {'max-concurrency': 8}}}
+        with mock.patch.object(admission.current_app.control, 'inspect',
+                               return_value=inspect), \
+                mock.patch.object(admission, 'get_scan_queues',
+                                  return_value={'slave'}):
+            self.assertEqual(admission.get_worker_slots(), 4)
+        self.assertEqual(cache.get(admission.SLOTS_KEY), 4)
+        cache.delete(admission.SLOTS_KEY)
+
+
+@override_settings(SCAN_RESCAN={
+    'interval': timedelta(days=8), 'min_interval': timedelta(days=1),
+    'scan_list_weight': 0.5, 'views_weight': 0.25, 'max_batch_size': 2})
+@mock.patch.object(tasks.schedule_scan, 'apply_async')
+@mock.patch.object(admission, 'admit_scans')
+class RescansTestCase(TestCase):
+    def test_interval(self, admit_scans, apply_async):
+        self.assertEqual(rescans.get_rescan_interval(0, 0), timedelta(days=8))
+        self.assertEqual(rescans.get_rescan_interval(2, 0), timedelta(days=4))
+        self.assertEqual(rescans.get_rescan_interval(0, 15), timedelta(days=4))
+        self.assertEqual(
+            rescans.get_rescan_interval(10, 1000), timedelta(days=1))
+
+    def test_reschedule(self, admit_scans, apply_async):
+        site = Site.objects.create(url='http://a.example/')
+        site.scan_lists.add(ScanList.objects.create(name='list'))
+        end = timezone.now()
+        rescans.reschedule(site, end)
+        self.assertEqual(
+            RescanSchedule.objects.get(site=site).next_due,
+            end + timedelta(days=8) / 1.5)
+
+    def test_schedule_due_rescans(self, admit_scans, apply_async):
+        now = timezone.now()
+        for i, url in enumerate(('http://blacklisted.com/',
+                                 'http://a.com/', 'http://b.com/',
+                                 'http://c.com/')):
+            RescanSchedule.objects.create(
+                site=Site.objects.create(url=url),
+                next_due=now - timedelta(hours=4 - i))
+        BlacklistEntry.objects.create(url='blacklisted.com')
+        RescanSchedule.objects.create(
+            site=Site.objects.create(url='http://later.com/'),
+            next_due=now + timedelta(hours=1))
+
+        with mock.patch.object(admission, 'get_capacity', return_value=10):
+            sites = rescans.schedule_due_rescans(now)
+        # the most stale sites first
+        self.assertEqual(
+            [site.url for site in sites[Site.SCAN_BLACKLISTED]],
+            ['http://blacklisted.com/'])
+        self.assertEqual(
+            [site.url for site in sites[Site.SCAN_OK]], ['http://a.com/'])
+        self.assertTrue(Scan.objects.filter(
+            site__url='http://a.com/', lane=Scan.LANE_BACKGROUND,
+            admitted=False).exists())
+        admit_scans.assert_called_once_with()
+
+        # the waiting scan takes one slot
+        with mock.patch.object(admission, 'get_capacity', return_value=2):
+            sites = rescans.schedule_due_rescans(now)
+        self.assertEqual(
+            [site.url for site in sites[Site.SCAN_OK]], ['http://b.com/'])
+
+
+class MergeResultsTestCase(TestCase):
+    @mock.patch.object(tasks, 'SCAN_TEST_SUITE_ORDER', ORDER)
+    def test_merge_order(self):
+        finished = {
+            'openwpm': ScanSuiteRun(test='openwpm', result={'a': 2, 'b': 2}),
+            'network': ScanSuiteRun(test='network', result={'a': 1, 'c': 1}),
+            'testssl_mx': ScanSuiteRun(test='testssl_mx', result=None),
+        }
+        self.assertEqual(
+            tasks._merge_results(finished), {'a': 2, 'b': 2, 'c': 1})
+
+
+class SuiteSupervisorTestCase(TestCase):
+    def _alive(self, pid: int) -> bool:
+        try:
+            with open('/proc/{}/stat'.format(pid)) as f:
+                # zombies are dead already
+                return f.read().split(')')[-1].split()[0] != 'Z'
+        except FileNotFoundError:
+            return False
+
+    def test_timeout_kills_descendants(self):
+        start = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            with SuiteSupervisor('test', 0.5):
+                process = supervisor.popen(
+                    ['sh', '-c', 'sleep 30 & echo $!; wait'],
+                    stdout=subprocess.PIPE)
+                grandchild = int(process.stdout.readline())
+                process.wait()
+        self.assertLess(time.monotonic() - start, 10)
+        time.sleep(0.1)
+        self.assertFalse(self._alive(process.pid))
+        self.assertFalse(self._alive(grandchild))
+
+    def test_other_processes_untouched(self):
+        unrelated = subprocess.Popen(['sleep', '30'])
+        try:
+            with self.assertRaises(TimeoutError):
+                with SuiteSupervisor('test', 0.2):
+                    supervisor.call(['sleep', '30'])
+            self.assertIsNone(unrelated.poll())
+        finally:
+            unrelated.kill()
+            unrelated.wait()
+
+    def test_leftovers_killed_on_exit(self):
+        with SuiteSupervisor('test', 10):
+            output = supervisor.check_output(
+                ['sh', '-c', 'sleep 30 >/dev/null 2>&1 & echo $!'])
+        time.sleep(0.1)
+        self.assertFalse(self._alive(int(output)))
+
+    def test_timeout_in_thread(self):
+        errors = []
+
+        def run():
+            try:
+                with SuiteSupervisor('test', 0.2):
+                    supervisor.call(['sleep', '30'])
+            except TimeoutError as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join(10)
+        self.assertEqual(len(errors), 1)
+
+    def test_alarm_while_starting(self):
+        started = []
+        real_popen = subprocess.Popen
+
+        def slow_popen(*args, **kwargs):
+            # the alarm fires while the process is being started
+            time.sleep(0.3)
+            started.append(real_popen(*args, **kwargs))
+            return started[-1]
+
+        with mock.patch.object(supervisor.subprocess, 'Popen', slow_popen):
+            with self.assertRaises(TimeoutError):
+                with SuiteSupervisor('test', 0.1):
+                    supervisor.call(['sleep', '30'])
+        time.sleep(0.1)
+        self.assertEqual(len(started), 1)
+        self.assertFalse(self._alive(started[0].pid))
+
+    def test_cpu_limit(self):
+        with SuiteSupervisor('test', 10, cpu_seconds=1):
+            returncode = supervisor.call(['sh', '-c', 'while :; do :; done'])
+        self.assertIn(-returncode, (signal.SIGXCPU, signal.SIGKILL))
+
+    def test_success(self):
+        with SuiteSupervisor('test', 10):
+            self.assertEqual(supervisor.check_output(['echo', 'foo']), b'foo\n')
+
+
+@override_settings(RAW_DATA_BLOB_STORE=None)
+class RetryTestTestCase(TestCase):
+    def _run(self, test_site):
+        test_suite = SimpleNamespace(
+            test_name='retried', test_site=test_site,
+            process_test_data=lambda raw_data, previous_results: {'a': 1})
+        with mock.patch.dict(tasks.AVAILABLE_TEST_SUITES, retried=test_suite), \
+                mock.patch.dict(tasks.TEST_PARAMETERS, retried={}):
+            return tasks.run_test.apply(
+                args=('retried', 'http://a.example/', {})).get()
+
+    def test_retry(self):
+        tries = []
+
+        def test_site(url, previous_results):
+            tries.append(supervisor.get_num_tries())
+            if len(tries) == 1:
+                raise supervisor.RetryTest('first try', countdown=0)
+            return {}
+
+        self.assertEqual(self._run(test_site)[1:], ('retried', {}, {'a': 1}))
+        self.assertEqual(tries, [1, 2])
+
+    def test_retries_exhausted(self):
+        def test_site(url, previous_results):
+            raise supervisor.RetryTest('always', countdown=0)
+
+        result = self._run(test_site)
+        self.assertIsInstance(result, str)
+        self.assertIn('RetryTest: always', result)
+
+
+@override_settings(
+    SCAN_RESULT_CACHE='default', SCAN_RESULT_CACHE_TTL={'cached': 60},
+    RAW_DATA_BLOB_STORE=None)
+class ResultCacheTestCase(TestCase):
+    test_suite = SimpleNamespace(
+        test_name='cached',
+        input_fingerprint=lambda url, previous_results, **options:
+            previous_results.get('host'))
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_roundtrip(self):
+        fingerprint = result_cache.get_fingerprint(
+            self.test_suite, 'http://a.example/', {'host': 'mx.example'}, {})
+        self.assertIsNone(result_cache.get_cached_result(fingerprint))
+        raw_data = {'jsonresult': {'mime_type': 'text/plain', 'data': b'x'}}
+        result_cache.cache_result('cached', fingerprint, raw_data, {'a': 1})
+        self.assertEqual(
+            result_cache.get_cached_result(fingerprint), (raw_data, {'a': 1}))
+
+    def test_fingerprint(self):
+        fingerprint = result_cache.get_fingerprint(
+            self.test_suite, 'http://a.example/', {'host': 'mx.example'}, {})
+        # shared inputs share the results
+        self.assertEqual(fingerprint, result_cache.get_fingerprint(
+            self.test_suite, 'http://b.example/', {'host': 'mx.example'}, {}))
+        self.assertNotEqual(fingerprint, result_cache.get_fingerprint(
+            self.test_suite, 'http://a.example/', {'host': 'mx2.example'}, {}))
+        self.assertNotEqual(fingerprint, result_cache.get_fingerprint(
+            self.test_suite, 'http://a.example/', {'host': 'mx.example'},
+            {'remote_host': 'foo'}))
+
+    def test_not_cacheable(self):
+        self.assertIsNone(result_cache.get_fingerprint(
+            self.test_suite, 'http://a.example/', {}, {}))
+        self.assertIsNone(result_cache.get_fingerprint(
+            SimpleNamespace(test_name='uncached', input_fingerprint=str),
+            'http://a.example/', {}, {}))
+        self.assertIsNone(result_cache.get_fingerprint(
+            SimpleNamespace(test_name='cached'), 'http://a.example/', {}, {}))
+
+    def test_missing_blob(self):
+        fingerprint = result_cache.get_fingerprint(
+            self.test_suite, 'http://a.example/', {'host': 'mx.example'}, {})
+        raw_data = {'jsonresult': {
+            'mime_type': 'text/plain', 'digest': 'ab' * 32, 'size': 5000}}
+        result_cache.cache_result('cached', fingerprint, raw_data, {'a': 1})
+        self.assertIsNone(result_cache.get_cached_result(fingerprint))
+
+    def test_lease(self):
+        token = result_cache.acquire_lease('fingerprint', 60)
+        self.assertIsNotNone(token)
+        self.assertTrue(result_cache.is_leased('fingerprint'))
+        self.assertIsNone(result_cache.acquire_lease('fingerprint', 60))
+        result_cache.release_lease('fingerprint', token)
+        self.assertFalse(result_cache.is_leased('fingerprint'))
+
+    def test_coalescing(self):
+        runs = []
+
+        def test_site(url, previous_results):
+            runs.append(url)
+            return {'jsonresult': {'mime_type': 'text/plain', 'data': b'x'}}
+
+        test_suite = SimpleNamespace(
+            test_name='cached', test_site=test_site,
+            input_fingerprint=self.test_suite.input_fingerprint,
+            process_test_data=lambda raw_data, previous_results: {'a': 1})
+        fingerprint = result_cache.get_fingerprint(
+            test_suite, 'http://a.example/', {'host': 'mx.example'}, {})
+
+        def run(url):
+            return tasks.run_test.apply(
+                args=('cached', url, {'host': 'mx.example'}))
+
+        with mock.patch.dict(tasks.AVAILABLE_TEST_SUITES, cached=test_suite), \
+                mock.patch.dict(tasks.TEST_PARAMETERS, cached={}), \
+                mock.patch.object(
+                    tasks.run_test, 'retry', side_effect=Retry) as retry:
+            # an identical run is in flight
+            token = result_cache.acquire_lease(fingerprint, 60)
+            self.assertEqual(run('http://a.example/').state, 'RETRY')
+            self.assertEqual(
+                retry.call_args[1]['countdown'], result_cache.WAIT_INTERVAL)
+            self.assertEqual(runs, [])
+
+            # the run in flight finished
+            result_cache.cache_result('cached', fingerprint, {}, {'b': 2})
+            result_cache.release_lease(fingerprint, token)
+            self.assertEqual(
+                run('http://b.example/').get()[1:], ('cached', {}, {'b': 2}))
+            self.assertEqual(runs, [])
+
+    def test_coalescing_expired(self):
+        test_suite = SimpleNamespace(
+            test_name='cached', test_site=lambda url, previous_results: {},
+            input_fingerprint=self.test_suite.input_fingerprint,
+            process_test_data=lambda raw_data, previous_results: {'a': 1})
+        fingerprint = result_cache.get_fingerprint(
+            test_suite, 'http://a.example/', {'host': 'mx.example'}, {})
+        result_cache.acquire_lease(fingerprint, 60)
+        with mock.patch.dict(tasks.AVAILABLE_TEST_SUITES, cached=test_suite), \
+                mock.patch.dict(tasks.TEST_PARAMETERS, cached={}):
+            # waited long enough, run without the lease
+            result = tasks.run_test.apply(
+                args=('cached', 'http://a.example/', {'host': 'mx.example'}),
+                kwargs={'wait_until': time.time() - 1}).get()
+        self.assertEqual(result[1:], ('cached', {}, {'a': 1}))
+
+
+class FakeReader:
+    """A geoip reader mapping the addresses to the content of the file."""
+    def __init__(self, path, mode):
+        with open(path) as f:
+            self.country_name = f.read()
+        self.closed = False
+        self.lookups = 0
+        FakeReader.readers.append(self)
+
+    def country(self, ip):
+        self.lookups += 1
+        return SimpleNamespace(
+            country=SimpleNamespace(name=self.country_name),
+            continent=SimpleNamespace(name=None))
+
+    def close(self):
+        self.closed = True
+
+
+@mock.patch.object(network, 'Reader', FakeReader)
+class GeoIPTestCase(TestCase):
+    def setUp(self):
+        FakeReader.readers = []
+        network._geoip_databases.clear()
+        network._lookup_country.cache_clear()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'country.mmdb')
+        self._write('Germany', 1000)
+
+    def tearDown(self):
+        network._geoip_databases.clear()
+        network._lookup_country.cache_clear()
+        self.directory.cleanup()
+
+    def _write(self, country, mtime):
+        with open(self.path, 'w') as f:
+            f.write(country)
+        os.utime(self.path, (mtime, mtime))
+
+    def test_memoization(self):
+        for _ in range(3):
+            self.assertEqual(network._get_countries(
+                ['192.0.2.1', '192.0.2.2'], self.path), ['Germany'])
+        self.assertEqual(len(FakeReader.readers), 1)
+        self.assertEqual(FakeReader.readers[0].lookups, 2)
+
+    def test_reload(self):
+        self.assertEqual(
+            network._get_countries(['192.0.2.1'], self.path), ['Germany'])
+        self._write('France', 2000)
+        self.assertEqual(
+            network._get_countries(['192.0.2.1'], self.path), ['France'])
+        old, new = FakeReader.readers
+        gc.collect()
+        # the replaced reader is closed once it is unreferenced
+        self.assertTrue(old.closed)
+        self.assertFalse(new.closed)
+
+    def test_reader_in_use(self):
+        database = network._get_geoip_database(self.path)
+        self._write('France', 2000)
+        self.assertEqual(
+            network._get_countries(['192.0.2.1'], self.path), ['France'])
+        gc.collect()
+        # a lookup still using the replaced database keeps it open
+        self.assertFalse(database.reader.closed)
+        self.assertEqual(database.country('192.0.2.1'), 'Germany')
+        del database
+        gc.collect()
+        self.assertTrue(FakeReader.readers[0].closed)
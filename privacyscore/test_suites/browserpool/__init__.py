@@ -0,0 +1,286 @@
+"""
+A pool of warm Chrome instances for the browser based test suites.
+
+Starting Chrome dominates the time needed to scan a single site, so the
+browsers are kept running between visits. Every browser owns a worker slot
+(see privacyscore.utils.get_worker_id) for its whole lifetime, which
+determines its debugging port. Thus, neither the browsers of different
+worker processes of a host nor the browsers of one worker process collide.
+
+Each visit gets its own browser context, which is like a fresh incognito
+profile: cookies, cache and storage of previous visits are not visible and
+everything of the visit is discarded when it ends.
+
+A browser is restarted after max_visits visits, when the resident memory
+of all its processes exceeds max_rss bytes, when it does not respond
+anymore or when the browser context of a visit could not be disposed.
+
+The browsers are started and scanned with the internals of privacyscanner,
+which has no public API to pass a running browser to a scan. Thus,
+privacyscanner is pinned in requirements.txt.
+"""
+import atexit
+import threading
+from contextlib import contextmanager, suppress
+from typing import Iterator, Union
+
+import psutil
+import pychrome
+from django.conf import settings
+from requests.exceptions import RequestException
+
+from privacyscanner.exceptions import RetryScan
+from privacyscanner.filehandlers import NoOpFileHandler
+from privacyscanner.result import Result
+from privacyscanner.scanmodules.chromedevtools import ChromeDevtoolsScanModule, \
+    EXTRACTOR_CLASSES, EXTRACTOR_CLASSES_HTTPS_RUN
+from privacyscanner.scanmodules.chromedevtools.chromescan import ChromeBrowser, \
+    ChromeBrowserStartupError, ChromeScan, DNSNotResolvedError, \
+    NotReachableError, PageScanner
+from privacyscanner.utils import calculate_jaccard_index
+
+from privacyscore.utils import get_worker_id
+
+
+# The timeout for managing the browser contexts of a browser
+TIMEOUT = 10
+
+
+class IsolatedBrowser:
+    """A pychrome.Browser opening its tabs in a separate browser context."""
+
+    def __init__(self, browser: pychrome.Browser, session: pychrome.Tab,
+                 context_id: str, debugging_port: int):
+        self._browser = browser
+        self._session = session
+        self._context_id = context_id
+        self._debugging_port = debugging_port
+
+    def new_tab(self, url: str = None, timeout: float = None) -> pychrome.Tab:
+        target_id = self._session.Target.createTarget(
+            url=url or 'about:blank', browserContextId=self._context_id,
+            _timeout=timeout)['targetId']
+        return pychrome.Tab(
+            id=target_id, type='page',
+            webSocketDebuggerUrl='ws://127.0.0.1:{}/devtools/page/{}'.format(
+                self._debugging_port, target_id))
+
+    def __getattr__(self, name):
+        return getattr(self._browser, name)
+
+
+class PooledBrowser:
+    """A Chrome instance which is reused for many visits."""
+
+    def __init__(self, chrome_executable: str = None, start_port: int = 9222,
+                 profile_directory: str = None):
+        self._worker_id = get_worker_id()
+        self.worker_id = self._worker_id.__enter__()
+        self.debugging_port = start_port + self.worker_id
+        self._chrome = ChromeBrowser(
+            self.debugging_port, chrome_executable, profile_directory)
+        self.visits = 0
+        self.clean = True
+        try:
+            self.browser = self._chrome.__enter__()
+        except Exception:
+            self.stop()
+            raise
+
+    def stop(self):
+        try:
+            if hasattr(self._chrome, '_p'):
+                self._chrome.__exit__(None, None, None)
+        finally:
+            self._worker_id.__exit__(None, None, None)
+
+    @property
+    def pid(self) -> int:
+        """The process id of the browser."""
+        # ChromeBrowser exposes its process only as _p
+        return self._chrome._p.pid
+
+    def rss(self) -> int:
+        """Get the resident memory of all processes of the browser."""
+        rss = 0
+        try:
+            process = psutil.Process(self.pid)
+            for process in [process] + process.children(recursive=True):
+                with suppress(psutil.NoSuchProcess):
+                    rss += process.memory_info().rss
+        except psutil.NoSuchProcess:
+            pass
+        return rss
+
+    def is_alive(self) -> bool:
+        try:
+            self.browser.version()
+            return True
+        except RequestException:
+            return False
+
+    @contextmanager
+    def visit(self) -> Iterator[IsolatedBrowser]:
+        """Get the browser for a single visit in its own browser context."""
+        self.visits += 1
+        self.clean = False
+        # the browser target is required to manage browser contexts
+        session = pychrome.Tab(
+            id='browser', type='browser',
+            webSocketDebuggerUrl=self.browser.version()['webSocketDebuggerUrl'])
+        session.start()
+        try:
+            context_id = session.Target.createBrowserContext(
+                _timeout=TIMEOUT)['browserContextId']
+            try:
+                yield IsolatedBrowser(
+                    self.browser, session, context_id, self.debugging_port)
+            finally:
+                # closes all tabs of the context and discards its data
+                session.Target.disposeBrowserContext(
+                    browserContextId=context_id, _timeout=TIMEOUT)
+                self.clean = True
+        finally:
+            session.stop()
+
+
+class BrowserPool:
+    """The warm browsers of a worker process."""
+
+    def __init__(self, max_visits: int = 50, max_rss: int = None,
+                 browser_class=PooledBrowser, **browser_options):
+        self.max_visits = max_visits
+        self.max_rss = max_rss
+        self._browser_class = browser_class
+        self._browser_options = browser_options
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _get(self) -> PooledBrowser:
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                browser = self._idle.pop()
+            if not self._needs_recycling(browser):
+                return browser
+            browser.stop()
+        return self._browser_class(**self._browser_options)
+
+    def _needs_recycling(self, browser: PooledBrowser) -> bool:
+        return (browser.visits >= self.max_visits or
+                not browser.is_alive() or
+                (self.max_rss is not None and browser.rss() > self.max_rss))
+
+    @contextmanager
+    def visit(self) -> Iterator[IsolatedBrowser]:
+        """
+        Get a warm browser for a single visit. Raises
+        ChromeBrowserStartupError if a new browser can not be started.
+        """
+        browser = self._get()
+        try:
+            with browser.visit() as isolated_browser:
+                yield isolated_browser
+        finally:
+            # Failures of the site itself do not affect other visits as long
+            # as the browser context of the visit could be disposed.
+            if browser.clean:
+                with self._lock:
+                    self._idle.append(browser)
+            else:
+                browser.stop()
+
+    def close(self):
+        """Stop all idle browsers."""
+        with self._lock:
+            browsers, self._idle = self._idle, []
+        for browser in browsers:
+            browser.stop()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """Get the browser pool of this worker process."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool(**settings.BROWSER_POOL)
+            atexit.register(_pool.close)
+        return _pool
+
+
+class PooledChromeScan(ChromeScan):
+    """ChromeScan visiting the site with a browser of a pool."""
+
+    def __init__(self, extractor_classes: list, pool: BrowserPool):
+        super().__init__(extractor_classes)
+        self._pool = pool
+
+    def scan(self, result, logger, options, meta, debugging_port=None) -> Union[bytes, None]:
+        scanner = PageScanner(self._extractor_classes)
+        chrome_error = None
+        content = None
+        try:
+            with self._pool.visit() as browser:
+                content = scanner.scan(browser, result, logger, options)
+        except pychrome.TimeoutException:
+            if meta.is_first_try:
+                raise RetryScan('First timeout with Chrome.')
+            chrome_error = 'timeout'
+        except ChromeBrowserStartupError:
+            if meta.is_first_try:
+                raise RetryScan('Chrome startup problem.')
+            chrome_error = 'startup-problem'
+        except DNSNotResolvedError:
+            if meta.is_first_try:
+                raise RetryScan('DNS could not be resolved.')
+            chrome_error = 'dns-not-resolved'
+        except NotReachableError:
+            if meta.is_first_try:
+                raise RetryScan('Not reachable')
+            logger.exception('Neither responses, nor failed requests.')
+            chrome_error = 'not-reachable'
+        result['chrome_error'] = chrome_error
+        result['reachable'] = not bool(chrome_error)
+        return content
+
+
+class PooledChromeDevtoolsScanModule(ChromeDevtoolsScanModule):
+    """ChromeDevtoolsScanModule using the browsers of a pool."""
+
+    def __init__(self, options: dict, pool: BrowserPool):
+        super().__init__(options)
+        self.pool = pool
+
+    def scan_site(self, result, meta):
+        # Same as ChromeDevtoolsScanModule.scan_site, but with the browsers
+        # of the pool instead of a new browser for each scan.
+        chrome_scan = PooledChromeScan(EXTRACTOR_CLASSES, self.pool)
+        content = chrome_scan.scan(result, self.logger, self.options, meta)
+        if not result['reachable']:
+            return
+        result['https']['same_content'] = None
+        result['https']['same_content_score'] = None
+        if result['site_url'].startswith('http://') and not result['https']['redirects_secure']:
+            # another scan with https but with limited extractors annotates
+            # the http result with TLS details and insecure content details
+            # if there is no redirect to https
+            site_url = 'https://' + result['site_url'][len('http://'):]
+            extra_result = Result({'site_url': site_url}, NoOpFileHandler())
+            chrome_scan = PooledChromeScan(EXTRACTOR_CLASSES_HTTPS_RUN, self.pool)
+            https_content = chrome_scan.scan(
+                extra_result, self.logger, self.options, meta)
+            if not extra_result['reachable']:
+                return
+            similarity = calculate_jaccard_index(content, https_content)
+            same_content = similarity >= self.options['https_same_content_threshold']
+            if same_content:
+                result['insecure_content'] = extra_result['insecure_content']
+                result['https'] = extra_result['https']
+                result['https']['redirects_secure'] = False
+            result['https']['same_content_score'] = similarity
+            result['https']['same_content'] = same_content
@@ -0,0 +1,124 @@
+import shutil
+from unittest import skipUnless
+
+from django.test import TestCase
+
+from privacyscore.test_suites.browserpool import BrowserPool, PooledBrowser
+from privacyscore.utils import get_worker_id
+
+
+class FakeBrowser:
+    started = []
+
+    def __init__(self, rss=0):
+        self.visits = 0
+        self.clean = True
+        self.stopped = False
+        self.alive = True
+        self.fail_cleanup = False
+        self._rss = rss
+        FakeBrowser.started.append(self)
+
+    def stop(self):
+        self.stopped = True
+
+    def rss(self):
+        return self._rss
+
+    def is_alive(self):
+        return self.alive
+
+    def visit(self):
+        browser = self
+
+        class Visit:
+            def __enter__(self):
+                browser.visits += 1
+                browser.clean = False
+                return browser
+
+            def __exit__(self, *args):
+                if browser.fail_cleanup:
+                    raise ValueError('cleanup failed')
+                browser.clean = True
+
+        return Visit()
+
+
+class BrowserPoolTestCase(TestCase):
+    def setUp(self):
+        FakeBrowser.started = []
+
+    def _visit(self, pool):
+        with pool.visit() as browser:
+            return browser
+
+    def test_reuse(self):
+        pool = BrowserPool(max_visits=3, browser_class=FakeBrowser)
+        browsers = [self._visit(pool) for _ in range(5)]
+        self.assertEqual(len(FakeBrowser.started), 2)
+        self.assertEqual(browsers[:3], [FakeBrowser.started[0]] * 3)
+        self.assertTrue(FakeBrowser.started[0].stopped)
+        self.assertFalse(FakeBrowser.started[1].stopped)
+
+    def test_memory_limit(self):
+        pool = BrowserPool(max_rss=100, browser_class=FakeBrowser, rss=200)
+        self._visit(pool)
+        self._visit(pool)
+        self.assertEqual(len(FakeBrowser.started), 2)
+        self.assertTrue(FakeBrowser.started[0].stopped)
+
+    def test_dead_browser(self):
+        pool = BrowserPool(browser_class=FakeBrowser)
+        self._visit(pool).alive = False
+        self._visit(pool)
+        self.assertEqual(len(FakeBrowser.started), 2)
+
+    def test_concurrent_visits(self):
+        pool = BrowserPool(browser_class=FakeBrowser)
+        with pool.visit() as first, pool.visit() as second:
+            self.assertIsNot(first, second)
+        self.assertIn(self._visit(pool), (first, second))
+        self.assertEqual(len(FakeBrowser.started), 2)
+
+    def test_failed_visit(self):
+        pool = BrowserPool(browser_class=FakeBrowser)
+        with self.assertRaises(ValueError):
+            with pool.visit():
+                raise ValueError
+        # the browser context of the visit was disposed
+        self.assertIs(self._visit(pool), FakeBrowser.started[0])
+
+    def test_failed_cleanup(self):
+        pool = BrowserPool(browser_class=FakeBrowser)
+        self._visit(pool).fail_cleanup = True
+        with self.assertRaises(ValueError):
+            self._visit(pool)
+        self.assertTrue(FakeBrowser.started[0].stopped)
+        self.assertIsNot(self._visit(pool), FakeBrowser.started[0])
+
+
+class WorkerSlotTestCase(TestCase):
+    def test_same_process(self):
+        with get_worker_id('worker-ids-test') as first, \
+                get_worker_id('worker-ids-test') as second:
+            self.assertNotEqual(first, second)
+        with get_worker_id('worker-ids-test') as third:
+            self.assertEqual(third, 0)
+
+    @skipUnless(
+        shutil.which('google-chrome') or shutil.which('chromium') or
+        shutil.which('chromium-browser'), 'Chrome is not installed')
+    def test_browsers_of_same_process(self):
+        first = PooledBrowser()
+        try:
+            second = PooledBrowser()
+            try:
+                self.assertNotEqual(first.debugging_port, second.debugging_port)
+                self.assertNotEqual(first.pid, second.pid)
+                self.assertTrue(first.is_alive())
+                self.assertTrue(second.is_alive())
+            finally:
+                second.stop()
+        finally:
+            first.stop()
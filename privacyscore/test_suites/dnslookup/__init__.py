@@ -0,0 +1,235 @@
+"""
+Asynchronous, cached DNS resolution for the test suites.
+
+All lookups required for a site are run concurrently: the cname, a and mx
+lookups of the hostname at once, followed by the a lookups of all mail
+servers and the reverse lookups of all addresses. Every query has its own
+timeout; a failed or timed out query yields an empty result just like an
+NXDOMAIN answer.
+
+Answers are cached in the Django cache configured by DNS_CACHE, which is
+shared by all suites and scans using it (i.e. all workers of a host with
+a local memcached). Positive answers are cached for their TTL, negative
+answers (NXDOMAIN and empty answers) for the negative caching TTL of their
+zone (RFC 2308), both bounded by DNS_CACHE_MAX_TTL. Failed or timed out
+queries are not cached. The names are hashed in the cache keys, as domain
+names may exceed the key length limit of memcached.
+
+Counting the hits and misses of the cache costs a round trip to the cache
+per query, so the counters are only maintained with DNS_CACHE_STATS.
+"""
+import asyncio
+import hashlib
+from typing import Dict, Iterable, List, Tuple, Union
+
+from django.conf import settings
+from django.core.cache import BaseCache, caches
+from dns import asyncresolver, rdata, rdataclass, rdatatype, reversename
+from dns.exception import DNSException
+from dns.resolver import NXDOMAIN, NoAnswer
+
+
+QUERY_TIMEOUT = 5
+
+# keys of the shared hit and miss counters
+HITS_KEY = 'dns:stats:hits'
+MISSES_KEY = 'dns:stats:misses'
+
+
+def get_dns_cache() -> Union[BaseCache, None]:
+    """Get the configured DNS cache or None if caching is disabled."""
+    if settings.DNS_CACHE is None:
+        return None
+    return caches[settings.DNS_CACHE]
+
+
+def get_dns_cache_stats(cache: BaseCache = None) -> Dict[str, int]:
+    """
+    Get the hit and miss counters of the DNS cache. They are only counted
+    with DNS_CACHE_STATS.
+    """
+    if cache is None:
+        cache = get_dns_cache()
+    if cache is None:
+        return {'hits': 0, 'misses': 0}
+    return {
+        'hits': cache.get(HITS_KEY, 0),
+        'misses': cache.get(MISSES_KEY, 0),
+    }
+
+
+def _get_cache_key(name: str, rdtype: str) -> str:
+    return 'dns:{}:{}'.format(rdtype, hashlib.sha256(
+        name.lower().rstrip('.').encode()).hexdigest())
+
+
+def _count(cache: BaseCache, key: str):
+    if not settings.DNS_CACHE_STATS:
+        return
+    try:
+        cache.incr(key)
+    except ValueError:
+        # the counter does not exist yet
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def _negative_ttl(exception: DNSException) -> int:
+    """Get the negative caching TTL from the SOA record of an answer."""
+    if isinstance(exception, NXDOMAIN):
+        responses = exception.responses().values()
+    else:
+        responses = [exception.response()]
+    for response in responses:
+        for rrset in response.authority:
+            if rrset.rdtype == rdatatype.SOA:
+                return min(rrset.ttl, rrset[0].minimum)
+    return settings.DNS_CACHE_NEGATIVE_TTL
+
+
+class SiteResolver:
+    """Resolve the DNS records of sites."""
+
+    def __init__(self, timeout: float = QUERY_TIMEOUT, nameservers: List[str] = None,
+                 port: int = 53, cache: BaseCache = None):
+        self.timeout = timeout
+        self.cache = cache
+        if nameservers is None:
+            self.resolver = asyncresolver.Resolver()
+        else:
+            self.resolver = asyncresolver.Resolver(configure=False)
+            self.resolver.nameservers = nameservers
+            self.resolver.port = port
+        self.resolver.lifetime = timeout
+
+    async def _query(self, name: str, rdtype: str) -> list:
+        if self.cache is None:
+            return (await self._resolve(name, rdtype))[0]
+
+        key = _get_cache_key(name, rdtype)
+        cached = self.cache.get(key)
+        if cached is not None:
+            _count(self.cache, HITS_KEY)
+            return [rdata.from_text(rdataclass.IN, rdtype, text)
+                    for text in cached]
+        _count(self.cache, MISSES_KEY)
+
+        answer, ttl = await self._resolve(name, rdtype)
+        if ttl is not None:
+            self.cache.set(
+                key, [record.to_text() for record in answer],
+                min(ttl, settings.DNS_CACHE_MAX_TTL))
+        return answer
+
+    async def _resolve(self, name: str, rdtype: str) -> Tuple[list, Union[int, None]]:
+        """Query a record. Returns the answer and the TTL to cache it for."""
+        try:
+            answer = await asyncio.wait_for(
+                self.resolver.resolve(name, rdtype), self.timeout)
+            return list(answer), answer.rrset.ttl
+        except (NXDOMAIN, NoAnswer) as e:
+            return [], _negative_ttl(e)
+        except (DNSException, asyncio.TimeoutError):
+            return [], None
+
+    async def a_lookup(self, name: str) -> List[str]:
+        return [e.address for e in await self._query(name, 'A')]
+
+    async def cname_lookup(self, name: str) -> List[str]:
+        return [e.to_text()[:-1].lower()
+                for e in await self._query(name, 'CNAME')]
+
+    async def mx_lookup(self, name: str) -> List[Tuple[int, str]]:
+        return sorted([(e.preference, e.exchange.to_text()[:-1].lower())
+                       for e in await self._query(name, 'MX')],
+                      key=lambda v: v[0])
+
+    async def reverse_lookup(self, ip: str) -> List[str]:
+        try:
+            address = reversename.from_address(ip).to_text()
+        except (DNSException, ValueError):
+            return []
+        return [rev.to_text()[:-1].lower()
+                for rev in await self._query(address, 'PTR')]
+
+    async def resolve_site(self, hostname: str) -> dict:
+        """
+        Resolve all records of a site. The result has the same structure as
+        the general result of the network test suite.
+        """
+        mx_lookups = [self.mx_lookup(hostname)]
+        if hostname.startswith('www.'):
+            mx_lookups.append(self.mx_lookup(hostname[4:]))
+        cname_records, a_records, *mx_records = await asyncio.gather(
+            self.cname_lookup(hostname), self.a_lookup(hostname), *mx_lookups)
+        mx_records = [mx for records in mx_records for mx in records]
+
+        # the a records of the mail servers and the reverse records of the
+        # site can be looked up at the same time
+        mx_a_lookups = asyncio.gather(
+            *(self.a_lookup(mx) for _pref, mx in mx_records))
+        a_reverse_lookups = asyncio.gather(
+            *(self.reverse_lookup(a) for a in a_records))
+        mx_a_records, a_records_reverse = await asyncio.gather(
+            mx_a_lookups, a_reverse_lookups)
+        mx_a_records = [
+            (pref, mx_a) for (pref, _mx), mx_a in zip(mx_records, mx_a_records)]
+
+        mx_a_records_reverse = await asyncio.gather(*(
+            self._reverse_lookups(pref, mx_a) for pref, mx_a in mx_a_records))
+
+        return {
+            'cname_records': cname_records,
+            'a_records': a_records,
+            'mx_records': mx_records,
+            'mx_a_records': mx_a_records,
+            'a_records_reverse': a_records_reverse,
+            'mx_a_records_reverse': mx_a_records_reverse,
+        }
+
+    async def _reverse_lookups(self, pref: int, addresses: List[str]) -> tuple:
+        return pref, list(await asyncio.gather(
+            *(self.reverse_lookup(a) for a in addresses)))
+
+    async def resolve_sites(self, hostnames: Iterable[str],
+                            max_concurrency: int = 50) -> Dict[str, dict]:
+        """Resolve the records of many sites at once."""
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def resolve(hostname):
+            async with semaphore:
+                return hostname, await self.resolve_site(hostname)
+
+        return dict(await asyncio.gather(*(
+            resolve(hostname) for hostname in set(hostnames))))
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def _get_resolver(**kwargs) -> SiteResolver:
+    if 'cache' not in kwargs:
+        kwargs['cache'] = get_dns_cache()
+    return SiteResolver(**kwargs)
+
+
+def a_lookup(name: str, **kwargs) -> List[str]:
+    """Look up the a records of a name."""
+    return _run(_get_resolver(**kwargs).a_lookup(name))
+
+
+def resolve_site(hostname: str, **kwargs) -> dict:
+    """Resolve all records of a site. See SiteResolver.resolve_site."""
+    return _run(_get_resolver(**kwargs).resolve_site(hostname))
+
+
+def resolve_sites(hostnames: Iterable[str], max_concurrency: int = 50,
+                  **kwargs) -> Dict[str, dict]:
+    """Resolve all records of many sites. See SiteResolver.resolve_sites."""
+    return _run(_get_resolver(**kwargs).resolve_sites(
+        hostnames, max_concurrency))
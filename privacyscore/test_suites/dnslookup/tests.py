@@ -0,0 +1,157 @@
+import socket
+import threading
+from unittest import mock
+
+import dns.message
+import dns.rcode
+import dns.rdatatype
+import dns.rrset
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import TestCase, override_settings
+
+from privacyscore.test_suites.dnslookup import _get_cache_key, \
+    get_dns_cache_stats, resolve_site, resolve_sites
+
+
+ZONE = {
+    ('www.example.com.', 'CNAME'): ['web.example.com.'],
+    ('www.example.com.', 'A'): ['192.0.2.1'],
+    ('www.example.com.', 'MX'): ['20 mx2.example.com.', '10 mx1.example.com.'],
+    ('example.com.', 'MX'): ['30 mx3.example.net.'],
+    ('example.com.', 'A'): ['192.0.2.9'],
+    ('mx1.example.com.', 'A'): ['192.0.2.10'],
+    ('mx2.example.com.', 'A'): ['192.0.2.20'],
+    ('1.2.0.192.in-addr.arpa.', 'PTR'): ['web1.example.com.'],
+    ('10.2.0.192.in-addr.arpa.', 'PTR'): ['mx1.example.com.'],
+}
+
+
+class StubDNSServer:
+    """A DNS server answering from a static zone on a local port."""
+
+    def __init__(self, zone: dict, drop: set = ()):
+        self.zone = zone
+        self.drop = drop
+        self.queries = []
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.port = self.socket.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                wire, address = self.socket.recvfrom(4096)
+            except OSError:
+                # socket closed
+                return
+            query = dns.message.from_wire(wire)
+            question = query.question[0]
+            name = question.name.to_text()
+            rdtype = dns.rdatatype.to_text(question.rdtype)
+            self.queries.append((name, rdtype))
+            if name in self.drop:
+                continue
+            response = dns.message.make_response(query)
+            records = self.zone.get((name, rdtype))
+            if records:
+                response.answer.append(dns.rrset.from_text_list(
+                    name, 300, 'IN', rdtype, records))
+            else:
+                response.set_rcode(dns.rcode.NXDOMAIN)
+                response.authority.append(dns.rrset.from_text(
+                    'example.com.', 120, 'IN', 'SOA',
+                    'ns.example.com. hostmaster.example.com. 1 7200 900 1209600 60'))
+            self.socket.sendto(response.to_wire(), address)
+
+    def close(self):
+        self.socket.close()
+
+
+class ResolveSiteTestCase(TestCase):
+    def setUp(self):
+        self.server = StubDNSServer(ZONE, drop={'example.com.'})
+        self.options = {
+            'nameservers': ['127.0.0.1'], 'port': self.server.port,
+            'timeout': 0.5, 'cache': None}
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_resolve_site(self):
+        self.assertEqual(resolve_site('www.example.com', **self.options), {
+            'cname_records': ['web.example.com'],
+            'a_records': ['192.0.2.1'],
+            # the mx lookup of example.com times out
+            'mx_records': [(10, 'mx1.example.com'), (20, 'mx2.example.com')],
+            'mx_a_records': [(10, ['192.0.2.10']), (20, ['192.0.2.20'])],
+            'a_records_reverse': [['web1.example.com']],
+            'mx_a_records_reverse': [
+                (10, [['mx1.example.com']]), (20, [[]])],
+        })
+
+    def test_nxdomain(self):
+        result = resolve_site('unknown.example.com', **self.options)
+        self.assertEqual(result['a_records'], [])
+        self.assertEqual(result['mx_records'], [])
+
+    def test_resolve_sites(self):
+        results = resolve_sites(
+            ['www.example.com', 'mx1.example.com'], **self.options)
+        self.assertEqual(results['mx1.example.com']['a_records'], ['192.0.2.10'])
+        self.assertEqual(len(results['www.example.com']['mx_records']), 2)
+
+
+@override_settings(DNS_CACHE_MAX_TTL=3600, DNS_CACHE_NEGATIVE_TTL=300)
+class DNSCacheTestCase(TestCase):
+    def setUp(self):
+        self.server = StubDNSServer(ZONE, drop={'example.com.'})
+        self.cache = LocMemCache('dns', {})
+        self.options = {
+            'nameservers': ['127.0.0.1'], 'port': self.server.port,
+            'timeout': 0.5, 'cache': self.cache}
+
+    def tearDown(self):
+        self.server.close()
+        self.cache.clear()
+
+    @override_settings(DNS_CACHE_STATS=True)
+    def test_cached(self):
+        first = resolve_site('www.example.com', **self.options)
+        queries = len(self.server.queries)
+        self.assertEqual(resolve_site('www.example.com', **self.options), first)
+        # only the timed out query is repeated
+        self.assertEqual(
+            self.server.queries[queries:], [('example.com.', 'MX')])
+        stats = get_dns_cache_stats(self.cache)
+        self.assertEqual(stats['misses'], queries + 1)
+        self.assertEqual(stats['hits'], queries - 1)
+
+    def test_ttl(self):
+        with mock.patch.object(self.cache, 'set', wraps=self.cache.set) as set:
+            resolve_site('mx1.example.com', **self.options)
+        ttls = {call[0][0]: call[0][2] for call in set.call_args_list}
+        self.assertEqual(ttls[_get_cache_key('mx1.example.com', 'A')], 300)
+        # negative answers are cached for the minimum of the SOA
+        mx_key = _get_cache_key('mx1.example.com.', 'MX')
+        self.assertEqual(ttls[mx_key], 60)
+        self.assertEqual(self.cache.get(mx_key), [])
+
+    def test_no_stats(self):
+        resolve_site('www.example.com', **self.options)
+        resolve_site('www.example.com', **self.options)
+        self.assertEqual(
+            get_dns_cache_stats(self.cache), {'hits': 0, 'misses': 0})
+
+    def test_key_length(self):
+        key = _get_cache_key('{}.example.com'.format('a' * 63 * 4), 'A')
+        self.assertLessEqual(len(key), 250)
+        self.assertEqual(key, _get_cache_key('A' * 252 + '.EXAMPLE.COM.', 'A'))
+
+    @override_settings(DNS_CACHE_MAX_TTL=10)
+    def test_max_ttl(self):
+        with mock.patch.object(self.cache, 'set', wraps=self.cache.set) as set:
+            resolve_site('mx1.example.com', **self.options)
+        self.assertEqual(
+            {call[0][2] for call in set.call_args_list}, {10})
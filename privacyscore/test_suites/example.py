@@ -10,6 +10,19 @@ A test must declare a test_dependencies list containing the test_name of all
 tests that need to be run before the test itself (and thus the results of that
 tests are provided within the previous_results dictionary).
 If a test does not have dependencies, an empty list should be supplied.
+
+A test should declare a test_input_keys list containing all keys of the
+previous_results dictionary it reads. Only those keys are sent to the worker
+running the test. If test_input_keys is not supplied, the test gets all
+previous results.
+
+A test should declare its test_resource_class, the resource limiting how
+many instances of the test a worker host can run at once: cpu, browser or
+network (i.e. waiting for the network most of the time). Tests are routed to
+the queue of their resource class (see SCAN_RESOURCE_CLASS_QUEUES).
+
+A test may define an input_fingerprint function to allow caching of its
+results. See its docstring below.
 """
 # Copyright (C) 2017 PrivacyScore Contributors
 # 
@@ -31,6 +44,8 @@ from typing import Dict, Union
 
 test_name = 'example'
 test_dependencies = ['another_example', 'foobar']
+test_input_keys = ['foo', 'bar']
+test_resource_class = 'network'
 
 
 def test_site(url: str, previous_results: dict, **options) -> Dict[str, Dict[str, Union[str, bytes]]]:
@@ -43,9 +58,9 @@ def test_site(url: str, previous_results: dict, **options) -> Dict[str, Dict[str
 
     It always gets the following positional arguments:
     * The url. This is the url of the site which should be tested.
-    * A dictionary containing the *processed* results of all tests from
-      previous test stages. If there have not been any tests yielding results
-      in a previous stage, the dictionary is empty.
+    * A dictionary containing the *processed* results of all tests the test
+      depends on, restricted to the keys listed in test_input_keys. If there
+      have not been any tests yielding results, the dictionary is empty.
 
     In addition, a test function can get arbitrary parameters. The values
     for those parameters can then be specified in the settings where the test
@@ -73,6 +88,21 @@ def test_site(url: str, previous_results: dict, **options) -> Dict[str, Dict[str
     }
 
 
+def input_fingerprint(url: str, previous_results: dict, **options) -> Union[str, None]:
+    """
+    The input fingerprint function is optional. It gets the same arguments as
+    the test function and returns a string identifying all inputs the results
+    of the test depend on, for instance the hostname and ip address of the
+    tested server. The test parameters are taken into account automatically.
+
+    If the fingerprint equals the one of a previous run whose results are
+    still cached (see SCAN_RESULT_CACHE_TTL), the cached raw data and processed
+    results are reused instead of running the test again. If None is returned,
+    the test is always run.
+    """
+    return 'example.com 93.184.216.34'
+
+
 def process_test_data(raw_data: list, previous_results: dict, **options) -> Dict[str, Dict[str, object]]:
     """
     The task of the process function is to evaluate the raw data collected
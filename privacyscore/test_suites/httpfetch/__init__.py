@@ -0,0 +1,193 @@
+"""
+Retrieval of the final url and content of a site.
+
+Sites are fetched in-process with a connection pool per thread, following
+redirects like wget did before. The size of the retrieved content is capped
+and the whole retrieval including all redirects has a time budget: every
+request of the retrieval gets the remaining time as its connect and read
+timeout, and the connection is shut down when the budget is exceeded while
+a body is read. The redirects are followed by hand, so that their bodies
+are read under the same size cap and time budget as the final content.
+Only a server sending the headers of a response very slowly can delay the
+retrieval beyond its budget; the wall-clock budget of the test suite (see
+privacyscore.scanner.supervisor) still applies then.
+
+retrieve_url returns a tuple (final_url, content, http_error) with the same
+semantics as the wget based retrieval it replaces (see the benchmarkfetch
+management command):
+* If the final response has an error status, http_error contains the error
+  as reported by wget (i.e. 'ERROR 404: Not Found.') and final_url and
+  content are None.
+* Otherwise, final_url is the url after following all redirects and content
+  the body of the final response.
+* If the site is unreachable, a RequestException is raised.
+"""
+import threading
+import time
+from contextlib import suppress
+from typing import List, Tuple, Union
+from urllib.parse import urljoin, urlparse
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from requests.cookies import extract_cookies_to_jar
+from requests.exceptions import RequestException, Timeout, TooManyRedirects
+from requests.utils import requote_uri
+
+
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64; rv:53.0) Gecko/20100101 Firefox/53.0'
+
+# The time budget for retrieving a url including all redirects
+TIMEOUT = 15
+
+# The maximum number of bytes of content retrieved
+MAX_CONTENT_SIZE = 10 * 1024 * 1024
+
+# wget follows at most 20 redirects as well
+MAX_REDIRECTS = 20
+
+
+# certificates are not checked, like with wget --no-check-certificate
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+
+_local = threading.local()
+
+
+def _get_session() -> requests.Session:
+    """Get the session of the current thread."""
+    session = getattr(_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        session.headers['User-Agent'] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=20, pool_maxsize=4)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _local.session = session
+    return session
+
+
+def retrieve_url(url: str, timeout: float = TIMEOUT,
+                 max_size: int = MAX_CONTENT_SIZE) -> Tuple[Union[str, None], Union[bytes, None], Union[str, None]]:
+    """
+    Retrieve a url following redirects. See the module documentation for the
+    returned tuple.
+    """
+    deadline = time.monotonic() + timeout
+    session = _get_session()
+    # every site starts without cookies
+    session.cookies.clear()
+
+    # all responses of the retrieval, shut down by the watchdog when the
+    # time budget is exceeded while reading a body
+    responses = []
+    watchdog = threading.Timer(timeout, _abort, (responses,))
+    watchdog.daemon = True
+    watchdog.start()
+    try:
+        # redirects are followed one by one to pass the remaining time to
+        # each request
+        request = session.prepare_request(requests.Request('GET', url))
+        num_redirects = 0
+        while True:
+            response = _send(session, request, deadline)
+            responses.append(response)
+            if not response.is_redirect:
+                break
+            num_redirects += 1
+            if num_redirects > MAX_REDIRECTS:
+                response.close()
+                raise TooManyRedirects(
+                    'Exceeded {} redirects.'.format(MAX_REDIRECTS))
+            request = _next_request(session, response)
+            with response:
+                # drain the body to reuse the connection
+                _read(response, deadline, max_size)
+
+        with response:
+            if response.status_code >= 400:
+                return None, None, 'ERROR {}: {}.'.format(
+                    response.status_code, response.reason)
+            content = _read(response, deadline, max_size)
+    except RequestException:
+        # the connection has been shut down by the watchdog
+        _check_deadline(deadline)
+        raise
+    finally:
+        watchdog.cancel()
+    return response.url, content, None
+
+
+def _send(session: requests.Session, request: requests.PreparedRequest,
+          deadline: float) -> requests.Response:
+    """
+    Send a request without following redirects. Session.send is not used, as
+    it reads the body of a redirect to prepare the next request.
+    """
+    proxies = session.merge_environment_settings(
+        request.url, {}, False, False, None)['proxies']
+    response = session.get_adapter(request.url).send(
+        request, stream=True, verify=False, proxies=proxies,
+        timeout=_remaining(deadline))
+    extract_cookies_to_jar(session.cookies, request, response.raw)
+    return response
+
+
+def _read(response: requests.Response, deadline: float, max_size: int) -> bytes:
+    """Read at most max_size bytes of the body of a response."""
+    content = bytearray()
+    for chunk in response.iter_content(64 * 1024):
+        _check_deadline(deadline)
+        content += chunk[:max_size - len(content)]
+        if len(content) >= max_size:
+            break
+    # the watchdog may have cut the content off
+    _check_deadline(deadline)
+    return bytes(content)
+
+
+def _next_request(session: requests.Session,
+                  response: requests.Response) -> requests.PreparedRequest:
+    """
+    Build the request following a redirect like requests does, but without
+    reading the body of the redirect.
+    """
+    location = session.get_redirect_target(response)
+    if location.startswith('//'):
+        # scheme-relative location
+        location = '{}:{}'.format(urlparse(response.url).scheme, location)
+    request = response.request.copy()
+    request.url = requote_uri(urljoin(response.url, location))
+    session.rebuild_method(request, response)
+    if response.status_code not in (307, 308):
+        # the body is dropped with the change of the method
+        for header in ('Content-Length', 'Content-Type', 'Transfer-Encoding'):
+            request.headers.pop(header, None)
+        request.body = None
+    # the cookies of the redirect are in the session by now (see _send)
+    request.headers.pop('Cookie', None)
+    request.prepare_cookies(session.cookies)
+    session.rebuild_auth(request, response)
+    return request
+
+
+def _remaining(deadline: float) -> float:
+    """Get the time left until the deadline."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise Timeout('Time budget for retrieving the url exceeded.')
+    return remaining
+
+
+def _check_deadline(deadline: float):
+    if time.monotonic() > deadline:
+        raise Timeout('Time budget for retrieving the url exceeded.')
+
+
+def _abort(responses: List[requests.Response]):
+    """Abort reading the responses by shutting their connections down."""
+    for response in responses:
+        with suppress(OSError, RuntimeError, ValueError):
+            # unblocks a read in another thread
+            response.raw.shutdown()
@@ -0,0 +1,137 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from django.test import TestCase
+from requests.exceptions import ConnectionError, Timeout
+
+from privacyscore.test_suites.httpfetch import retrieve_url
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/target')
+            self.end_headers()
+        elif self.path == '/target':
+            self._send(b'<html>target</html>')
+        elif self.path == '/redirect-large':
+            self.send_response(302)
+            self.send_header('Location', '//127.0.0.1:{}/target'.format(
+                self.server.server_port))
+            self.send_header('Content-Length', '100000')
+            self.end_headers()
+            self.wfile.write(b'x' * 100000)
+        elif self.path == '/redirect-trickle':
+            self.send_response(302)
+            self.send_header('Location', '/target')
+            self.send_header('Content-Length', '1000')
+            self.end_headers()
+            self._trickle()
+        elif self.path == '/redirect-cookie':
+            self.send_response(302)
+            self.send_header('Location', '/cookie')
+            self.send_header('Set-Cookie', 'session=foo')
+            self.end_headers()
+        elif self.path == '/cookie':
+            self._send((self.headers['Cookie'] or '').encode())
+        elif self.path == '/large':
+            self._send(b'x' * 100000)
+        elif self.path == '/slow':
+            self.send_response(200)
+            self.end_headers()
+            try:
+                for _ in range(20):
+                    self.wfile.write(b'x' * 10)
+                    self.wfile.flush()
+                    threading.Event().wait(0.1)
+            except (BrokenPipeError, ConnectionResetError):
+                # the client gave up
+                pass
+        elif self.path == '/trickle':
+            self.send_response(200)
+            self.send_header('Content-Length', '1000')
+            self.end_headers()
+            self._trickle()
+        else:
+            self.send_error(404, 'Not Found')
+
+    def _trickle(self):
+        try:
+            for _ in range(100):
+                self.wfile.write(b'x')
+                self.wfile.flush()
+                threading.Event().wait(0.05)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client gave up
+            pass
+
+    def _send(self, body):
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RetrieveUrlTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = HTTPServer(('127.0.0.1', 0), Handler)
+        cls.base_url = 'http://127.0.0.1:{}'.format(cls.server.server_port)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_redirect(self):
+        self.assertEqual(retrieve_url(self.base_url + '/redirect'), (
+            self.base_url + '/target', b'<html>target</html>', None))
+
+    def test_redirect_body(self):
+        # the body of the redirect is not read beyond the size cap
+        self.assertEqual(
+            retrieve_url(self.base_url + '/redirect-large', max_size=1000),
+            (self.base_url + '/target', b'<html>target</html>', None))
+
+    def test_redirect_cookie(self):
+        self.assertEqual(
+            retrieve_url(self.base_url + '/redirect-cookie')[1],
+            b'session=foo')
+
+    def test_time_budget_redirect(self):
+        start = time.monotonic()
+        with self.assertRaises(Timeout):
+            retrieve_url(self.base_url + '/redirect-trickle', timeout=0.5)
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_http_error(self):
+        self.assertEqual(retrieve_url(self.base_url + '/missing'), (
+            None, None, 'ERROR 404: Not Found.'))
+
+    def test_max_size(self):
+        final_url, content, http_error = retrieve_url(
+            self.base_url + '/large', max_size=1000)
+        self.assertEqual(content, b'x' * 1000)
+
+    def test_time_budget(self):
+        with self.assertRaises(Timeout):
+            retrieve_url(self.base_url + '/slow', timeout=0.5)
+
+    def test_time_budget_trickle(self):
+        # every single read is fast, but the whole content is not
+        start = time.monotonic()
+        with self.assertRaises(Timeout):
+            retrieve_url(self.base_url + '/trickle', timeout=0.5)
+        self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_unreachable(self):
+        with self.assertRaises(ConnectionError):
+            retrieve_url('http://127.0.0.1:1/')
@@ -0,0 +1,196 @@
+"""
+Signatures of common server leaks and a matcher for them.
+
+The signatures are loaded from a json file containing a list of trials. Each
+trial has a path which is requested from the site and a list of patterns;
+a leak is detected if the response contains any of them. Optionally, a trial
+can have a list of regexes which are searched for in the response as well.
+Signatures of file formats with a magic number at a fixed position can
+limit the position their patterns may start at with max_offset, so that
+responses are only searched up to max_offset plus the length of the longest
+pattern of the trial.
+The path may contain the following placeholders:
+* {domain}: the registered domain without suffix, i.e. example
+* {sub_domain}: the subdomain and the domain without suffix, i.e.
+  www.example. Trials using it are skipped for sites without subdomain.
+* {full_domain}: the full hostname, i.e. www.example.com
+
+All patterns of all trials are compiled into a single Aho-Corasick automaton,
+so a response is scanned once regardless of the number of signatures. A
+response can be scanned while it is received with a TrialStream, which
+keeps the state of the automaton between the chunks and tells when the
+response is decided, i.e. a pattern has been found or can not be found
+anymore.
+"""
+import codecs
+import json
+import os
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+from privacyscore.publicsuffix import extract
+
+
+SIGNATURES_PATH = os.path.join(os.path.dirname(__file__), 'signatures.json')
+
+
+class AhoCorasick:
+    """Find all occurrences of a set of patterns in a single pass."""
+
+    def __init__(self, patterns: Iterable[str]):
+        self.patterns = []
+        # the automaton: transitions, failure links and the indices of the
+        # patterns ending in each state
+        self._goto = [{}]  # type: List[Dict[str, int]]
+        self._fail = [0]
+        self._output = [set()]  # type: List[Set[int]]
+        for pattern in patterns:
+            self._add(pattern)
+        self._build()
+
+    def _add(self, pattern: str):
+        state = 0
+        for char in pattern:
+            if char not in self._goto[state]:
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(set())
+                self._goto[state][char] = len(self._goto) - 1
+            state = self._goto[state][char]
+        self._output[state].add(len(self.patterns))
+        self.patterns.append(pattern)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def search(self, text: str) -> Set[int]:
+        """Get the indices of all patterns occurring in text."""
+        return self.feed(text)[1]
+
+    def feed(self, text: str, state: int = 0) -> Tuple[int, Set[int]]:
+        """
+        Continue a search in state with the next part of a text. Returns the
+        state after text and the indices of the patterns ending in text.
+        """
+        found = set()
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            found |= self._output[state]
+        return state, found
+
+
+class Trial:
+    def __init__(self, path: str, patterns: List[int], regexes: List[str],
+                 horizon: int = None):
+        self.path = path
+        self.patterns = set(patterns)
+        self.regexes = [re.compile(regex) for regex in regexes]
+        # the number of characters of a response which are searched, or None
+        # to search the whole response
+        self.horizon = horizon
+
+
+class TrialTable:
+    """The trials of all signatures with a matcher for their patterns."""
+
+    def __init__(self, signatures: List[dict]):
+        patterns = {}
+        self.trials = []
+        for signature in signatures:
+            indices = [
+                patterns.setdefault(pattern, len(patterns))
+                for pattern in signature['patterns']]
+            horizon = None
+            if 'max_offset' in signature:
+                horizon = signature['max_offset'] + max(
+                    len(pattern) for pattern in signature['patterns'])
+            self.trials.append(Trial(
+                signature['path'], indices, signature.get('regexes', []),
+                horizon))
+        self.matcher = AhoCorasick(sorted(patterns, key=patterns.get))
+
+    @classmethod
+    def load(cls, path: str = SIGNATURES_PATH) -> 'TrialTable':
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def paths(self, url: str = None) -> List[Tuple[str, Trial]]:
+        """
+        Get the paths to request for a site with their trials. Without a url,
+        only trials without placeholders are returned.
+        """
+        values = {}
+        if url is not None:
+            url_extract = extract(url)
+            values['domain'] = url_extract.domain
+            full_domain = url_extract.domain + '.' + url_extract.suffix
+            if url_extract.subdomain:
+                values['sub_domain'] = (
+                    url_extract.subdomain + '.' + url_extract.domain)
+                full_domain = url_extract.subdomain + '.' + full_domain
+            values['full_domain'] = full_domain
+
+        paths = []
+        for trial in self.trials:
+            try:
+                paths.append((trial.path.format(**values), trial))
+            except KeyError:
+                # placeholder not available for this site
+                continue
+        return paths
+
+    def matches(self, trial: Trial, text: str) -> bool:
+        """Check whether text matches a trial."""
+        text = text[:trial.horizon]
+        return bool(trial.patterns & self.matcher.search(text)) or any(
+            regex.search(text) for regex in trial.regexes)
+
+    def stream(self, trial: Trial) -> 'TrialStream':
+        """Get a matcher for the patterns of a trial in a chunked response."""
+        return TrialStream(self.matcher, trial)
+
+
+class TrialStream:
+    """
+    Match the patterns of a trial against a response read in chunks. Every
+    byte is decoded and scanned only once. The regexes of the trial are not
+    matched, as they can not be matched incrementally.
+    """
+
+    def __init__(self, matcher: AhoCorasick, trial: Trial):
+        self._matcher = matcher
+        self._trial = trial
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._state = 0
+        self._length = 0
+        self.matched = False
+
+    @property
+    def decided(self) -> bool:
+        """Whether the rest of the response can not change the outcome."""
+        return self.matched or (
+            self._trial.horizon is not None and
+            self._length >= self._trial.horizon)
+
+    def feed(self, chunk: bytes) -> bool:
+        """Scan the next chunk. Returns whether a pattern occurred so far."""
+        if not self.decided:
+            text = self._decoder.decode(chunk)
+            if self._trial.horizon is not None:
+                text = text[:self._trial.horizon - self._length]
+            self._length += len(text)
+            self._state, found = self._matcher.feed(text, self._state)
+            self.matched = bool(self._trial.patterns & found)
+        return self.matched
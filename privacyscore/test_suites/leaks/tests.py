@@ -0,0 +1,202 @@
+import json
+import threading
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from django.test import TestCase
+
+from privacyscore.test_suites import serverleak
+from privacyscore.test_suites.leaks import AhoCorasick, TrialTable
+
+
+class AhoCorasickTestCase(TestCase):
+    def test_search(self):
+        matcher = AhoCorasick(['he', 'she', 'his', 'hers', 'CREATE TABLE'])
+        self.assertEqual(matcher.search('ushers'), {0, 1, 3})
+        self.assertEqual(matcher.search('ahis'), {2})
+        self.assertEqual(matcher.search('-- CREATE TABLE foo'), {4})
+        self.assertEqual(matcher.search('nothing'), set())
+        self.assertEqual(matcher.search(''), set())
+
+    def test_overlapping(self):
+        matcher = AhoCorasick(['abcd', 'bc', 'c'])
+        self.assertEqual(matcher.search('xabcx'), {1, 2})
+
+    def test_feed(self):
+        matcher = AhoCorasick(['CREATE TABLE', 'ELF'])
+        state, found = matcher.feed('-- CREATE T')
+        self.assertEqual(found, set())
+        self.assertEqual(matcher.feed('ABLE foo', state)[1], {0})
+
+
+class TrialTableTestCase(TestCase):
+    def setUp(self):
+        self.table = TrialTable([
+            {'path': 'core', 'patterns': ['ELF'], 'max_offset': 1},
+            {'path': '{domain}.sql', 'patterns': ['CREATE TABLE', 'SQLite']},
+            {'path': '{sub_domain}.db', 'patterns': ['SQLite']},
+            {'path': '{full_domain}.pem', 'patterns': ['-----BEGIN'],
+             'regexes': [r'^ssh-rsa ']},
+        ])
+
+    def test_paths(self):
+        self.assertEqual(
+            [path for path, _trial in self.table.paths('https://www.example.co.uk/')],
+            ['core', 'example.sql', 'www.example.db', 'www.example.co.uk.pem'])
+        # no subdomain
+        self.assertEqual(
+            [path for path, _trial in self.table.paths('https://example.com/')],
+            ['core', 'example.sql', 'example.com.pem'])
+        self.assertEqual(
+            [path for path, _trial in self.table.paths()], ['core'])
+
+    def test_matches(self):
+        core, sql, db, pem = [trial for _path, trial in self.table.paths(
+            'https://www.example.com/')]
+        self.assertTrue(self.table.matches(core, '\x7fELF\x02'))
+        self.assertFalse(self.table.matches(core, 'SQLite format 3'))
+        # the magic number is not at the start
+        self.assertFalse(self.table.matches(core, '<html>ELF</html>'))
+        self.assertTrue(self.table.matches(sql, '-- dump\nCREATE TABLE foo'))
+        self.assertTrue(self.table.matches(db, 'SQLite format 3'))
+        self.assertTrue(self.table.matches(pem, 'ssh-rsa AAAA'))
+        self.assertFalse(self.table.matches(pem, '<html>ssh-rsa</html>'))
+
+    def test_stream(self):
+        _core, sql, _db, _pem = [trial for _path, trial in self.table.paths(
+            'https://www.example.com/')]
+        stream = self.table.stream(sql)
+        self.assertFalse(stream.feed(b'-- dump\nCREATE'))
+        # a multi-byte character split between two chunks
+        self.assertFalse(stream.feed(b' \xc3'))
+        self.assertFalse(stream.feed(b'\xa4 SQLit'))
+        self.assertTrue(stream.feed(b'e format 3'))
+        self.assertTrue(stream.decided)
+
+    def test_stream_decided(self):
+        core, sql, _db, _pem = [trial for _path, trial in self.table.paths(
+            'https://www.example.com/')]
+        stream = self.table.stream(core)
+        self.assertFalse(stream.feed(b'<ht'))
+        self.assertFalse(stream.decided)
+        # the magic number can not follow anymore
+        self.assertFalse(stream.feed(b'ml>ELF'))
+        self.assertTrue(stream.decided)
+        stream = self.table.stream(sql)
+        self.assertFalse(stream.feed(b'<html>' * 1000))
+        self.assertFalse(stream.decided)
+
+    def test_default_signatures(self):
+        table = TrialTable.load()
+        paths = [path for path, _trial in table.paths('http://www.example.com/')]
+        self.assertIn('.git/HEAD', paths)
+        self.assertIn('www.example.sql', paths)
+        self.assertIn('www.example.com.key', paths)
+
+
+class LeakHandler(BaseHTTPRequestHandler):
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+    # by host
+    host_active = defaultdict(int)
+    host_max_active = defaultdict(int)
+
+    @classmethod
+    def reset(cls):
+        cls.max_active = 0
+        cls.host_max_active.clear()
+
+    def do_GET(self):
+        host = self.headers['Host']
+        with self.lock:
+            LeakHandler.active += 1
+            LeakHandler.max_active = max(
+                LeakHandler.max_active, LeakHandler.active)
+            LeakHandler.host_active[host] += 1
+            LeakHandler.host_max_active[host] = max(
+                LeakHandler.host_max_active[host],
+                LeakHandler.host_active[host])
+        try:
+            threading.Event().wait(0.05)
+            if self.path == '/.git/HEAD':
+                self._send(200, b'ref: refs/heads/master\n')
+            elif self.path == '/core':
+                self.send_response(302)
+                self.send_header('Location', '/')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            else:
+                self._send(404, b'not found')
+        finally:
+            with self.lock:
+                LeakHandler.active -= 1
+                LeakHandler.host_active[host] -= 1
+
+    def _send(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class ServerleakTestCase(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), LeakHandler)
+        cls.url = 'http://127.0.0.1:{}/'.format(cls.server.server_port)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def test_site(self):
+        LeakHandler.reset()
+        raw_data = serverleak.test_site(self.url, {})
+        self.assertLessEqual(LeakHandler.max_active, serverleak.MAX_WORKERS)
+        self.assertGreater(LeakHandler.max_active, 1)
+
+        self.assertEqual(raw_data['url']['data'], self.url.encode())
+        self.assertEqual(
+            json.loads(raw_data['.git/HEAD']['data'].decode())['status_code'],
+            200)
+        self.assertEqual(
+            json.loads(raw_data['dump.sql']['data'].decode())['status_code'],
+            404)
+        # redirected
+        self.assertNotIn('core', raw_data)
+
+        self.assertEqual(serverleak.process_test_data(raw_data, {}), {
+            'leaks': ['.git/HEAD'],
+        })
+
+    def test_probe_sites(self):
+        LeakHandler.reset()
+        port = self.server.server_port
+        urls = ['http://127.0.0.1:{}/'.format(port),
+                'http://localhost:{}/'.format(port)]
+        results = serverleak.probe_sites(
+            urls, prober=serverleak.Prober(max_workers=3, max_host_workers=2))
+        # global and per-host limits
+        self.assertLessEqual(LeakHandler.max_active, 3)
+        self.assertEqual(len(LeakHandler.host_max_active), 2)
+        for host_max_active in LeakHandler.host_max_active.values():
+            self.assertLessEqual(host_max_active, 2)
+        self.assertEqual(LeakHandler.max_active, 3)
+        for url in urls:
+            self.assertEqual(results[url]['url']['data'], url.encode())
+            self.assertEqual(serverleak.process_test_data(results[url], {}), {
+                'leaks': ['.git/HEAD'],
+            })
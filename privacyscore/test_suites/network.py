@@ -4,25 +4,27 @@ addresses and the final URL after following any HTTP forwards.
 """
 
 import json
+import os
 import re
+import threading
 import traceback
+import weakref
+from functools import lru_cache
 from typing import Dict, List, Union
 from urllib.parse import urlparse
-import subprocess
-import os
 
-import requests
-from dns import resolver, reversename
-from dns.exception import DNSException
-from geoip2.database import Reader
+from geoip2.database import MODE_MMAP, Reader
 from geoip2.errors import AddressNotFoundError
+from requests.exceptions import RequestException
+
+from .dnslookup import resolve_site
+from .httpfetch import retrieve_url
 
 
 test_name = 'network'
 test_dependencies = []
-
-# TODO put the path somewhere else, maybe in settings
-HSTS_FILE = "/opt/privacyscore/.wget-hsts"
+test_input_keys = []
+test_resource_class = 'network'
 
 # The minimum Jaccard coefficient required for the
 # comparison of http and https version of a site
@@ -31,56 +33,12 @@ HSTS_FILE = "/opt/privacyscore/.wget-hsts"
 # that the scanned site is not available via https)
 MINIMUM_SIMILARITY = 0.90
 
-def retrieve_url_with_wget(url):
-    """calls wget and extracts the final url and the http body from the response
-       IndexError or subprocess.CalledProcessError will be thrown if site is unreachable
-    """
-    
-    # TODO this is hacky, but necessary, because (only) on some of our scan hosts
-    # we have a wget version that implements hsts. Once all VMs are upgraded, we can
-    # use the --no-hsts parameter of wget
-    if os.path.isfile(HSTS_FILE):
-        os.remove(HSTS_FILE)
-    
-    # this needs python 3.5, but some of our VMs still have Python 3.4
-    #proc = subprocess.run(['wget', '--no-verbose', url, '-O-', '--no-check-certificate',
-    #                      '--user-agent="Mozilla/5.0 (X11; Linux x86_64; rv:53.0) Gecko/20100101 Firefox/53.0"'],
-    #                     stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
-    cmd = ['env', 'LC_ALL=C', 'wget', '--no-verbose', url, '-O-', \
-           '--no-check-certificate',
-           '--user-agent="Mozilla/5.0 (X11; Linux x86_64; rv:53.0) Gecko/20100101 Firefox/53.0"']
-    proc = subprocess.Popen(cmd,
-                          stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    try:
-        (stdout, stderr) = proc.communicate(timeout=15)
-    except subprocess.TimeoutExpired:
-        proc.kill()
-        raise
-    
-    # if wget returns 8, this indicates HTTP status != 200
-    http_error = None
-    final_url = None
-    content = None
-
-    if proc.returncode == 8:
-        if re.search('(ERROR .*)', stderr.decode(errors='replace')):
-            http_error = re.search('(ERROR .*)', stderr.decode(errors='replace')).group(1)
-        else:
-            http_error = "Unspecified error."
+# The maximum number of memoized geoip lookups per process
+GEOIP_MEMO_SIZE = 65536
 
-    # we do error handling this way so that error handling in the caller is already compatible with subprocess.run
-    elif not proc.returncode == 0:
-        raise subprocess.CalledProcessError(proc.returncode, " ".join(cmd))
-    
-    else:
-        # wget output looks like this:
-        # '2017-12-21 10:34:51 URL:https://www.example.com/foo/bar [64407] -> "-" [1]\n'
-        if re.search('URL:([^ ]+)', stderr.decode(errors='replace')):
-            final_url = re.search('URL:([^ ]+)', stderr.decode(errors='replace')).group(1)
-        content = stdout
-    
-    return final_url, content, http_error
-    
+# Open geoip databases by path
+_geoip_databases = {}  # type: Dict[str, _GeoIPDatabase]
+_geoip_databases_lock = threading.Lock()
 
 def test_site(url: str, previous_results: dict, country_database_path: str) -> Dict[str, Dict[str, Union[str, bytes]]]:
     """Test the specified url with geoip."""
@@ -90,29 +48,9 @@ def test_site(url: str, previous_results: dict, country_database_path: str) -> D
     # determine hostname
     hostname = urlparse(url).hostname
 
-    # DNS
-    # cname records
-    general_result['cname_records'] = _cname_lookup(hostname)
-
-    # a records
-    general_result['a_records'] = _a_lookup(hostname)
-
-    # mx records
-    general_result['mx_records'] = _mx_lookup(hostname)
-    if hostname.startswith('www.'):
-        general_result['mx_records'] += _mx_lookup(hostname[4:])
-
-    # mx a-records
-    general_result['mx_a_records'] = [(pref, _a_lookup(mx)) for pref, mx in general_result['mx_records']]
-
-    # reverse a
-    general_result['a_records_reverse'] = [_reverse_lookup(a) for a in general_result['a_records']]
-
-    # reverse mx-a
-    general_result['mx_a_records_reverse'] = [
-        (pref,
-         [_reverse_lookup(a) for a in mx_a])
-        for pref, mx_a in general_result['mx_a_records']]
+    # DNS: cname, a, mx, mx a-records, reverse a and reverse mx-a records,
+    # looked up concurrently
+    general_result.update(resolve_site(hostname))
 
     general_result['reachable'] = True
     
@@ -123,19 +61,19 @@ def test_site(url: str, previous_results: dict, country_database_path: str) -> D
     else:
         # determine final url
         try:
-            wget_final_url, wget_content, http_error = retrieve_url_with_wget(url)
+            final_url, content, http_error = retrieve_url(url)
             if http_error:
                 general_result['http_error'] = http_error
                 general_result['final_url'] = url # so that we can check the https version below
             else:
-                general_result['final_url'] = wget_final_url
+                general_result['final_url'] = final_url
                 result['final_url_content'] = {
                     'mime_type': 'text/html', # probably not always correct, leaving that for later ...
-                    'data': wget_content,
+                    'data': content,
                 }
         
-        # if subprocess.run failed OR re.search did not find anything suitable: raise an exception!
-        except (IndexError, subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        # the site is unreachable
+        except RequestException:
             # TODO: extend api to support registration of partial errors
             general_result['unreachable_exception'] = traceback.format_exc()
             general_result['final_url'] = url
@@ -151,18 +89,18 @@ def test_site(url: str, previous_results: dict, country_database_path: str) -> D
             https_url = 'https:/' + url.split('/', maxsplit=1)[1]
             try:
                 
-                wget_final_url, wget_content, https_error = retrieve_url_with_wget(https_url)
+                final_url, content, https_error = retrieve_url(https_url)
                 
                 if https_error:
                     general_result['https_error'] = https_error
                     general_result['final_https_url'] = https_url 
                 else:
-                    general_result['final_https_url'] = wget_final_url
+                    general_result['final_https_url'] = final_url
                     result['final_https_url_content'] = {
                         'mime_type': 'text/html', # probably not always correct, leaving that for later ...
-                        'data': wget_content,
+                        'data': content,
                     }
-            except (IndexError, subprocess.CalledProcessError, subprocess.TimeoutExpired):
+            except RequestException:
                 general_result['final_https_url'] = False
         else:
             general_result['final_https_url'] = general_result['final_url']
@@ -180,12 +118,11 @@ def process_test_data(raw_data: list, previous_results: dict, country_database_p
     result = json.loads(raw_data['general']['data'].decode())
 
     # geoip
-    reader = Reader(country_database_path)
-
-    result['a_locations'] = _get_countries(result['a_records'], reader)
+    result['a_locations'] = _get_countries(
+        result['a_records'], country_database_path)
     result['mx_locations'] = _get_countries(
         (ip for mx_a_records in result['mx_a_records']
-         for ip in mx_a_records[1]), reader)
+         for ip in mx_a_records[1]), country_database_path)
 
     # TODO: reverse mx-a matches mx
 
@@ -203,51 +140,57 @@ def process_test_data(raw_data: list, previous_results: dict, country_database_p
     return result
 
 
-def _a_lookup(name: str) -> List[str]:
-    try:
-        return [e.address for e in resolver.query(name, 'A')]
-    except DNSException:
-        return []
-
+class _GeoIPDatabase:
+    """
+    A memory-mapped geoip database with the mtime of the opened file. The
+    reader is closed as soon as the database is no longer referenced, i.e.
+    it has been replaced and no lookup uses it anymore.
+    """
+    def __init__(self, path: str, mtime: float):
+        self.mtime = mtime
+        self.reader = Reader(path, mode=MODE_MMAP)
+        weakref.finalize(self, self.reader.close)
 
-def _cname_lookup(name: str) -> List[str]:
-    try:
-        return [e.to_text()[:-1].lower() for e in resolver.query(name, 'CNAME')]
-    except DNSException:
-        return []
+    def country(self, ip: str) -> Union[str, None]:
+        try:
+            geoip_result = self.reader.country(ip)
+        except AddressNotFoundError:
+            return None
+        return geoip_result.country.name or geoip_result.continent.name or None
 
 
-def _mx_lookup(name: str) -> List[str]:
-    try:
-        return sorted([(e.preference, e.exchange.to_text()[:-1].lower())
-                       for e in resolver.query(name, 'MX')], key=lambda v: v[0])
-    except DNSException:
-        return []
+def _get_geoip_database(path: str) -> _GeoIPDatabase:
+    """
+    Get a geoip database shared by the whole process. The database is
+    reopened when the file has changed.
+    """
+    mtime = os.stat(path).st_mtime
+    with _geoip_databases_lock:
+        database = _geoip_databases.get(path)
+        if database is None or database.mtime != mtime:
+            database = _geoip_databases[path] = _GeoIPDatabase(path, mtime)
+        return database
 
 
-def _reverse_lookup(ip: str) -> List[str]:
-    try:
-        address = reversename.from_address(ip).to_text()
-        return [rev.to_text()[:-1].lower()
-                for rev in resolver.query(address, 'PTR')]
-    except DNSException:
-        return []
+@lru_cache(maxsize=GEOIP_MEMO_SIZE)
+def _lookup_country(path: str, mtime: float, ip: str) -> Union[str, None]:
+    """
+    Look up the country (or continent) of an ip address. The mtime of the
+    database is part of the memo key, so results of outdated databases are
+    not reused.
+    """
+    return _get_geoip_database(path).country(ip)
 
 
-def _get_countries(addresses: List[str], reader: Reader) -> List[str]:
+def _get_countries(addresses: List[str], database_path: str) -> List[str]:
+    mtime = _get_geoip_database(database_path).mtime
     res = set()
     for ip in addresses:
-        try:
-            geoip_result = reader.country(ip)
-            this_result = geoip_result.country.name
-            if not this_result:
-                this_result = geoip_result.continent.name
-            if not this_result:
-                raise AddressNotFoundError
-            res.add(this_result)
-        except AddressNotFoundError:
+        this_result = _lookup_country(database_path, mtime, ip)
+        if not this_result:
             # TODO: Add entry specifying that at least one location has not been found
             continue
+        res.add(this_result)
     return list(res)
 
 
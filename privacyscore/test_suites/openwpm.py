@@ -6,30 +6,30 @@ import json
 import logging
 import os
 import shutil
-import time
 
-from io import BytesIO
 from typing import Dict, Union
 from uuid import uuid4
 from pathlib import Path
 
-import tldextract
-
-from PIL import Image
-
-from privacyscanner.scanmodules.chromedevtools import ChromeDevtoolsScanModule
 from privacyscanner.scanmeta import ScanMeta
 from privacyscanner.result import Result
 from privacyscanner.filehandlers import DirectoryFileHandler
 from privacyscanner.exceptions import RetryScan
 
-from privacyscore.utils import get_worker_id
+from privacyscore.publicsuffix import extract, registered_domain
+from privacyscore.scanner.supervisor import RetryTest, get_num_tries
+from privacyscore.test_suites.browserpool import \
+    PooledChromeDevtoolsScanModule, get_browser_pool
 
 
 test_name = 'openwpm'
 test_dependencies = [
     'network',
 ]
+test_input_keys = [
+    'dns_error', 'reachable', 'final_url', 'final_url_is_https',
+]
+test_resource_class = 'browser'
 
 
 def test_site(url: str, previous_results: dict, scan_basedir: str, virtualenv_path: str) -> Dict[str, Dict[str, Union[str, bytes]]]:
@@ -55,29 +55,25 @@ def test_site(url: str, previous_results: dict, scan_basedir: str, virtualenv_pa
     os.mkdir(scan_dir)
 
     file_handler = DirectoryFileHandler(scan_dir)
-    logger = logging.getLogger()
-    num_tries = 1
-    while True:
-        try:
-            scanner_result = Result({'site_url': url}, file_handler)
-            with get_worker_id() as worker_id:
-                meta = ScanMeta(worker_id=worker_id, num_tries=num_tries)
-                scan_mod = ChromeDevtoolsScanModule({
-                    'storage_path': Path('~/.local/share/privacyscanner').expanduser()
-                })
-                scan_mod.logger = logger
-                scan_mod.scan_site(scanner_result, meta)
-            break
-        except RetryScan:
-            if num_tries >= 3:
-                result['crawldata'] = {
-                    'mime_type': 'application/json',
-                    'data': json.dumps(None).encode(),
-                }
-                return result
-
-            num_tries += 1
-            time.sleep(10)
+    num_tries = get_num_tries()
+    scanner_result = Result({'site_url': url}, file_handler)
+    meta = ScanMeta(worker_id=None, num_tries=num_tries)
+    scan_mod = PooledChromeDevtoolsScanModule({
+        'storage_path': Path('~/.local/share/privacyscanner').expanduser()
+    }, get_browser_pool())
+    scan_mod.logger = logging.getLogger()
+    try:
+        scan_mod.scan_site(scanner_result, meta)
+    except RetryScan as e:
+        shutil.rmtree(scan_dir)
+        if num_tries >= 3:
+            result['crawldata'] = {
+                'mime_type': 'application/json',
+                'data': json.dumps(None).encode(),
+            }
+            return result
+        # try again later without blocking the worker in the meantime
+        raise RetryTest(str(e), countdown=10)
 
     # screenshot
     if os.path.isfile(os.path.join(scan_dir, 'files/screenshot.png')):
@@ -93,15 +89,6 @@ def test_site(url: str, previous_results: dict, scan_basedir: str, virtualenv_pa
         'data': json.dumps(scanner_result.get_results()).encode(),
     }
 
-    # cropped and pixelized screenshot
-    if 'screenshot' in result:
-        out = BytesIO()
-        pixelize_screenshot(BytesIO(result['screenshot']['data']), out)
-        result['cropped_screenshot'] = {
-            'mime_type': 'image/png',
-            'data': out.getvalue(),
-        }
-
     # recursively delete scan folder
     shutil.rmtree(scan_dir)
 
@@ -272,7 +259,7 @@ def process_test_data(raw_data: list, previous_results: dict, scan_basedir: str,
         for cookie in crawl_data['cookies']:
             d = dict((k, cookie.get(v)) for (k, v) in cookies_mapping.items())
             d['lifetime'] = cookie['lifetime']
-            d['baseDomain'] = tldextract.extract(cookie['domain']).registered_domain
+            d['baseDomain'] = registered_domain(cookie['domain'])
             cookies.append(d)
         scantosave['profilecookies'] = cookies
 
@@ -291,32 +278,6 @@ def process_test_data(raw_data: list, previous_results: dict, scan_basedir: str,
     return scantosave
 
 
-def pixelize_screenshot(screenshot, screenshot_pixelized, target_width=390, pixelsize=3):
-    """
-    Thumbnail a screenshot to `target_width` and pixelize it.
-
-    :param screenshot: Screenshot to be thumbnailed in pixelized
-    :param screenshot_pixelized: File to which the result should be written
-    :param target_width: Width of the final thumbnail
-    :param pixelsize: Size of the final pixels
-    :return: None
-    """
-    if target_width % pixelsize != 0:
-        raise ValueError("pixelsize must divide target_width")
-
-    img = Image.open(screenshot)
-    width, height = img.size
-    if height > width:
-        img = img.crop((0, 0, width, width))
-        height = width
-    undersampling_width = target_width // pixelsize
-    ratio = width / height
-    new_height = int(undersampling_width / ratio)
-    img = img.resize((undersampling_width, new_height), Image.BICUBIC)
-    img = img.resize((target_width, new_height * pixelsize), Image.NEAREST)
-    img.save(screenshot_pixelized, format='png')
-
-
 def detect_cookies(domain, cookies, flashcookies, trackers):
     """
     Detect cookies and return statistics about them.
@@ -336,16 +297,16 @@ def detect_cookies(domain, cookies, flashcookies, trackers):
     tp_track      = 0  # Third party cookies from known trackers
     tp_track_uniq = 0  # Number of unique tracking domains that set cookies
 
-    dom_ext = tldextract.extract(domain)
+    dom_ext = extract(domain)
     seen_trackers = []
+    tds = {registered_domain(t) for t in trackers}
 
     for cookie in cookies:
-        cd_ext = tldextract.extract(cookie["baseDomain"])
+        cd_ext = extract(cookie["baseDomain"])
         if cd_ext.registered_domain == dom_ext.registered_domain:
             fp = True # fp: first party
         else:
             fp = False
-            tds = [tldextract.extract(t).registered_domain for t in trackers]
             if cd_ext.registered_domain in tds:
                 if cd_ext.registered_domain not in seen_trackers:
                     seen_trackers.append(cd_ext.registered_domain)
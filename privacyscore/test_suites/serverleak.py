@@ -1,137 +1,185 @@
 """
 Test for common server leaks.
+
+The trials of all sites probed by a process run through a shared Prober,
+which limits the number of concurrent requests in total (MAX_GLOBAL_WORKERS)
+and to each host (MAX_WORKERS). probe_sites probes a batch of sites at once;
+test_site is a batch of one, which shares the limits with the other test
+suites run concurrently by the process.
 """
 import json
-import re
-from typing import Dict, Union
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, Union
 from urllib.parse import urlparse
-from tldextract import extract
 import requests
+from requests.adapters import HTTPAdapter
 from requests.exceptions import ConnectionError
 from requests.models import Response
-from concurrent.futures import ThreadPoolExecutor
+
+from .leaks import Trial, TrialTable
 
 
 test_name = 'serverleak'
 test_dependencies = [
     'network', 'openwpm', 'testssl_https', 'testssl_mx',
 ]
+test_input_keys = []
+test_resource_class = 'network'
 
 USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64; rv:61.0) Gecko/20100101 Firefox/61.0 (Research project: Visit PrivacyScore.org for details)'
 
+# we store only the top of the file because core dumps can become very large
+# also: we do not want to store more potentially sensitive data than necessary
+# to determine whether there is a leak or not
+MAX_CONTENT_SIZE = 50 * 1024
 
-def _match_db_dump(content):
-    targets = ["SQLite", "CREATE TABLE", "INSERT INTO", "DROP TABLE"]
-    matched = False
-    for target in targets:
-        matched |= target in content
-    return matched
+# the number of concurrent requests to a single host
+MAX_WORKERS = 8
+
+# the number of concurrent requests of a process
+MAX_GLOBAL_WORKERS = 64
+
+# status codes of responses which may contain a leak. 206 is the answer to
+# a range request.
+LEAK_STATUS_CODES = (200, 206)
 
-def _concat_sub(url, suffix):
-    url_extract = extract(url)
-    if url_extract.subdomain == "":
-        return None
-    site = url_extract.subdomain + "." + url_extract.domain
-    return site + suffix
-
-def _concat_full(url, suffix):
-    url_extract = extract(url)
-    site = url_extract.domain + "." + url_extract.suffix
-    if url_extract.subdomain != "":
-        site = url_extract.subdomain + "." + site
-    return site + suffix
-
-def _gen_db_domain_sql(url):
-    return extract(url).domain + ".sql"
-
-def _gen_db_sub_domain_sql(url):
-    return _concat_sub(url, ".sql")
-
-def _gen_db_full_domain_sql(url):
-    return _concat_full(url, ".sql")
-
-def _gen_db_domain_db(url):
-    return extract(url).domain + ".db"
-
-def _gen_db_sub_domain_db(url):
-    return _concat_sub(url, ".db")
-
-def _gen_db_full_domain_db(url):
-    return _concat_full(url, ".db")
-
-def _gen_db_domain_key(url):
-    return extract(url).domain + ".key"
-
-def _gen_db_sub_domain_key(url):
-    return _concat_sub(url, ".key")
-
-def _gen_db_full_domain_key(url):
-    return _concat_full(url, ".key")
-
-def _gen_db_domain_pem(url):
-    return extract(url).domain + ".pem"
-
-def _gen_db_sub_domain_pem(url):
-    return _concat_sub(url, ".pem")
-
-def _gen_db_full_domain_pem(url):
-    return _concat_full(url, ".pem")
-
-TRIALS = [
-    ('server-status/', 'Apache Server Status'),
-    ('server-info/', 'Apache Server Information'),
-    ('test.php', 'phpinfo()'),
-    ('phpinfo.php', 'phpinfo()'),
-    ('.git/HEAD', 'ref:'),
-    ('.svn/wc.db', 'SQLite'),
-    ('core', 'ELF'),
-    ('.DS_Store', 'Bud1'),
-
-    ### Check for Database dumps
-    # sqldump - mysql
-    ('dump.db', _match_db_dump),
-    ('dump.sql', _match_db_dump),
-    ('sqldump.sql', _match_db_dump),
-    ('sqldump.db', _match_db_dump),
-    # SQLite
-    ('db.sqlite', _match_db_dump),
-    ('data.sqlite', _match_db_dump),
-    ('sqlite.db', _match_db_dump),
-    (_gen_db_domain_sql, _match_db_dump),
-    (_gen_db_sub_domain_sql, _match_db_dump),
-    (_gen_db_full_domain_sql, _match_db_dump),
-    (_gen_db_domain_db, _match_db_dump),
-    (_gen_db_sub_domain_db, _match_db_dump),
-    (_gen_db_full_domain_db, _match_db_dump),
-
-    # TODO PostgreSQL etc., additional common names
-
-    # TLS Certs
-    ('server.key', '-----BEGIN'),
-    ('privatekey.key', '-----BEGIN'),
-    ('private.key', '-----BEGIN'),
-    ('myserver.key', '-----BEGIN'),
-    ('key.pem', '-----BEGIN'),
-    ('privkey.pem', '-----BEGIN'),
-    (_gen_db_domain_key, '-----BEGIN'),
-    (_gen_db_sub_domain_key, '-----BEGIN'),
-    (_gen_db_full_domain_key, '-----BEGIN'),
-    (_gen_db_domain_pem, '-----BEGIN'),
-    (_gen_db_sub_domain_pem, '-----BEGIN'),
-    (_gen_db_full_domain_pem, '-----BEGIN'),
-    # TODO Add [domainname].key, [domainname].pem
-]
 
-def _get(url, timeout):
+# The signatures of all leaks, see privacyscore.test_suites.leaks
+TRIAL_TABLE = TrialTable.load()
+
+
+def _get_session() -> requests.Session:
+    """Get a session with keep-alive connections to a single site."""
+    session = requests.Session()
+    session.headers['User-Agent'] = USER_AGENT
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def _get(session: requests.Session, url: str, trial: Trial, timeout) -> Union[bytes, None]:
+    """
+    Probe a url. Only the first MAX_CONTENT_SIZE bytes of the content are
+    requested and read. Reading stops early when a pattern of the trial
+    occurs or can not occur anymore (see max_offset of the signatures), and
+    no content is read at all when the status code rules out a leak. The
+    regexes of the trial are matched by process_test_data.
+    """
     try:
-        response = requests.get(url, headers={
-            'User-Agent': USER_AGENT
-        }, timeout=timeout)
-        return response
+        response = session.get(url, headers={
+            'Range': 'bytes=0-{}'.format(MAX_CONTENT_SIZE - 1),
+        }, timeout=timeout, stream=True)
     except ConnectionError:
         return None
-
-def test_site(url: str, previous_results: dict) -> Dict[str, Dict[str, Union[str, bytes]]]:
+    with response:
+        content = bytearray()
+        if response.status_code in LEAK_STATUS_CODES:
+            stream = TRIAL_TABLE.stream(trial)
+            for chunk in response.iter_content(8 * 1024):
+                content += chunk
+                stream.feed(chunk)
+                if len(content) >= MAX_CONTENT_SIZE or stream.decided:
+                    break
+        return _response_to_json(response, bytes(content[:MAX_CONTENT_SIZE]))
+
+
+class _Host:
+    def __init__(self, netloc: str):
+        self.netloc = netloc
+        self.session = _get_session()
+        self.pending = deque()
+        self.running = 0
+
+
+class Prober:
+    """
+    Probe the trials of many sites concurrently. At most max_workers
+    requests run at once and at most max_host_workers of them to the same
+    host. Further probes of a host wait in its queue without occupying a
+    thread. Each host has its own keep-alive session while it is probed.
+    """
+
+    def __init__(self, max_workers: int = MAX_GLOBAL_WORKERS,
+                 max_host_workers: int = MAX_WORKERS):
+        self.max_host_workers = max_host_workers
+        self.pid = os.getpid()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def submit(self, url: str, trial: Trial, timeout: float) -> Future:
+        """Probe a url (see _get) as soon as the limits permit."""
+        future = Future()
+        netloc = urlparse(url).netloc
+        with self._lock:
+            host = self._hosts.get(netloc)
+            if host is None:
+                host = self._hosts[netloc] = _Host(netloc)
+            host.pending.append((future, url, trial, timeout))
+            start = host.running < self.max_host_workers
+            if start:
+                host.running += 1
+        if start:
+            self._executor.submit(self._work, host)
+        return future
+
+    def _work(self, host: _Host):
+        """Probe the pending urls of a host."""
+        while True:
+            with self._lock:
+                if not host.pending:
+                    host.running -= 1
+                    if not host.running:
+                        del self._hosts[host.netloc]
+                        host.session.close()
+                    return
+                future, url, trial, timeout = host.pending.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(_get(host.session, url, trial, timeout))
+            except Exception as e:
+                future.set_exception(e)
+
+
+_prober = None
+_prober_lock = threading.Lock()
+
+
+def get_prober() -> Prober:
+    """Get the prober shared by the probes of this process."""
+    global _prober
+    with _prober_lock:
+        if _prober is None or _prober.pid != os.getpid():
+            # the threads of a prober inherited from the parent are gone
+            _prober = Prober()
+        return _prober
+
+
+def probe_sites(urls: Iterable[str], timeout: float = 10,
+                prober: Prober = None) -> Dict[str, Dict[str, Dict[str, Union[str, bytes]]]]:
+    """
+    Probe the trials of a batch of sites concurrently. Returns the raw data
+    of each site as test_site does.
+    """
+    if prober is None:
+        prober = get_prober()
+    futures = {}
+    for url in urls:
+        parsed_url = urlparse(url)
+        futures[url] = {
+            path: prober.submit('{}://{}/{}'.format(
+                parsed_url.scheme, parsed_url.netloc, path), trial, timeout)
+            for path, trial in TRIAL_TABLE.paths(url)}
+    return {url: _collect(url, site_futures)
+            for url, site_futures in futures.items()}
+
+
+def _collect(url: str, url_to_future: Dict[str, Future]) -> Dict[str, Dict[str, Union[str, bytes]]]:
     raw_requests = {
         'url': {
             'mime_type': 'text/plain',
@@ -142,42 +190,32 @@ def test_site(url: str, previous_results: dict) -> Dict[str, Dict[str, Union[str
     # determine hostname
     parsed_url = urlparse(url)
 
-    with ThreadPoolExecutor(max_workers=8) as executor:
-        url_to_future = {}
-        for trial, pattern in TRIALS:
-            trial_t = trial
-            # Check if trial is callable. If so, call it and save the result
-            if callable(trial):
-                trial_t = trial(url)
-                if trial_t is None:
-                    continue
-            request_url = '{}://{}/{}'.format(
-                parsed_url.scheme, parsed_url.netloc, trial_t)
-            url_to_future[trial_t] = executor.submit(_get, request_url, 10)
-
-        for trial in url_to_future:
-            try:
-                # response = requests.get(request_url, timeout=10)
-                response = url_to_future[trial].result()
-                if response is None:
-                    continue
-
-                match_url = '{}/{}'.format(parsed_url.netloc, trial)
-
-                if  match_url not in response.url:
-                    # There has been a redirect.
-                    continue
-                
-                raw_requests[trial] = {
-                    'mime_type': 'application/json',
-                    'data': _response_to_json(response),
-                }
-            except Exception:
+    for trial in url_to_future:
+        try:
+            response = url_to_future[trial].result()
+            if response is None:
+                continue
+
+            match_url = '{}/{}'.format(parsed_url.netloc, trial)
+
+            if match_url not in json.loads(response.decode())['url']:
+                # There has been a redirect.
                 continue
 
+            raw_requests[trial] = {
+                'mime_type': 'application/json',
+                'data': response,
+            }
+        except Exception:
+            continue
+
     return raw_requests
 
 
+def test_site(url: str, previous_results: dict) -> Dict[str, Dict[str, Union[str, bytes]]]:
+    return probe_sites([url])[url]
+
+
 def process_test_data(raw_data: list, previous_results: dict) -> Dict[str, Dict[str, object]]:
     leaks = []
     result = {}
@@ -186,43 +224,23 @@ def process_test_data(raw_data: list, previous_results: dict) -> Dict[str, Dict[
     if 'url' in raw_data:
         url = raw_data['url']['data'].decode()
 
-    for trial, pattern in TRIALS:
-        if url:
-            if callable(trial):
-                trial = trial(url)
-                if trial is None:
-                    continue
-        if trial not in raw_data:
+    for path, trial in TRIAL_TABLE.paths(url):
+        if path not in raw_data:
             # Test raw data too old or particular request failed.
             continue
-        response = json.loads(raw_data[trial]['data'].decode())
-        if response['status_code'] == 200:
-            # The pattern can have three different types.
-            # - If it is a simple string, we only check if it is contained in the response
-            if isinstance(pattern, str):
-                if pattern in response['text']:
-                    leaks.append(trial)
-            # - If it is a RegEx object, we perform a pattern match
-            elif isinstance(pattern, re._pattern_type):
-                if re.match(response['text']):
-                    leaks.append(trial)
-            # - If it is callable, we call it with the response text and check the return value
-            elif callable(pattern):
-                if pattern(response['text']):
-                    leaks.append(trial)
+        response = json.loads(raw_data[path]['data'].decode())
+        if response['status_code'] in LEAK_STATUS_CODES:
+            if TRIAL_TABLE.matches(trial, response['text']):
+                leaks.append(path)
 
     result['leaks'] = leaks
     return result
 
 
-def _response_to_json(resp: Response) -> bytes:
+def _response_to_json(resp: Response, content: bytes) -> bytes:
     """Generate a json byte string from a response received through requests."""
-    # we store only the top of the file because core dumps can become very large
-    # also: we do not want to store more potentially sensitive data than necessary
-    # to determine whether there is a leak or not
-    
     return json.dumps({
-        'text': resp.content[0:50*1024].decode(errors='replace'),
+        'text': content.decode(errors='replace'),
         'status_code': resp.status_code,
         'headers': dict(resp.headers),
         'url': resp.url,
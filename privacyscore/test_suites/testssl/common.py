@@ -1,14 +1,24 @@
 """
 Common functionality for testssl-based checks.
 """
+import json
 import os
 import re
 import tempfile
+import time
+import uuid
 from pprint import pprint
 
-from subprocess import call, check_output, DEVNULL
+from subprocess import DEVNULL
+from typing import Callable, Dict, List, Tuple, Union
 
 from django.conf import settings
+from django.core.cache import BaseCache, caches
+
+from privacyscore.scanner.supervisor import call
+
+from ..dnslookup import a_lookup
+from .ssh import get_ssh_pool
 
 from pprint import pprint
 
@@ -22,6 +32,8 @@ def run_testssl(hostname: str, check_mx: bool, remote_host: str = None) -> bytes
     # determine hostname
     if remote_host:
         out =  _remote_testssl(hostname, remote_host)
+    elif settings.TESTSSL_BATCH is not None:
+        out = get_batcher().run(hostname, check_mx)
     else:
         out = _local_testssl(hostname, check_mx)
 
@@ -31,6 +43,17 @@ def run_testssl(hostname: str, check_mx: bool, remote_host: str = None) -> bytes
     return out
 
 
+def testssl_fingerprint(hostname: str) -> Union[str, None]:
+    """
+    Get the input fingerprint of a testssl run, i.e. the hostname with the
+    addresses it resolves to. Returns None if the hostname does not resolve.
+    """
+    addresses = sorted(a_lookup(hostname))
+    if not addresses:
+        return None
+    return '{} {}'.format(hostname, ','.join(addresses))
+
+
 def parse_common_testssl(json: str, prefix: str):
     """Perform common parsing tasks on result JSONs."""
     result = {
@@ -109,21 +132,15 @@ def parse_common_testssl(json: str, prefix: str):
     return result
 
 def _remote_testssl(hostname: str, remote_host: str) -> bytes:
-    """Run testssl over ssh."""
-    return check_output([
-        'ssh',
-        remote_host,
-        hostname,
-    ])
-
+    """Run testssl over a persistent ssh connection."""
+    return get_ssh_pool(remote_host).run(hostname)
 
-def _local_testssl(hostname: str, check_mx: bool) -> bytes:
-    result_file = tempfile.mktemp()
 
-    args = [
+def _testssl_args(result_file: str) -> List[str]:
+    """The arguments of a testssl run independent of the tested target."""
+    return [
         TESTSSL_PATH,
         '-p', # enable all checks for presence of SSLx.x and TLSx.x protocols
-        '-h', # enable all checks for security-relevant HTTP headers
         '-s', # tests certain lists of cipher suites by strength
         '-f', # checks (perfect) forward secrecy settings
         '-U', # tests all (of the following) vulnerabilities (if applicable)
@@ -138,14 +155,25 @@ def _local_testssl(hostname: str, check_mx: bool) -> bytes:
         '--fast', # skip some time-consuming checks
         '--ip', 'one', # do not scan all IPs returned by the DNS A query, but only the first one
     ]
+
+
+def _target_args(hostname: str, check_mx: bool) -> List[str]:
+    """The arguments of a testssl run specifying the tested target."""
     if check_mx:
-        args.remove('-h')
-        args.extend([
+        return [
             '-t', 'smtp',  # test smtp
             '{}:25'.format(hostname),  # hostname on port 25
-        ])
-    else:
-        args.append(hostname)
+        ]
+    return [
+        '-h', # enable all checks for security-relevant HTTP headers
+        hostname,
+    ]
+
+
+def _local_testssl(hostname: str, check_mx: bool) -> bytes:
+    result_file = tempfile.mktemp()
+
+    args = _testssl_args(result_file) + _target_args(hostname, check_mx)
 
     call(args, stdout=DEVNULL, stderr=DEVNULL)
 
@@ -157,3 +185,181 @@ def _local_testssl(hostname: str, check_mx: bool) -> bytes:
 
     # store raw scan result
     return result
+
+
+def _local_testssl_batch(targets: List[Tuple[str, bool]]) -> Dict[Tuple[str, bool], bytes]:
+    """
+    Test multiple targets with a single testssl invocation in mass testing
+    mode and split the combined result into the results of the targets.
+    """
+    result_file = tempfile.mktemp()
+    target_file = tempfile.mktemp()
+    with open(target_file, 'w') as file:
+        for hostname, check_mx in targets:
+            file.write(' '.join(_target_args(hostname, check_mx)) + '\n')
+
+    args = _testssl_args(result_file) + ['--file', target_file]
+    if settings.TESTSSL_BATCH.get('parallel'):
+        args.append('--parallel')
+
+    try:
+        call(args, stdout=DEVNULL, stderr=DEVNULL)
+
+        # exception when file does not exist.
+        with open(result_file, 'rb') as file:
+            result = file.read()
+    finally:
+        os.remove(target_file)
+        if os.path.exists(result_file):
+            os.remove(result_file)
+
+    return split_testssl_batch_result(result, targets)
+
+
+def split_testssl_batch_result(result: bytes, targets: List[Tuple[str, bool]]) -> Dict[Tuple[str, bool], bytes]:
+    """
+    Split the combined json result of a testssl mass testing run into one
+    result for each target, which has the same format as the result of
+    testing the target alone. Targets without a result are left out.
+    """
+    # fix json syntax error
+    result = re.sub(r'"Invocation.*?\n', '', result.decode(), 1)
+    combined = json.loads(result)
+
+    scan_results = {}
+    for scan_result in combined.pop('scanResult', []):
+        scan_results[(scan_result.get('targetHost'), str(scan_result.get('port')))] = scan_result
+
+    results = {}
+    for hostname, check_mx in targets:
+        scan_result = scan_results.get((hostname, '25' if check_mx else '443'))
+        if scan_result is None:
+            continue
+        results[(hostname, check_mx)] = json.dumps(
+            dict(combined, scanResult=[scan_result]), indent=2).encode()
+    return results
+
+
+class TestsslBatcher:
+    """
+    Collect the targets of testssl runs started by the test suites of all
+    worker processes within a time window and test them with a single
+    testssl invocation.
+
+    The batches are coordinated in a cache shared by the workers. The first
+    test suite of a batch schedules the batch (see the run_testssl_batch
+    task), which runs after the window on its own queue with its own time
+    budget (timeout). All test suites of the batch wait for their results
+    in the cache, at most for the window and the budget of the batch. The
+    batch queue has to be consumed
+    by other worker processes than the test suites, which would otherwise
+    occupy all processes while waiting.
+    """
+
+    # added to the size of a batch when it is closed
+    CLOSED = 10 ** 6
+
+    # seconds between checks whether a batch is done
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, cache: BaseCache, window: float, max_size: int,
+                 timeout: float, schedule: Callable[[str], None],
+                 ttl: int = 3600):
+        self.cache = cache
+        self.window = window
+        self.max_size = max_size
+        self.timeout = timeout
+        self.schedule = schedule
+        self.ttl = ttl
+
+    def _key(self, batch_id: str, *parts) -> str:
+        return ':'.join(('testssl_batch', batch_id) + tuple(map(str, parts)))
+
+    def run(self, hostname: str, check_mx: bool) -> bytes:
+        """Test a target and return the raw json result."""
+        batch_id, index = self._join((hostname, check_mx))
+        deadline = time.monotonic() + self.window + self.timeout
+        while self.cache.get(self._key(batch_id, 'done')) is None:
+            if time.monotonic() > deadline:
+                raise TimeoutError(
+                    'testssl batch of {} has not been run.'.format(hostname))
+            time.sleep(self.POLL_INTERVAL)
+        error = self.cache.get(self._key(batch_id, 'error'))
+        if error is not None:
+            raise Exception('testssl batch failed: {}'.format(error))
+        result = self.cache.get(self._key(batch_id, 'result', index))
+        if result is None:
+            raise Exception('No testssl result for {}'.format(hostname))
+        return result
+
+    def _join(self, target: Tuple[str, bool]) -> Tuple[str, int]:
+        """Add a target to the open batch. Returns the batch and the index."""
+        open_key = 'testssl_batch:open'
+        while True:
+            batch_id = self.cache.get(open_key)
+            if batch_id is None:
+                batch_id = uuid.uuid4().hex
+                self.cache.set(self._key(batch_id, 'size'), 0, self.ttl)
+                if self.cache.add(open_key, batch_id, self.window):
+                    self.schedule(batch_id)
+                else:
+                    # another batch has been opened in the meantime
+                    continue
+            try:
+                index = self.cache.incr(self._key(batch_id, 'size'))
+            except ValueError:
+                # expired
+                continue
+            if index > self.max_size:
+                # full or closed
+                if self.cache.get(open_key) == batch_id:
+                    self.cache.delete(open_key)
+                continue
+            self.cache.set(
+                self._key(batch_id, 'target', index), target, self.ttl)
+            return batch_id, index
+
+    def run_batch(self, batch_id: str, test_targets=_local_testssl_batch):
+        """
+        Close a batch, test its targets and store the results. Run by the
+        run_testssl_batch task after the window of the batch.
+        """
+        try:
+            size = self.cache.incr(
+                self._key(batch_id, 'size'), self.CLOSED) - self.CLOSED
+            targets = {}
+            for index in range(1, min(size, self.max_size) + 1):
+                # a target joining right before the batch has been closed may
+                # not be stored yet
+                for _ in range(10):
+                    target = self.cache.get(self._key(batch_id, 'target', index))
+                    if target is not None:
+                        targets[index] = tuple(target)
+                        break
+                    time.sleep(0.1)
+            results = test_targets(list(set(targets.values())))
+            for index, target in targets.items():
+                if target in results:
+                    self.cache.set(
+                        self._key(batch_id, 'result', index), results[target],
+                        self.ttl)
+        except Exception as e:
+            self.cache.set(self._key(batch_id, 'error'), repr(e), self.ttl)
+            raise
+        finally:
+            self.cache.set(self._key(batch_id, 'done'), True, self.ttl)
+
+
+def _schedule_batch(batch_id: str):
+    from privacyscore.scanner.tasks import run_testssl_batch
+    run_testssl_batch.apply_async(
+        (batch_id,), countdown=settings.TESTSSL_BATCH['window'],
+        queue=settings.TESTSSL_BATCH['queue'])
+
+
+def get_batcher() -> TestsslBatcher:
+    """Get the batcher configured by TESTSSL_BATCH."""
+    options = settings.TESTSSL_BATCH
+    return TestsslBatcher(
+        caches[settings.SCAN_RESULT_CACHE], options['window'],
+        options['max_size'], options['timeout'], _schedule_batch)
@@ -0,0 +1,135 @@
+"""
+Persistent ssh connections for running testssl on remote hosts.
+
+For every remote host, a master connection is kept open using the connection
+sharing of OpenSSH (ControlMaster). The testssl runs are started as channels
+multiplexed over this connection, which avoids a full ssh handshake per test.
+The number of concurrent channels per remote host is limited, as the sshd
+of the remote host limits the number of sessions per connection
+(MaxSessions, 10 by default).
+
+Every worker process has its own master connection (the process id is part
+of its ControlPath), so the limit of channels of a process is the limit of
+sessions of its connection. Otherwise, the processes of a host would race to
+start a shared master and exceed its limit of sessions together.
+
+The master connection is started outside of the supervision of the test
+suites and health checked before it is used, so that it survives single
+test suites and is restarted when it died.
+"""
+import os
+import subprocess
+import threading
+import time
+from typing import Callable, List
+
+from django.conf import settings
+
+from privacyscore.scanner.supervisor import check_output
+
+
+class SSHPool:
+    """A persistent, multiplexed ssh connection to a single remote host."""
+
+    def __init__(self, remote_host: str, control_dir: str, max_channels: int,
+                 health_check_interval: float,
+                 runner: Callable[[List[str]], bytes] = check_output,
+                 popen: Callable[..., subprocess.Popen] = subprocess.Popen):
+        self.remote_host = remote_host
+        self.pid = os.getpid()
+        self.control_path = os.path.join(control_dir, '{}-{}.sock'.format(
+            remote_host.replace('/', '_'), self.pid))
+        self.health_check_interval = health_check_interval
+        self.runner = runner
+        self.popen = popen
+        self._channels = threading.BoundedSemaphore(max_channels)
+        self._lock = threading.Lock()
+        self._master = None
+        self._last_check = None
+        os.makedirs(control_dir, mode=0o700, exist_ok=True)
+
+    def _ssh_args(self, *args: str) -> List[str]:
+        return [
+            'ssh',
+            '-o', 'ControlPath={}'.format(self.control_path),
+            '-o', 'BatchMode=yes',
+        ] + list(args)
+
+    def is_healthy(self) -> bool:
+        """Check whether the master connection is alive."""
+        if self._master is None or self._master.poll() is not None:
+            return False
+        process = self.popen(
+            self._ssh_args('-O', 'check', self.remote_host),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return process.wait() == 0
+
+    def _start_master(self):
+        self.close()
+        self._master = self.popen(
+            self._ssh_args(
+                '-o', 'ControlMaster=yes',
+                '-o', 'ControlPersist=no',
+                '-o', 'ServerAliveInterval=30',
+                '-N', self.remote_host),
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, start_new_session=True)
+
+        # wait for the control socket to become usable
+        for _ in range(50):
+            if self.is_healthy():
+                return
+            if self._master.poll() is not None:
+                break
+            time.sleep(0.2)
+        raise ConnectionError(
+            'Could not connect to {}.'.format(self.remote_host))
+
+    def _ensure_master(self):
+        with self._lock:
+            now = time.monotonic()
+            if (self._master is not None and self._master.poll() is None and
+                    self._last_check is not None and
+                    now - self._last_check < self.health_check_interval):
+                return
+            if not self.is_healthy():
+                self._start_master()
+            self._last_check = now
+
+    def run(self, *command: str) -> bytes:
+        """
+        Run a command on the remote host over the master connection and
+        return its output.
+        """
+        with self._channels:
+            self._ensure_master()
+            return self.runner(self._ssh_args(
+                '-o', 'ControlMaster=no', self.remote_host) + list(command))
+
+    def close(self):
+        """Close the master connection."""
+        if self._master is not None:
+            if self._master.poll() is None:
+                self._master.terminate()
+                try:
+                    self._master.wait(5)
+                except subprocess.TimeoutExpired:
+                    self._master.kill()
+                    self._master.wait()
+            self._master = None
+        self._last_check = None
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_ssh_pool(remote_host: str) -> SSHPool:
+    """Get the connection pool of this process for a remote host."""
+    with _pools_lock:
+        pool = _pools.get(remote_host)
+        if pool is None or pool.pid != os.getpid():
+            # pools inherited from the parent process belong to the parent
+            pool = _pools[remote_host] = SSHPool(
+                remote_host, **settings.TESTSSL_SSH_POOL)
+        return pool
@@ -0,0 +1,201 @@
+import json
+import os
+import tempfile
+import threading
+import time
+
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import TestCase
+
+from privacyscore.test_suites.testssl.common import TestsslBatcher, \
+    split_testssl_batch_result
+from privacyscore.test_suites.testssl.ssh import SSHPool
+
+
+COMBINED_RESULT = b'''{
+    "Invocation"  : "testssl.sh --file targets",
+    "at"          : "scanhost:/usr/bin/openssl",
+    "version"     : "3.0",
+    "scanResult"  : [
+        {"targetHost": "a.example", "ip": "192.0.2.1", "port": "443", "pfs": []},
+        {"targetHost": "mx.example", "ip": "192.0.2.2", "port": "25", "pfs": []}
+    ]
+}'''
+
+
+class SplitTestsslBatchResultTestCase(TestCase):
+    def test_split(self):
+        results = split_testssl_batch_result(COMBINED_RESULT, [
+            ('a.example', False), ('mx.example', True), ('b.example', False)])
+        self.assertEqual(
+            set(results), {('a.example', False), ('mx.example', True)})
+
+        result = json.loads(results[('mx.example', True)].decode())
+        self.assertEqual(result['version'], '3.0')
+        self.assertEqual(result['scanResult'], [{
+            'targetHost': 'mx.example', 'ip': '192.0.2.2', 'port': '25',
+            'pfs': []}])
+
+    def test_port_mismatch(self):
+        self.assertEqual(split_testssl_batch_result(
+            COMBINED_RESULT, [('a.example', True)]), {})
+
+
+class TestsslBatcherTestCase(TestCase):
+    def setUp(self):
+        self.cache = LocMemCache('testssl_batch', {})
+        self.batches = []
+
+    def tearDown(self):
+        self.cache.clear()
+
+    def _batcher(self, window, max_size, test_targets):
+        def schedule(batch_id):
+            # the batch task of another worker
+            batcher = TestsslBatcher(self.cache, window, max_size, 5, None)
+            timer = threading.Timer(
+                window, self._run_batch, (batcher, batch_id, test_targets))
+            timer.daemon = True
+            timer.start()
+
+        return TestsslBatcher(self.cache, window, max_size, 5, schedule)
+
+    def _run_batch(self, batcher, batch_id, test_targets):
+        try:
+            batcher.run_batch(batch_id, test_targets)
+        except Exception:
+            pass
+
+    def _run_concurrently(self, window, max_size, test_targets, targets):
+        results = {}
+
+        def run(target):
+            # every test suite has its own batcher, as in its own process
+            batcher = self._batcher(window, max_size, test_targets)
+            try:
+                results[target] = batcher.run(*target)
+            except Exception as e:
+                results[target] = e
+
+        threads = [threading.Thread(target=run, args=(t,)) for t in targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        return results
+
+    def test_batching(self):
+        def test_targets(targets):
+            self.batches.append(list(targets))
+            return {t: t[0].encode() for t in targets if t[0] != 'fail'}
+
+        targets = [
+            ('a.example', False), ('b.example', False), ('mx.example', True),
+            ('fail', False)]
+        results = self._run_concurrently(0.5, 3, test_targets, targets)
+
+        # the first batch is full with three targets
+        self.assertEqual(
+            sorted(len(batch) for batch in self.batches), [1, 3])
+        self.assertEqual(results[('a.example', False)], b'a.example')
+        self.assertEqual(results[('mx.example', True)], b'mx.example')
+        self.assertIsInstance(results[('fail', False)], Exception)
+
+    def test_error(self):
+        def test_targets(targets):
+            raise RuntimeError('testssl failed')
+
+        results = self._run_concurrently(
+            0.1, 10, test_targets, [('a.example', False), ('b.example', False)])
+        for result in results.values():
+            self.assertIsInstance(result, Exception)
+            self.assertIn('testssl failed', str(result))
+
+    def test_not_run(self):
+        batcher = TestsslBatcher(self.cache, 0.1, 10, 0.2, lambda _id: None)
+        with self.assertRaises(TimeoutError):
+            batcher.run('a.example', False)
+
+
+class FakeProcess:
+    def __init__(self, returncode=None):
+        self.returncode = returncode
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+    def terminate(self):
+        self.returncode = -15
+
+
+class SSHPoolTestCase(TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.masters = []
+        self.commands = []
+        self.running = 0
+        self.max_running = 0
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def popen(self, args, **kwargs):
+        if '-O' in args:
+            alive = self.masters and self.masters[-1].returncode is None
+            return FakeProcess(0 if alive else 255)
+        self.masters.append(FakeProcess())
+        return self.masters[-1]
+
+    def runner(self, args):
+        with self.lock:
+            self.commands.append(args)
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(0.05)
+        with self.lock:
+            self.running -= 1
+        return args[-1].encode()
+
+    def _pool(self, **kwargs):
+        options = {'max_channels': 2, 'health_check_interval': 60}
+        options.update(kwargs)
+        return SSHPool(
+            'scanner.example', self.temp_dir.name, runner=self.runner,
+            popen=self.popen, **options)
+
+    def test_shared_master(self):
+        pool = self._pool()
+        self.assertEqual(pool.run('a.example'), b'a.example')
+        self.assertEqual(pool.run('b.example'), b'b.example')
+        self.assertEqual(len(self.masters), 1)
+        for command in self.commands:
+            self.assertIn('ControlPath={}'.format(pool.control_path), command)
+            self.assertIn('ControlMaster=no', command)
+
+    def test_control_path_per_process(self):
+        pool = self._pool()
+        self.assertIn(str(os.getpid()), os.path.basename(pool.control_path))
+
+    def test_channel_limit(self):
+        pool = self._pool()
+        threads = [
+            threading.Thread(target=pool.run, args=('{}.example'.format(i),))
+            for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(len(self.commands), 6)
+        self.assertEqual(self.max_running, 2)
+        self.assertEqual(len(self.masters), 1)
+
+    def test_restart_dead_master(self):
+        pool = self._pool(health_check_interval=0)
+        pool.run('a.example')
+        self.masters[0].returncode = 255
+        pool.run('b.example')
+        self.assertEqual(len(self.masters), 2)
@@ -11,22 +11,40 @@ from urllib.parse import urlparse
 from django.conf import settings
 from privacyscore.utils import get_list_item_by_dict_entry
 
-from .testssl.common import run_testssl, parse_common_testssl
+from .testssl.common import run_testssl, parse_common_testssl, \
+    testssl_fingerprint
 
 test_name = 'testssl_https'
 test_dependencies = [
     'network',
 ]
+test_input_keys = [
+    'final_https_url', 'same_content_via_https', 'final_url_is_https',
+]
+test_resource_class = 'cpu'
 
 
-def test_site(url: str, previous_results: dict) -> Dict[str, Dict[str, Union[str, bytes]]]:
-    # Commented out for now because it gives bad results sometimes
+def _get_hostname(url: str, previous_results: dict) -> Union[str, None]:
+    """Get the hostname to test or None if the site does not use https."""
     scan_url = previous_results.get('final_https_url')
     if scan_url and (previous_results.get('same_content_via_https') or previous_results.get('final_url_is_https')):
-        hostname = urlparse(scan_url).hostname
+        return urlparse(scan_url).hostname
     elif url.startswith('https'):
-        hostname = urlparse(url).hostname
-    else:
+        return urlparse(url).hostname
+    return None
+
+
+def input_fingerprint(url: str, previous_results: dict) -> Union[str, None]:
+    hostname = _get_hostname(url, previous_results)
+    if hostname is None:
+        return None
+    return testssl_fingerprint(hostname)
+
+
+def test_site(url: str, previous_results: dict) -> Dict[str, Dict[str, Union[str, bytes]]]:
+    # Commented out for now because it gives bad results sometimes
+    hostname = _get_hostname(url, previous_results)
+    if hostname is None:
         return {
             'jsonresult': {
                 'mime_type': 'application/json',
@@ -7,17 +7,35 @@ import re
 from typing import Dict, Union
 from urllib.parse import urlparse
 
-from .testssl.common import run_testssl, parse_common_testssl
+from .testssl.common import run_testssl, parse_common_testssl, \
+    testssl_fingerprint
 
 test_name = 'testssl_mx'
 test_dependencies = ['network']
+test_input_keys = ['mx_records']
+test_resource_class = 'cpu'
 
 
-def test_site(url: str, previous_results: dict, remote_host: str = None) -> Dict[str, Dict[str, Union[str, bytes]]]:
-    # test first mx
+def _get_hostname(previous_results: dict) -> Union[str, None]:
+    """Get the hostname of the first mx."""
     try:
-        hostname = previous_results['mx_records'][0][1]
+        return previous_results['mx_records'][0][1]
     except (KeyError, IndexError):
+        return None
+
+
+def input_fingerprint(url: str, previous_results: dict, remote_host: str = None) -> Union[str, None]:
+    # sites sharing their mail server share the results
+    hostname = _get_hostname(previous_results)
+    if hostname is None:
+        return None
+    return testssl_fingerprint(hostname)
+
+
+def test_site(url: str, previous_results: dict, remote_host: str = None) -> Dict[str, Dict[str, Union[str, bytes]]]:
+    # test first mx
+    hostname = _get_hostname(previous_results)
+    if hostname is None:
         return {
             'jsonresult': {
                 'mime_type': 'application/json',
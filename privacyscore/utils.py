@@ -3,12 +3,8 @@ Utility functions that are shared across different modules.
 """
 import errno
 import fcntl
-import os
 from pathlib import Path
 
-from pwd import getpwuid
-from typing import List, Tuple
-
 from urllib.parse import urlparse
 from url_normalize import url_normalize
 
@@ -42,17 +38,15 @@ def get_list_item_by_dict_entry(search: list, key: str, value: str):
         s for s in search if s[key] == value), None)
 
 
-def get_processes_of_user(user: str) -> List[Tuple[int, str]]:
-    """Get a tuple (pid, cmdline) for all processes of user."""
-    return [
-        (int(pid),
-         open('/proc/{}/cmdline'.format(pid), 'r').read())
-        for pid in os.listdir('/proc')
-        if (pid.isdigit() and
-            getpwuid(os.stat('/proc/{}'.format(pid)).st_uid).pw_name == user)]
+class get_worker_id:
+    """
+    Get the lowest free worker slot of this host while in the context.
 
+    Every slot is held by a flock on its own open file, so different
+    processes as well as different threads or browsers of the same process
+    get distinct slots.
+    """
 
-class get_worker_id:
     def __init__(self, ident='worker-ids'):
         self.ident = ident
         self._worker_lock_dir = Path('/dev/shm/') / ident
@@ -64,14 +58,15 @@ class get_worker_id:
         while True:
             self._lock_file = (self._worker_lock_dir / str(worker_id)).open('w')
             try:
-                fcntl.lockf(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
                 return worker_id
             except OSError as e:
+                self._lock_file.close()
                 if e.errno not in (errno.EAGAIN, errno.EACCES):
                     raise
             worker_id += 1
 
     def __exit__(self, exc_type, exc_value, traceback):
         if self._lock_file:
-            fcntl.lockf(self._lock_file.fileno(), fcntl.LOCK_UN)
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
             self._lock_file.close()